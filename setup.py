@@ -72,6 +72,7 @@ setup(
         "console_scripts": [
             "generate_roi_timeseries=vegindex.generate_roi_timeseries:main",
             "update_roi_timeseries=vegindex.update_roi_timeseries:main",
+            "generate_site_roi_timeseries=vegindex.generate_site_roi_timeseries:main",
             "generate_roi_ir_timeseries=vegindex.generate_roi_ir_timeseries:main",
             "update_roi_ir_timeseries=vegindex.update_roi_ir_timeseries:main",
             "generate_summary_timeseries=vegindex.generate_summary_timeseries:main",
@@ -80,6 +81,7 @@ setup(
             "generate_ndvi_summary_timeseries=vegindex.generate_ndvi_summary_timeseries:main",
             "update_ndvi_summary_timeseries=vegindex.update_ndvi_summary_timeseries:main",
             "plot_roistats=vegindex.plot_roistats:main",
+            "vegindex-batch=vegindex.batch:main",
         ]
     },
 )
@@ -15,3 +15,19 @@ if os.environ.get("PHENOCAM_ARCHIVE_DIR"):
 # local site information file
 if os.environ.get("PHENOCAM_SITE_INFO"):
     config.site_info_file = os.environ.get("PHENOCAM_SITE_INFO")
+
+# directory for site image index files
+if os.environ.get("PHENOCAM_IMAGE_INDEX_DIR"):
+    config.image_index_dir = os.environ.get("PHENOCAM_IMAGE_INDEX_DIR")
+
+# directory for cached site info
+if os.environ.get("PHENOCAM_SITE_INFO_CACHE_DIR") is not None:
+    config.site_info_cache_dir = os.environ.get("PHENOCAM_SITE_INFO_CACHE_DIR")
+
+# don't use the network
+if os.environ.get("PHENOCAM_OFFLINE"):
+    config.offline = True
+
+# write binary sidecar files with the timeseries CSV files
+if os.environ.get("PHENOCAM_WRITE_SIDECAR"):
+    config.write_sidecar = True
@@ -0,0 +1,548 @@
+# -*- coding: utf-8 -*-
+
+"""
+Command line script to run the timeseries scripts for many sites and
+ROIs in a few long-lived processes.
+
+The jobs are read from a manifest file with one line for each site
+and ROI:
+
+    # site roiname [stage ...]
+    harvard DB_0001
+    bartlett DB_1000 roistats gcc_1day gcc_3day
+
+If no stages are listed all stages are run.  Each job (site, ROI and
+stage) runs the main() function of the generate script for the stage
+(or the update script if there is one and the output file already
+exists) in a worker process.  A job starts once the jobs for the
+stages it depends on for the same site and ROI have finished.  If a
+job fails the jobs depending on it are skipped, and a summary of all
+jobs is printed at the end.
+
+The fingerprints of the inputs of each stage (the ROI list, ROI
+masks, ROI config file, site image directories and the output files
+of the stages it depends on) are recorded in a state file for each
+site and ROI when the stage runs.  Stages whose inputs and output
+are unchanged since they last ran are not run again.
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import argparse
+import importlib
+import io
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from collections import OrderedDict
+from contextlib import redirect_stderr
+from contextlib import redirect_stdout
+
+# use this because numpy/openblas is automatically multi-threaded.
+os.environ["OMP_NUM_THREADS"] = "1"
+os.environ["MKL_NUM_THREADS"] = "1"
+
+from . import config
+from .fingerprint import PipelineState
+from .vegindex import get_roi_list
+
+# stage name -> (generate script, update script, output file, stages
+# it depends on, extra script arguments, other inputs).  The other
+# inputs can be the ROI list ("roilist"), the ROI mask images
+# ("masks"), the ROI config file ("cfg") and the site image
+# directories ("images").
+STAGES = OrderedDict(
+    [
+        (
+            "roistats",
+            (
+                "generate_roi_timeseries",
+                "update_roi_timeseries",
+                "{0}_{1}_roistats.csv",
+                [],
+                [],
+                ["roilist", "masks", "cfg", "images"],
+            ),
+        ),
+        (
+            "ir_roistats",
+            (
+                "generate_roi_ir_timeseries",
+                "update_roi_ir_timeseries",
+                "{0}_{1}_IR_roistats.csv",
+                ["roistats"],
+                [],
+                ["roilist", "masks", "cfg", "images"],
+            ),
+        ),
+        (
+            "ndvi",
+            (
+                "generate_ndvi_timeseries",
+                None,
+                "{0}_{1}_NDVI_roistats.csv",
+                ["roistats", "ir_roistats"],
+                [],
+                [],
+            ),
+        ),
+        (
+            "gcc_1day",
+            (
+                "generate_summary_timeseries",
+                "update_summary_timeseries",
+                "{0}_{1}_1day.csv",
+                ["roistats"],
+                ["-p", "1"],
+                ["cfg"],
+            ),
+        ),
+        (
+            "gcc_3day",
+            (
+                "generate_summary_timeseries",
+                "update_summary_timeseries",
+                "{0}_{1}_3day.csv",
+                ["roistats"],
+                ["-p", "3"],
+                ["cfg"],
+            ),
+        ),
+        (
+            "ndvi_1day",
+            (
+                "generate_ndvi_summary_timeseries",
+                None,
+                "{0}_{1}_ndvi_1day.csv",
+                ["ndvi"],
+                ["-p", "1"],
+                ["cfg"],
+            ),
+        ),
+        (
+            "ndvi_3day",
+            (
+                "generate_ndvi_summary_timeseries",
+                None,
+                "{0}_{1}_ndvi_3day.csv",
+                ["ndvi"],
+                ["-p", "3"],
+                ["cfg"],
+            ),
+        ),
+        (
+            "plot",
+            (
+                "plot_roistats",
+                None,
+                "{0}_{1}_roistats.pdf",
+                ["roistats", "gcc_3day"],
+                [],
+                [],
+            ),
+        ),
+    ]
+)
+
+
+def read_manifest(manifest_path):
+    """
+    Read a manifest file and return a list of (site, roiname, stage)
+    jobs in the order they're listed.
+    """
+    jobs = []
+    with open(manifest_path, "r") as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.split("#")[0].strip()
+            if not line:
+                continue
+
+            fields = line.split()
+            if len(fields) < 2:
+                errmsg = "Manifest line {0}: expected site and ROI name".format(lineno)
+                raise ValueError(errmsg)
+
+            sitename, roiname = fields[0:2]
+            stages = fields[2:] or list(STAGES)
+            for stage in stages:
+                if stage not in STAGES:
+                    errmsg = "Manifest line {0}: unknown stage {1}".format(
+                        lineno, stage
+                    )
+                    raise ValueError(errmsg)
+                job = (sitename, roiname, stage)
+                if job not in jobs:
+                    jobs.append(job)
+
+    return jobs
+
+
+def job_dependencies(jobs):
+    """
+    return a dictionary of the jobs each job depends on.  Only jobs
+    in the list are included, stages which aren't listed for a site
+    and ROI are assumed to be up to date.
+    """
+    jobset = set(jobs)
+    deps = {}
+    for job in jobs:
+        sitename, roiname, stage = job
+        deps[job] = [
+            (sitename, roiname, dep_stage)
+            for dep_stage in STAGES[stage][3]
+            if (sitename, roiname, dep_stage) in jobset
+        ]
+
+    return deps
+
+
+def job_output(job):
+    """
+    return the path of the output file of a job
+    """
+    sitename, roiname, stage = job
+    outfile = STAGES[stage][2].format(sitename, roiname)
+    return os.path.join(config.archive_dir, sitename, "ROI", outfile)
+
+
+def job_inputs(job):
+    """
+    return the list of input files for a job and whether the site
+    images are an input
+    """
+    sitename, roiname, stage = job
+    deps, extra_args, inputs = STAGES[stage][3:]
+    roidir = os.path.join(config.archive_dir, sitename, "ROI")
+
+    paths = [job_output((sitename, roiname, dep_stage)) for dep_stage in deps]
+    if "roilist" in inputs:
+        roifile = "{0}_{1}_roi.csv".format(sitename, roiname)
+        paths.append(os.path.join(roidir, roifile))
+    if "masks" in inputs:
+        # a missing or bad ROI list will fail the job anyway
+        try:
+            roi_list = get_roi_list(sitename, roiname)
+        except (IOError, OSError, ValueError):
+            roi_list = None
+        if roi_list is not None:
+            for roimask in roi_list.masks:
+                mask_path = os.path.join(roidir, roimask["maskfile"])
+                if mask_path not in paths:
+                    paths.append(mask_path)
+    if "cfg" in inputs:
+        config_file = "{0}_{1}.cfg".format(sitename, roiname)
+        paths.append(os.path.join(roidir, config_file))
+
+    return paths, "images" in inputs
+
+
+def job_command(job, dryrun=False, regenerate=False):
+    """
+    return the script and argument list for a job.  The update script
+    is used if there is one and the output file exists.
+    """
+    sitename, roiname, stage = job
+    generate_script, update_script = STAGES[stage][0:2]
+    extra_args = STAGES[stage][4]
+
+    script = generate_script
+    if update_script is not None and not regenerate:
+        if os.path.exists(job_output(job)):
+            script = update_script
+
+    argv = list(extra_args)
+    if dryrun:
+        argv.append("--dry-run")
+    argv += [sitename, roiname]
+
+    return script, argv
+
+
+def run_job(job, dryrun=False, regenerate=False):
+    """
+    Run a job in this process, returning a dictionary with the job,
+    the script run, the status ("ok" or "failed"), the run time and
+    the script output.  Errors (including sys.exit() with a non-zero
+    status) are caught so they only fail this job.
+    """
+    t0 = time.time()
+    output = io.StringIO()
+    status = "ok"
+    script = None
+    with redirect_stdout(output), redirect_stderr(output):
+        try:
+            script, argv = job_command(job, dryrun=dryrun, regenerate=regenerate)
+            module = importlib.import_module("vegindex." + script)
+
+            # the scripts copy the archive directory when they are
+            # first imported, so make sure they use the current one
+            if hasattr(module, "archive_dir"):
+                module.archive_dir = config.archive_dir
+            module.main(argv)
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                status = "failed"
+        except Exception:
+            traceback.print_exc()
+            status = "failed"
+
+    return {
+        "job": job,
+        "script": script,
+        "status": status,
+        "time": time.time() - t0,
+        "output": output.getvalue(),
+    }
+
+
+def run_jobs(
+    jobs, nworkers=1, dryrun=False, regenerate=False, force=False, callback=None
+):
+    """
+    Run a list of jobs, each one once the jobs it depends on have
+    finished, using a pool of nworkers processes (or this process if
+    nworkers is 1).  Jobs depending on a job which failed are skipped.
+    Jobs whose inputs and output haven't changed since they last ran
+    are not run (status "unchanged") unless force or regenerate is
+    set.  callback (if given) is called with the result of each job
+    as it finishes.  Returns a dictionary of the results for each job.
+
+    The pipeline state files are only read and written by this
+    process so jobs for the same site and ROI can finish at the same
+    time.
+    """
+    deps = job_dependencies(jobs)
+    results = OrderedDict((job, None) for job in jobs)
+    waiting = list(jobs)
+    running = {}
+    states = {}
+    fingerprints = {}
+
+    def get_state(job):
+        sitename, roiname, stage = job
+        if (sitename, roiname) not in states:
+            states[(sitename, roiname)] = PipelineState(sitename, roiname)
+        return states[(sitename, roiname)]
+
+    pool = None
+    if nworkers > 1:
+        pool = multiprocessing.Pool(processes=nworkers)
+
+    def finish(result):
+        job = result["job"]
+        results[job] = result
+
+        # record the inputs the job ran with
+        if result["status"] == "ok" and not dryrun:
+            state = get_state(job)
+            state.record(job[2], fingerprints.pop(job), job_output(job))
+            state.write()
+
+        if callback is not None:
+            callback(result)
+
+    try:
+        while waiting or running:
+
+            # start (or skip) the jobs which aren't waiting on others
+            for job in list(waiting):
+                dep_results = [results[dep] for dep in deps[job]]
+                if any(r is None for r in dep_results):
+                    continue
+                waiting.remove(job)
+                if any(r["status"] not in ("ok", "unchanged") for r in dep_results):
+                    finish(
+                        {
+                            "job": job,
+                            "script": None,
+                            "status": "skipped",
+                            "time": 0.0,
+                            "output": "",
+                        }
+                    )
+                    continue
+
+                # fingerprint the inputs before the job runs
+                paths, images = job_inputs(job)
+                state = get_state(job)
+                fingerprints[job] = state.input_fingerprints(job[2], paths, images)
+                if not (force or regenerate) and state.unchanged(
+                    job[2], fingerprints[job], job_output(job)
+                ):
+                    del fingerprints[job]
+                    finish(
+                        {
+                            "job": job,
+                            "script": None,
+                            "status": "unchanged",
+                            "time": 0.0,
+                            "output": "",
+                        }
+                    )
+                elif pool is None:
+                    finish(run_job(job, dryrun=dryrun, regenerate=regenerate))
+                else:
+                    running[job] = pool.apply_async(
+                        run_job, (job,), {"dryrun": dryrun, "regenerate": regenerate}
+                    )
+
+            # collect the jobs which have finished
+            if running:
+                done = [job for job, result in running.items() if result.ready()]
+                if not done:
+                    time.sleep(0.05)
+                for job in done:
+                    finish(running.pop(job).get())
+
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return results
+
+
+def format_report(results, elapsed):
+    """
+    return the summary report for the results of run_jobs()
+    """
+    counts = OrderedDict(
+        (status, 0) for status in ["ok", "unchanged", "failed", "skipped"]
+    )
+    for result in results.values():
+        counts[result["status"]] += 1
+
+    lines = ["", "Batch summary:", "=============="]
+    for result in results.values():
+        sitename, roiname, stage = result["job"]
+        lines.append(
+            "{0:8s} {1:>8.1f}s  {2} {3} {4} ({5})".format(
+                result["status"],
+                result["time"],
+                sitename,
+                roiname,
+                stage,
+                result["script"],
+            )
+        )
+
+    lines.append("")
+    lines.append(
+        "Jobs: {0}  OK: {1}  Failed: {2}  Skipped: {3}  Unchanged: {4}  "
+        "Time: {5:.1f}s".format(
+            len(results),
+            counts["ok"],
+            counts["failed"],
+            counts["skipped"],
+            counts["unchanged"],
+            elapsed,
+        )
+    )
+
+    # show the end of the output for failed jobs
+    for result in results.values():
+        if result["status"] != "failed":
+            continue
+        sitename, roiname, stage = result["job"]
+        lines.append("")
+        lines.append("{0} {1} {2} failed:".format(sitename, roiname, stage))
+        for line in result["output"].rstrip().split("\n")[-10:]:
+            lines.append("    " + line)
+
+    return "\n".join(lines)
+
+
+def main(argv=None):
+
+    # set up command line argument processing
+    parser = argparse.ArgumentParser(
+        description="Run the timeseries scripts for the jobs in a manifest"
+    )
+
+    # options
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        help="print the output of each job",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "-n",
+        "--dry-run",
+        help="Process data but don't save results",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "-g",
+        "--regenerate",
+        help="always run the generate scripts (rather than update)",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "-f",
+        "--force",
+        help="run jobs even if their inputs are unchanged",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        help="number of worker processes to use (default=1)",
+        type=int,
+        default=1,
+    )
+
+    # positional arguments
+    parser.add_argument("manifest", help="file listing site, roiname and stages")
+
+    # get args
+    args = parser.parse_args(argv)
+    verbose = args.verbose
+    nworkers = args.workers
+
+    if nworkers < 1:
+        sys.stderr.write("Number of workers must be at least 1\n")
+        sys.exit(1)
+
+    try:
+        jobs = read_manifest(args.manifest)
+    except (IOError, ValueError) as e:
+        sys.stderr.write("Unable to read manifest: {0}\n".format(e))
+        sys.exit(1)
+
+    if verbose:
+        print("manifest: {0}".format(args.manifest))
+        print("jobs: {0}".format(len(jobs)))
+        print("workers: {0}".format(nworkers))
+
+    def print_result(result):
+        sitename, roiname, stage = result["job"]
+        print("{0} {1} {2}: {3}".format(sitename, roiname, stage, result["status"]))
+        if verbose and result["output"]:
+            print(result["output"].rstrip())
+        sys.stdout.flush()
+
+    t0 = time.time()
+    results = run_jobs(
+        jobs,
+        nworkers=nworkers,
+        dryrun=args.dry_run,
+        regenerate=args.regenerate,
+        force=args.force,
+        callback=print_result,
+    )
+    print(format_report(results, time.time() - t0))
+
+    if any(result["status"] not in ("ok", "unchanged") for result in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,542 @@
+# -*- coding: utf-8 -*-
+
+"""
+Columnar storage for timeseries rows.
+
+Timeseries rows have traditionally been kept as a list of
+dictionaries.  For long timeseries this uses a lot of memory and
+every operation is a python loop.  A ColumnStore keeps each field in
+a typed numpy array instead:
+
+  float    : float64 with NaN for no-data (and NAN_VALUE for NaN
+             values which aren't no-data, see below)
+  int      : int64 with ND_INT_VALUE (-9999) for no-data
+  str      : object array of strings
+  datetime : datetime64[s] with NaT for no-data
+
+and a RowsView gives list-like access to the rows as dictionaries
+(built on the fly) for existing code.
+
+Some float values are NaN without being no-data, e.g. the
+correlation of a band with no variation.  They are written to the
+CSV files as "nan" rather than "NA" so they are stored as NAN_VALUE,
+a NaN with a different bit pattern from np.nan.  Both are NaN for
+numpy (np.isnan(), np.nanmean(), etc.) and is_nodata() tells them
+apart.
+"""
+
+import numpy as np
+
+from . import config
+
+ND_FLOAT = config.ND_FLOAT
+ND_INT = config.ND_INT
+
+FLOAT = "float"
+INT = "int"
+STR = "str"
+DATETIME = "datetime"
+
+# value stored for no-data in integer columns
+ND_INT_VALUE = -9999
+
+# value stored for NaN values which aren't no-data in float columns
+NAN_BITS = 0x7FF8000000000001
+NAN_VALUE = float(np.array([NAN_BITS], dtype=np.uint64).view(np.float64)[0])
+
+_DTYPES = {
+    FLOAT: np.float64,
+    INT: np.int64,
+    STR: object,
+    DATETIME: "datetime64[s]",
+}
+
+# number of rows converted to dictionaries at a time when iterating
+ROW_CHUNK = 4096
+
+
+def empty_column(kind, n):
+    """
+    return a column array of length n filled with no-data values
+    """
+    if kind == FLOAT:
+        return np.full(n, np.nan)
+    elif kind == INT:
+        return np.full(n, ND_INT_VALUE, dtype=np.int64)
+    elif kind == DATETIME:
+        return np.full(n, np.datetime64("NaT"), dtype="datetime64[s]")
+    else:
+        return np.full(n, None, dtype=object)
+
+
+def is_nodata(values):
+    """
+    return a boolean array which is True for the no-data values (NaN
+    other than NAN_VALUE) in a float array
+    """
+    values = np.asarray(values, dtype=np.float64)
+    return np.isnan(values) & (values.view(np.uint64) != NAN_BITS)
+
+
+def _to_float(value):
+    """
+    convert a row value to the value stored in a float column
+    """
+    if value is None or value == ND_FLOAT:
+        return np.nan
+    value = float(value)
+    if value != value:
+        return NAN_VALUE
+    return value
+
+
+def _to_storage(kind, value):
+    """
+    convert a row value to the value stored in a column
+    """
+    if kind == FLOAT:
+        return _to_float(value)
+    elif kind == INT:
+        if value is None or value == ND_INT:
+            return ND_INT_VALUE
+        return int(value)
+    elif kind == DATETIME:
+        if value is None:
+            return np.datetime64("NaT")
+        return np.datetime64(value, "s")
+    else:
+        return value
+
+
+def _to_column(kind, values):
+    """
+    convert a list of row values to a column array
+    """
+    if kind == FLOAT:
+        values = [_to_float(v) for v in values]
+    elif kind == INT:
+        values = [ND_INT_VALUE if v is None or v == ND_INT else int(v) for v in values]
+    elif kind == DATETIME:
+        values = [np.datetime64("NaT") if v is None else v for v in values]
+
+    column = np.empty(len(values), dtype=_DTYPES[kind])
+    column[:] = values
+    return column
+
+
+def column_to_list(kind, values):
+    """
+    convert (part of) a column array to a list of row values with
+    no-data values replaced by config.ND_FLOAT/config.ND_INT
+    """
+    if kind == FLOAT:
+        nd = is_nodata(values).tolist()
+        return [ND_FLOAT if n else v for v, n in zip(values.tolist(), nd)]
+    elif kind == INT:
+        return [ND_INT if v == ND_INT_VALUE else v for v in values.tolist()]
+    else:
+        return values.tolist()
+
+
+def datetime_strings(dts):
+    """
+    return lists of date ("YYYY-MM-DD"), time ("HH:MM:SS") and
+    day-of-year strings for an array of datetime64 values
+    """
+    dtstrs = np.datetime_as_string(dts, unit="s")
+    days = dts.astype("datetime64[D]")
+    doys = (days - dts.astype("datetime64[Y]")).astype(np.int64) + 1
+
+    dates = [s[0:10] for s in dtstrs.tolist()]
+    times = [s[11:19] for s in dtstrs.tolist()]
+    doys = [str(doy) for doy in doys.tolist()]
+
+    return dates, times, doys
+
+
+def tod_seconds(tod):
+    """
+    return the seconds since midnight for a datetime.time or a
+    "HH:MM:SS" string
+    """
+    if isinstance(tod, str):
+        (hr, mn, sec) = tod.split(":")
+        return int(hr) * 3600 + int(mn) * 60 + float(sec)
+
+    return tod.hour * 3600 + tod.minute * 60 + tod.second + tod.microsecond / 1e6
+
+
+def select_index(dts, brt, solar_elev, tod_min, tod_max, sunelev_min, brt_min, brt_max):
+    """
+    return the indices (in datetime order) of the rows which meet
+    the image selection criteria for time of day, brightness and
+    solar elevation along with a dictionary of the number of rows
+    passing each criterion.  Rows with no-data (NaN) brightness or
+    solar elevation are never selected.
+    """
+    days = dts.astype("datetime64[D]")
+    tod = (dts - days).astype(np.int64)
+
+    tod_mask = (tod >= tod_seconds(tod_min)) & (tod <= tod_seconds(tod_max))
+    brt_mask = (brt >= brt_min) & (brt <= brt_max)
+    sunelev_mask = solar_elev >= sunelev_min
+    mask = tod_mask & brt_mask & sunelev_mask
+
+    index = np.flatnonzero(mask)
+    index = index[np.argsort(dts[index], kind="stable")]
+
+    counts = {
+        "total": len(dts),
+        "tod": int(np.count_nonzero(tod_mask)),
+        "brightness": int(np.count_nonzero(brt_mask)),
+        "sunelev": int(np.count_nonzero(sunelev_mask)),
+        "selected": len(index),
+    }
+
+    return index, counts
+
+
+class ColumnStore(object):
+    """
+    Class holding timeseries rows as typed column arrays.  The spec
+    is a list of (name, kind) pairs where kind is one of FLOAT, INT,
+    STR or DATETIME.  Arrays are over-allocated so rows can be
+    appended efficiently.
+
+    A key column can be set with set_key() so rows can be found by
+    key value with find() using a hash index, and an order column
+    can be set with set_order() so rows can be found by a range of
+    values with range_index().  Both indexes are kept consistent as
+    rows are appended, replaced, deleted or sorted.
+
+    Columns can be read-only arrays (e.g. memory mapped from a file,
+    see csvreader.read_csv()).  They are copied the first time rows
+    are changed.
+    """
+
+    def __init__(self, spec, nrows=0):
+        """
+        create an empty ColumnStore (or one with nrows no-data rows)
+        """
+        self.spec = list(spec)
+        self.kinds = dict(self.spec)
+        self._n = nrows
+        self._cols = {}
+        for name, kind in self.spec:
+            self._cols[name] = empty_column(kind, nrows)
+
+        # key column and hash index of key value -> first row with
+        # that value (built when first needed)
+        self.key = None
+        self._key_index = None
+
+        # order column, whether the rows are known to be sorted by
+        # it (None if not known) and a cached argsort if they're not
+        self.order_by = None
+        self._ordered = None
+        self._order = None
+
+    def __len__(self):
+        return self._n
+
+    @classmethod
+    def from_rows(cls, spec, rows):
+        """
+        create a ColumnStore from an iterable of row dictionaries
+        """
+        rows = list(rows)
+        columns = {}
+        for name, kind in spec:
+            columns[name] = _to_column(kind, [row.get(name) for row in rows])
+
+        return cls.from_columns(spec, columns)
+
+    @classmethod
+    def from_columns(cls, spec, columns):
+        """
+        create a ColumnStore from a dictionary of column arrays (all
+        of the same length).  Missing columns are filled with
+        no-data values.
+        """
+        nrows = 0
+        for name, kind in spec:
+            if name in columns:
+                nrows = len(columns[name])
+                break
+
+        # arrays of the right type are used without copying them
+        store = cls(spec)
+        store._n = nrows
+        for name, kind in store.spec:
+            if name in columns:
+                store._cols[name] = np.asarray(columns[name], dtype=_DTYPES[kind])
+            else:
+                store._cols[name] = empty_column(kind, nrows)
+
+        return store
+
+    def column(self, name):
+        """
+        return the array for a column (a view, not a copy)
+        """
+        return self._cols[name][0 : self._n]
+
+    @property
+    def columns(self):
+        """
+        dictionary of column arrays
+        """
+        return dict((name, self.column(name)) for name, kind in self.spec)
+
+    def _reserve(self, nrows):
+        """
+        make sure there's space for nrows rows
+        """
+        capacity = len(self._cols[self.spec[0][0]])
+        if nrows <= capacity:
+            return
+
+        capacity = max(nrows, 2 * capacity, 64)
+        for name, kind in self.spec:
+            col = empty_column(kind, capacity)
+            col[0 : self._n] = self._cols[name][0 : self._n]
+            self._cols[name] = col
+
+    def append(self, row):
+        """
+        append a row dictionary
+        """
+        self._reserve(self._n + 1)
+        i = self._n
+        self._set_values(i, row)
+        self._n += 1
+
+        # keep the indexes up to date
+        if self._key_index is not None:
+            self._key_index.setdefault(self._cols[self.key][i], i)
+        if self.order_by is not None:
+            col = self._cols[self.order_by]
+            if self._ordered and i > 0 and col[i] < col[i - 1]:
+                self._ordered = False
+            self._order = None
+
+    def extend(self, rows):
+        """
+        append an iterable of row dictionaries
+        """
+        for row in rows:
+            self.append(row)
+
+    def _writable(self):
+        """
+        make copies of any read-only columns before rows are changed
+        """
+        for name, col in self._cols.items():
+            if not col.flags.writeable:
+                self._cols[name] = col.copy()
+
+    def _set_values(self, i, row):
+        """
+        set the values of row i from a row dictionary
+        """
+        for name, kind in self.spec:
+            self._cols[name][i] = _to_storage(kind, row.get(name))
+
+    def set_row(self, i, row):
+        """
+        replace row i with a row dictionary
+        """
+        i = self._index(i)
+        self._writable()
+        if self.key is not None:
+            old_key = self._cols[self.key][i]
+        if self.order_by is not None:
+            old_value = self._cols[self.order_by][i]
+
+        self._set_values(i, row)
+
+        # only rebuild the indexes if the indexed values changed
+        if self.key is not None and self._cols[self.key][i] != old_key:
+            self._key_index = None
+        if self.order_by is not None and self._cols[self.order_by][i] != old_value:
+            if self._ordered:
+                self._ordered = None
+            self._order = None
+
+    def _index(self, i):
+        """
+        check a row index and convert negative indices
+        """
+        if i < 0:
+            i += self._n
+        if i < 0 or i >= self._n:
+            raise IndexError("row index out of range")
+        return i
+
+    def get_values(self, start, stop):
+        """
+        return a dictionary of lists of row values for rows start
+        to stop (no-data values are config.ND_FLOAT/config.ND_INT).
+        """
+        return dict(
+            (name, column_to_list(kind, self._cols[name][start:stop]))
+            for name, kind in self.spec
+        )
+
+    def delete(self, i):
+        """
+        delete row i
+        """
+        i = self._index(i)
+        self._writable()
+        for name, kind in self.spec:
+            col = self._cols[name]
+            col[i : self._n - 1] = col[i + 1 : self._n]
+        self._n -= 1
+
+        # deleting a row doesn't change the order but does change
+        # the row positions
+        self._key_index = None
+        self._order = None
+        if not self._ordered:
+            self._ordered = None
+
+    def take(self, index):
+        """
+        return a new ColumnStore with the rows selected by an index
+        array (integer or boolean)
+        """
+        columns = dict((name, self.column(name)[index]) for name, kind in self.spec)
+        store = ColumnStore.from_columns(self.spec, columns)
+        store.set_key(self.key)
+        store.set_order(self.order_by)
+        return store
+
+    def sort(self, name):
+        """
+        sort the rows (in place) by a column.  The sort is stable.
+        """
+        if name == self.order_by and self._is_ordered():
+            return
+
+        order = np.argsort(self.column(name), kind="stable")
+        for cname, kind in self.spec:
+            self._cols[cname] = self.column(cname)[order]
+
+        self._key_index = None
+        self._order = None
+        self._ordered = True if name == self.order_by else None
+
+    def set_key(self, name):
+        """
+        set the key column used by find()
+        """
+        self.key = name
+        self._key_index = None
+
+    def find(self, value):
+        """
+        return the index of the first row with key column value
+        equal to value or None if there isn't one.
+        """
+        if self._key_index is None:
+            keys = self.column(self.key).tolist()
+            # build from the end so the first row with a key wins
+            self._key_index = dict(zip(keys[::-1], range(self._n - 1, -1, -1)))
+
+        return self._key_index.get(value)
+
+    def set_order(self, name):
+        """
+        set the order column used by range_index()
+        """
+        self.order_by = name
+        self._ordered = None
+        self._order = None
+
+    def _is_ordered(self):
+        """
+        return True if the rows are sorted by the order column
+        """
+        if self._ordered is None:
+            col = self.column(self.order_by)
+            self._ordered = bool(np.all(col[1:] >= col[:-1]))
+
+        return self._ordered
+
+    def order_index(self):
+        """
+        return the row indices in order column order (stable)
+        """
+        if self._is_ordered():
+            return np.arange(self._n)
+
+        if self._order is None:
+            self._order = np.argsort(self.column(self.order_by), kind="stable")
+
+        return self._order
+
+    def range_index(self, start, end):
+        """
+        return the indices (in order column order) of the rows with
+        start <= order column value <= end.
+        """
+        col = self.column(self.order_by)
+        if self._is_ordered():
+            i0 = np.searchsorted(col, start, side="left")
+            i1 = np.searchsorted(col, end, side="right")
+            return np.arange(i0, i1)
+
+        order = self.order_index()
+        i0 = np.searchsorted(col[order], start, side="left")
+        i1 = np.searchsorted(col[order], end, side="right")
+        return order[i0:i1]
+
+
+class RowsView(object):
+    """
+    List-like view of the rows in a ColumnStore.  Rows are returned
+    as new dictionaries built by row_factory(store, start, stop)
+    which returns a list of row dictionaries.  Changing a returned
+    dictionary doesn't change the store.
+    """
+
+    def __init__(self, store, row_factory):
+        self.store = store
+        self.row_factory = row_factory
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(len(self.store)))]
+        i = self.store._index(i)
+        return self.row_factory(self.store, i, i + 1)[0]
+
+    def __setitem__(self, i, row):
+        self.store.set_row(i, row)
+
+    def __delitem__(self, i):
+        self.store.delete(i)
+
+    def __iter__(self):
+        nrows = len(self.store)
+        for start in range(0, nrows, ROW_CHUNK):
+            stop = min(start + ROW_CHUNK, nrows)
+            for row in self.row_factory(self.store, start, stop):
+                yield row
+
+    def __bool__(self):
+        return len(self.store) > 0
+
+    def append(self, row):
+        self.store.append(row)
+
+    def extend(self, rows):
+        self.store.extend(rows)
+
+    def pop(self, i=-1):
+        row = self[i]
+        self.store.delete(i)
+        return row
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+import os
+
 # flag for dealing with IR images - by default
 # we're not looking at IR images.
 irFlag = False
@@ -10,6 +12,27 @@ archive_dir = "/data/archive"
 # set default site info CSV file
 site_info_file = "/data/archive/site_info.csv"
 
+# directory for cached site info from the PhenoCam server.  If set
+# to None or "" site info isn't cached on disk.
+site_info_cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "vegindex")
+
+# maximum age (seconds) of cached site info and timeout (seconds)
+# for site info requests
+SITE_INFO_TTL = 7 * 86400
+SITE_INFO_TIMEOUT = 10
+
+# if set don't use the network (e.g. for site info)
+offline = False
+
+# if set writeCSV() also writes a binary sidecar file with the
+# parsed columns (see csvreader.write_sidecar()) which the
+# vegindex.get_*() functions load instead of parsing the CSV
+write_sidecar = False
+
+# directory for site image index files.  If not set the index for a
+# site is kept in the site directory.
+image_index_dir = None
+
 # set up list of predefined ROITypes
 ROITypes = [
     "canopy",
@@ -57,6 +80,11 @@ NIMAGE_MIN = 1
 # set up default resize behavior
 RESIZE = False
 
+# set up default JPEG decode scale (reduced resolution decoding)
+# and the allowed values
+DECODE_SCALE = 1
+DECODE_SCALES = (1, 2, 4, 8)
+
 # set up no/missing data values
 ND_FLOAT = "NA"
 ND_INT = "NA"
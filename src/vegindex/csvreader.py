@@ -0,0 +1,637 @@
+# -*- coding: utf-8 -*-
+
+"""
+Shared reader for the timeseries CSV files.
+
+The timeseries CSV files (roistats, IR roistats, NDVI, GCC and NDVI
+summary) all have a block of "#" comment lines followed by a header
+line and the data.  read_csv() reads the file once, returning the
+comment lines and the data as typed numpy column arrays parsed by
+the pandas C engine.  Values are converted the same way as the
+_float_or_none()/_int_or_none() functions used by the timeseries
+classes: anything which isn't a number and -9999 are no-data.
+
+The parsed columns can also be saved in a binary "sidecar" file next
+to the CSV (see write_sidecar()).  The sidecar is an uncompressed
+numpy .npz file with one array for each column, the comment lines
+and the modification time and size of the CSV file it was made from.
+read_csv() uses the sidecar instead of parsing the CSV when asked to
+and the CSV hasn't changed since the sidecar was written.  Since the
+arrays in the .npz file aren't compressed the numeric columns can
+also be memory mapped straight from the sidecar (read_csv() with
+mmap=True), so processes loading the same timeseries share the pages
+in the OS cache rather than each having their own copy.
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import csv
+import io
+import os
+import struct
+import zipfile
+from datetime import date
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from . import columnar
+
+FLOAT = columnar.FLOAT
+INT = columnar.INT
+STR = columnar.STR
+
+ND_INT_VALUE = columnar.ND_INT_VALUE
+
+# strings which are no-data in numeric columns
+ND_STRINGS = ["NA", "None", ""]
+
+# extension of the binary sidecar files
+SIDECAR_EXT = ".npz"
+
+# size of the first block read from the end of a file when looking
+# for rows after a given datetime (doubled for each block after that)
+TAIL_BLOCK = 65536
+
+
+def _parse_float(value):
+    """
+    convert a string to a float with NaN for no-data (and
+    columnar.NAN_VALUE for "nan")
+    """
+    try:
+        retval = float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+    if retval == -9999.0:
+        return np.nan
+    if retval != retval:
+        return columnar.NAN_VALUE
+
+    return retval
+
+
+def _parse_int(value):
+    """
+    convert a string to an int with ND_INT_VALUE for no-data
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return ND_INT_VALUE
+
+
+def _read_comments(f):
+    """
+    read the comment lines at the top of a file.  The file is left
+    positioned at the start of the header line.
+    """
+    comments = []
+    while True:
+        pos = f.tell()
+        line = f.readline()
+        if not line:
+            break
+        if isinstance(line, bytes):
+            line = line.decode()
+        line = line.rstrip()
+        if not line:
+            continue
+        if not line.startswith("#"):
+            f.seek(pos)
+            break
+        comments.append(line)
+
+    return comments
+
+
+def _read_data_fast(f, kinds):
+    """
+    read the data block with the pandas C engine.  Raises ValueError
+    if a numeric column has a value which can't be parsed.
+    """
+    # columns which aren't numeric are read as strings.  The header
+    # line is read first to name every column in the dtype dict.
+    pos = f.tell()
+    header = f.readline()
+    f.seek(pos)
+    dtypes = {}
+    na_values = {}
+    for name in next(csv.reader([header]), []):
+        kind = kinds.get(name, STR)
+        if kind in (FLOAT, INT):
+            dtypes[name] = np.float64
+            na_values[name] = ND_STRINGS
+        else:
+            dtypes[name] = str
+
+    df = pd.read_csv(
+        f,
+        dtype=dtypes,
+        keep_default_na=False,
+        na_values=na_values,
+        float_precision="round_trip",
+    )
+
+    columns = {}
+    for name in df.columns:
+        kind = kinds.get(name, STR)
+        if kind in (FLOAT, INT):
+            values = df[name].to_numpy(dtype=np.float64, na_value=np.nan, copy=True)
+            values[values == -9999.0] = np.nan
+            if kind == INT:
+                nd = np.isnan(values)
+                values[nd] = ND_INT_VALUE
+                values = values.astype(np.int64)
+            columns[name] = values
+        else:
+            columns[name] = df[name].to_numpy(dtype=object, copy=True)
+
+    return columns
+
+
+def _read_data_slow(f, kinds):
+    """
+    read the data block with the csv module (skipping any comment
+    lines) and convert the values one at a time.
+    """
+    lines = (line.rstrip() for line in f)
+    csvrdr = csv.DictReader(line for line in lines if line and not line[0] == "#")
+
+    strings = dict((name, []) for name in csvrdr.fieldnames or [])
+    for row in csvrdr:
+        for name in strings:
+            strings[name].append(row.get(name))
+
+    columns = {}
+    for name, values in strings.items():
+        kind = kinds.get(name, STR)
+        if kind == FLOAT:
+            column = np.array([_parse_float(v) for v in values], dtype=np.float64)
+        elif kind == INT:
+            column = np.array(
+                [_parse_int(_parse_float(v)) for v in values], dtype=np.int64
+            )
+        else:
+            column = np.empty(len(values), dtype=object)
+            column[:] = values
+        columns[name] = column
+
+    return columns
+
+
+def _line_key(line, nkey):
+    """
+    return the datetime of a data line as a tuple of ints from the
+    date (and time if nkey is 2) fields at the start of the line, or
+    None if the line doesn't start with a date.
+    """
+    fields = line.split(b",", nkey)
+    if len(fields) <= nkey:
+        return None
+
+    try:
+        key = tuple(int(v) for v in fields[0].split(b"-"))
+        if nkey == 2:
+            key += tuple(int(v) for v in fields[1].split(b":"))
+    except ValueError:
+        return None
+
+    return key
+
+
+def _key_length(header):
+    """
+    return the number of fields used for the datetime of a data line
+    for a (bytes) header line.  Image timeseries have a date and
+    time, summaries just a date.
+    """
+    names = header.decode().rstrip().split(",")
+    if len(names) > 1 and names[1] == "local_std_time":
+        return 2
+
+    return 1
+
+
+def _seek_since(f, data_start, since_key, nkey):
+    """
+    find the first data line in the binary file f with a datetime
+    key at or after since_key and return its offset.  The data lines
+    are sorted so blocks are read backwards from the end of the file
+    until a line before since_key is found, then lines are read
+    forward from there.
+    """
+    f.seek(0, os.SEEK_END)
+    pos = f.tell()
+    block = TAIL_BLOCK
+    while pos > data_start:
+        pos = max(data_start, pos - block)
+        block *= 2
+        f.seek(pos)
+        if pos > data_start:
+            # skip the partial line
+            f.readline()
+        key = _line_key(f.readline(), nkey)
+        if key is not None and key < since_key:
+            break
+
+    # back up to the start of the first complete line in the block
+    f.seek(pos)
+    if pos > data_start:
+        f.readline()
+
+    while True:
+        offset = f.tell()
+        line = f.readline()
+        if not line:
+            return offset
+        key = _line_key(line, nkey)
+        if key is not None and key >= since_key:
+            return offset
+
+
+def _read_csv_since(path, kinds, since):
+    """
+    read only the rows of a timeseries CSV file with datetimes at or
+    after since (see read_csv()).
+    """
+    with open(path, "rb") as f:
+        comments = _read_comments(f)
+        header = f.readline()
+        data_start = f.tell()
+        if not header.strip():
+            return comments, {}
+
+        if not isinstance(since, datetime):
+            since = datetime(since.year, since.month, since.day)
+
+        nkey = _key_length(header)
+        since_key = (since.year, since.month, since.day)
+        if nkey == 2:
+            since_key += (since.hour, since.minute, since.second)
+
+        offset = _seek_since(f, data_start, since_key, nkey)
+        f.seek(offset)
+        text = (header + f.read()).decode()
+
+    return comments, _read_text(text, kinds)
+
+
+def _read_text(text, kinds):
+    """
+    read a header line and data lines (a string) with the pandas C
+    engine, falling back to converting one value at a time.
+    """
+    try:
+        return _read_data_fast(io.StringIO(text), kinds)
+    except ValueError:
+        return _read_data_slow(io.StringIO(text), kinds)
+
+
+def last_datetime(path):
+    """
+    return the datetime of the last data line of a timeseries CSV
+    file without reading the whole file, or None if there are no
+    data lines.  Only the end of the file is read, so this can be
+    used to find the since value for read_csv().
+    """
+    with open(path, "rb") as f:
+        _read_comments(f)
+        header = f.readline()
+        data_start = f.tell()
+        if not header.strip():
+            return None
+        nkey = _key_length(header)
+
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        block = TAIL_BLOCK
+        partial = b""
+        while pos > data_start:
+            end = pos
+            pos = max(data_start, pos - block)
+            block *= 2
+            f.seek(pos)
+            lines = (f.read(end - pos) + partial).split(b"\n")
+            if pos > data_start:
+                # the first line may be partial so keep it for the
+                # next block
+                partial = lines.pop(0)
+            for line in reversed(lines):
+                key = _line_key(line, nkey)
+                if key is not None:
+                    return datetime(*key)
+
+    return None
+
+
+def sidecar_path(path):
+    """
+    return the path of the binary sidecar file for a CSV file
+    """
+    return os.path.splitext(path)[0] + SIDECAR_EXT
+
+
+def _csv_stamp(path):
+    """
+    return the modification time (ns) and size of a file
+    """
+    st = os.stat(path)
+    return np.array([st.st_mtime_ns, st.st_size], dtype=np.int64)
+
+
+def write_sidecar(path, kinds):
+    """
+    Parse a timeseries CSV file (see read_csv()) and save the comment
+    lines and columns in a binary sidecar file, stamped with the
+    modification time and size of the CSV file.  String columns are
+    saved as fixed width unicode arrays so the file can be loaded
+    without pickle.  For image timeseries the datetime column (see
+    datetime_column()) is saved too, so it doesn't have to be
+    recomputed.  Returns the sidecar path.
+    """
+    comments, columns = read_csv(path, kinds)
+    if "date" in columns and "local_std_time" in columns:
+        columns["datetime"] = datetime_column(
+            columns["date"], columns["local_std_time"]
+        )
+
+    return _save_sidecar(path, comments, columns)
+
+
+def extend_sidecar(path, kinds, old, text):
+    """
+    Update the sidecar of a CSV file after data lines have been
+    appended to it (e.g. by ROITimeSeries.appendCSV()) without
+    parsing the whole file again.  old is the (comments, columns)
+    read with read_sidecar() before the lines were appended and text
+    is the appended lines.  Only the appended lines are parsed and
+    their columns added to the old ones.  If old is None (or doesn't
+    match the appended lines) the sidecar is written from scratch
+    with write_sidecar().  Returns the sidecar path.
+    """
+    if old is None or not old[1]:
+        return write_sidecar(path, kinds)
+
+    with open(path, "r") as f:
+        comments = _read_comments(f)
+        header = f.readline()
+
+    columns = _read_text(header + text, kinds)
+    nrows = len(next(iter(columns.values()))) if columns else 0
+    for name, kind in kinds.items():
+        if name not in columns and kind in (FLOAT, INT):
+            columns[name] = columnar.empty_column(kind, nrows)
+    if "date" in columns and "local_std_time" in columns:
+        columns["datetime"] = datetime_column(
+            columns["date"], columns["local_std_time"]
+        )
+
+    old_columns = old[1]
+    if set(columns) != set(old_columns):
+        return write_sidecar(path, kinds)
+    for name in columns:
+        columns[name] = np.concatenate([old_columns[name], columns[name]])
+
+    return _save_sidecar(path, comments, columns)
+
+
+def _save_sidecar(path, comments, columns):
+    """
+    save the comment lines and columns of a CSV file in its sidecar
+    file (see write_sidecar()) and return the sidecar path
+    """
+    arrays = {"__comments__": np.array(comments, dtype=str)}
+    for name, values in columns.items():
+        if values.dtype == object:
+            values = values.astype(str)
+        arrays[name] = values
+    arrays["__stamp__"] = _csv_stamp(path)
+
+    # write to a temporary file first so a reader never sees a
+    # partial sidecar
+    outpath = sidecar_path(path)
+    tmppath = "{0}.{1}.tmp".format(outpath, os.getpid())
+    try:
+        with open(tmppath, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmppath, outpath)
+    except OSError:
+        if os.path.exists(tmppath):
+            os.remove(tmppath)
+        raise
+
+    return outpath
+
+
+def _memmap_members(path):
+    """
+    return a dictionary of read-only arrays memory mapped from the
+    (uncompressed) .npy members of a .npz file
+    """
+    arrays = {}
+    buf = np.memmap(path, dtype=np.uint8, mode="r")
+    with zipfile.ZipFile(path) as zf, open(path, "rb") as f:
+        for info in zf.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError("Compressed sidecar member: " + info.filename)
+
+            # skip the zip local file header to get to the .npy data
+            f.seek(info.header_offset)
+            fields = struct.unpack("<4s5H3L2H", f.read(30))
+            f.seek(info.header_offset + 30 + fields[-2] + fields[-1])
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                header = np.lib.format.read_array_header_1_0(f)
+            else:
+                header = np.lib.format.read_array_header_2_0(f)
+            shape, fortran_order, dtype = header
+
+            arrays[os.path.splitext(info.filename)[0]] = np.ndarray(
+                shape,
+                dtype=dtype,
+                buffer=buf,
+                offset=f.tell(),
+                order="F" if fortran_order else "C",
+            )
+
+    return arrays
+
+
+def read_sidecar(path, kinds):
+    """
+    return the comments and columns from the sidecar of a CSV file,
+    or None if there's no sidecar or it's out of date (see
+    read_csv()).
+    """
+    return _read_sidecar(path, kinds)
+
+
+def _read_sidecar(path, kinds, mmap=False):
+    """
+    return the comments and columns from the sidecar of a CSV file,
+    or None if there's no sidecar, the CSV file has changed since it
+    was written or the columns don't match kinds.  If mmap is True
+    the numeric columns are read-only memory maps of the sidecar.
+    """
+    sidecar = sidecar_path(path)
+    if not os.path.exists(sidecar):
+        return None
+
+    try:
+        with np.load(sidecar, allow_pickle=False) as npz:
+            if not np.array_equal(npz["__stamp__"], _csv_stamp(path)):
+                return None
+            if mmap:
+                arrays = _memmap_members(sidecar)
+            else:
+                arrays = dict((name, npz[name]) for name in npz.files)
+    except (OSError, ValueError, KeyError, struct.error, zipfile.BadZipFile):
+        return None
+
+    comments = arrays["__comments__"].tolist()
+    columns = {}
+    for name, values in arrays.items():
+        if name.startswith("__"):
+            continue
+        if values.dtype.kind == "U":
+            values = values.astype(object)
+        columns[name] = values
+
+    # the numeric columns should have been parsed with the same kinds
+    dtypes = {FLOAT: np.float64, INT: np.int64}
+    for name, kind in kinds.items():
+        if kind in dtypes and name in columns:
+            if columns[name].dtype != dtypes[kind]:
+                return None
+
+    return comments, columns
+
+
+def read_csv(path, kinds, since=None, sidecar=False, mmap=False):
+    """
+    Read a timeseries CSV file.  kinds is a dictionary of column
+    kinds (columnar.FLOAT or columnar.INT) for the numeric columns,
+    other columns are read as strings.  Returns a list of the comment
+    lines and a dictionary of numpy arrays for the columns in the
+    file.  No-data values are NaN in float columns and -9999 in int
+    columns.  Numeric columns in kinds which aren't in the file are
+    filled with no-data values.
+
+    If since (a datetime or date) is given only the rows with
+    datetimes (or dates for summary files) at or after since are
+    read.  The file must be sorted by datetime, which writeCSV()
+    always does, and only the end of the file is read.
+
+    If sidecar is True and the CSV file has an up to date sidecar
+    (see write_sidecar()) the columns are loaded from the sidecar.
+    The columns then include the datetime column for image
+    timeseries.
+
+    If mmap is True (and since isn't given) the sidecar is always
+    used, writing it first if it's missing or out of date, and the
+    numeric columns are read-only memory maps of the sidecar file.
+    If the sidecar can't be written the CSV is parsed as usual.
+    """
+    cached = None
+    if mmap and since is None:
+        cached = _read_sidecar(path, kinds, mmap=True)
+        if cached is None:
+            try:
+                write_sidecar(path, kinds)
+            except OSError:
+                pass
+            else:
+                cached = _read_sidecar(path, kinds, mmap=True)
+    elif sidecar and since is None:
+        cached = _read_sidecar(path, kinds)
+
+    if cached is not None:
+        comments, columns = cached
+        if not columns:
+            return comments, columns
+    elif since is not None:
+        comments, columns = _read_csv_since(path, kinds, since)
+    else:
+        with open(path, "r") as f:
+            comments = _read_comments(f)
+            pos = f.tell()
+            if not f.readline():
+                return comments, {}
+            f.seek(pos)
+
+            try:
+                columns = _read_data_fast(f, kinds)
+            except ValueError:
+                # something unexpected in the data so fall back to
+                # converting one value at a time
+                f.seek(pos)
+                columns = _read_data_slow(f, kinds)
+
+    nrows = len(next(iter(columns.values()))) if columns else 0
+    for name, kind in kinds.items():
+        if name not in columns and kind in (FLOAT, INT):
+            columns[name] = columnar.empty_column(kind, nrows)
+
+    return comments, columns
+
+
+def datetime_column(dates, times):
+    """
+    return a datetime64[s] array from arrays of date (YYYY-MM-DD)
+    and time (HH:MM:SS) strings
+    """
+    dtstrs = ["{0}T{1}".format(d, t) for d, t in zip(dates, times)]
+    try:
+        return np.array(dtstrs, dtype="datetime64[s]")
+    except ValueError:
+        pass
+
+    dts = []
+    for d, t in zip(dates, times):
+        (yr, mo, dom) = d.split("-")
+        (hr, mn, sec) = t.split(":")
+        dts.append(datetime(int(yr), int(mo), int(dom), int(hr), int(mn), int(sec)))
+
+    return np.array(dts, dtype="datetime64[s]")
+
+
+def date_column(dates):
+    """
+    return a datetime64[D] array from an array of date (YYYY-MM-DD)
+    strings
+    """
+    try:
+        return np.array(list(dates), dtype="datetime64[D]")
+    except ValueError:
+        pass
+
+    days = []
+    for d in dates:
+        (yr, mo, dom) = d.split("-")
+        days.append(date(int(yr), int(mo), int(dom)))
+
+    return np.array(days, dtype="datetime64[D]")
+
+
+def columns_to_rows(columns):
+    """
+    return a list of row dictionaries from a dictionary of column
+    arrays.  No-data values in numeric columns are config.ND_FLOAT
+    and config.ND_INT and datetime64 values are converted to python
+    datetime (or date) objects.
+    """
+    values = {}
+    for name, column in columns.items():
+        if column.dtype.kind == "f":
+            values[name] = columnar.column_to_list(FLOAT, column)
+        elif column.dtype.kind == "i":
+            values[name] = columnar.column_to_list(INT, column)
+        else:
+            values[name] = column.tolist()
+
+    names = list(values.keys())
+    return [dict(zip(names, rowvals)) for rowvals in zip(*values.values())]
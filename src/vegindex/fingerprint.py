@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+
+"""
+Fingerprints of the inputs of the pipeline stages run by
+vegindex-batch.
+
+For each site and ROI a small JSON state file records the
+fingerprints of the input files (and the output file) of each stage
+when it last ran successfully.  A stage whose inputs and output are
+unchanged since then doesn't need to be run again.
+
+A file fingerprint is [mtime_ns, size, sha1].  The hash is only
+computed again when the modification time or size of the file has
+changed so checking an unchanged file is just a stat().  Files with
+the same size and hash are the same even if they have been rewritten.
+Site image month directories are fingerprinted by their modification
+time ([mtime_ns]) as in the image index.
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import hashlib
+import json
+import os
+import stat
+import sys
+import time
+
+from . import __version__
+from . import config
+from .imageindex import MTIME_SLOP
+from .utils import MONTH_RE
+from .utils import YEAR_RE
+
+# version of the state file format
+STATE_VERSION = 1
+
+# block size for hashing files
+HASH_BLOCK = 1 << 20
+
+# file fingerprints already computed by this process
+_fingerprints = {}
+
+
+def get_state_path(sitename, roiname):
+    """
+    return the path of the pipeline state file for a site and ROI
+    """
+    state_file = "{0}_{1}_pipeline.json".format(sitename, roiname)
+    return os.path.join(config.archive_dir, sitename, "ROI", state_file)
+
+
+def file_hash(path):
+    """
+    return the SHA-1 hash (hex digest) of a file
+    """
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            h.update(block)
+
+    return h.hexdigest()
+
+
+def file_fingerprint(path, old=None):
+    """
+    return the fingerprint of a file or None if it doesn't exist.
+    The hash of an earlier fingerprint (old or one computed by this
+    process) is reused if the modification time and size match.
+    Files modified less than MTIME_SLOP seconds ago get a None
+    modification time so they are hashed again next time.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    for prev in (_fingerprints.get(path), old):
+        if (
+            prev is not None
+            and len(prev) == 3
+            and prev[0] == st.st_mtime_ns
+            and prev[1] == st.st_size
+        ):
+            return prev
+
+    mtime_ns = st.st_mtime_ns
+    if time.time() - st.st_mtime < MTIME_SLOP:
+        mtime_ns = None
+
+    try:
+        digest = file_hash(path)
+    except (IOError, OSError):
+        return None
+
+    fingerprint = [mtime_ns, st.st_size, digest]
+    _fingerprints[path] = fingerprint
+
+    return fingerprint
+
+
+def image_dir_fingerprints(sitename):
+    """
+    return a dictionary of the fingerprints of the YYYY/MM image
+    directories for a site keyed by path relative to the archive
+    directory.  Directories modified less than MTIME_SLOP seconds
+    ago get a None modification time so they never match.
+    """
+    fingerprints = {}
+    sitepath = os.path.join(config.archive_dir, sitename)
+    if not os.path.isdir(sitepath):
+        return fingerprints
+
+    now = time.time()
+    for yeardir in os.listdir(sitepath):
+        if not YEAR_RE.match(yeardir):
+            continue
+        yearpath = os.path.join(sitepath, yeardir)
+        if not os.path.isdir(yearpath):
+            continue
+
+        for mondir in os.listdir(yearpath):
+            if not MONTH_RE.match(mondir):
+                continue
+            try:
+                st = os.stat(os.path.join(yearpath, mondir))
+            except OSError:
+                continue
+            if not stat.S_ISDIR(st.st_mode):
+                continue
+
+            mtime_ns = st.st_mtime_ns
+            if now - st.st_mtime < MTIME_SLOP:
+                mtime_ns = None
+            key = "/".join([sitename, yeardir, mondir])
+            fingerprints[key] = [mtime_ns]
+
+    return fingerprints
+
+
+def same_fingerprint(old, new):
+    """
+    return True if two fingerprints are for the same content: both
+    files missing, files with the same size and hash or directories
+    with the same (settled) modification time.
+    """
+    if old is None or new is None:
+        return old is None and new is None
+
+    if len(new) == 1:
+        return new[0] is not None and old == new
+
+    return old[1:] == new[1:]
+
+
+class PipelineState(object):
+    """
+    Class for the pipeline state of a site and ROI.  For each stage
+    which has run the state holds the package version and the
+    fingerprints of the stage inputs and output.
+    """
+
+    def __init__(self, sitename, roiname, state_path=None):
+        """
+        create PipelineState object and read the state file if it
+        exists
+        """
+        self.site = sitename
+        self.roiname = roiname
+        if state_path is None:
+            state_path = get_state_path(sitename, roiname)
+        self.state_path = state_path
+        self.stages = {}
+        self.modified = False
+
+        self.read()
+
+    def read(self):
+        """
+        read the state file.  A missing or unreadable state file
+        just gives an empty state.
+        """
+        try:
+            with open(self.state_path, "r") as f:
+                state = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+
+        if state.get("version") != STATE_VERSION:
+            return
+        if state.get("site") != self.site or state.get("roiname") != self.roiname:
+            return
+
+        self.stages = state["stages"]
+
+    def write(self):
+        """
+        write the state file if it has been modified.  Failure to
+        write the state is not fatal, the stages will just run again
+        next time.
+        """
+        if not self.modified:
+            return
+
+        state = {
+            "version": STATE_VERSION,
+            "site": self.site,
+            "roiname": self.roiname,
+            "stages": self.stages,
+        }
+        tmp_path = "{0}.{1}.tmp".format(self.state_path, os.getpid())
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(state, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.state_path)
+        except (IOError, OSError) as e:
+            errmsg = "Unable to write pipeline state {0}: {1}\n"
+            sys.stderr.write(errmsg.format(self.state_path, e))
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+
+        self.modified = False
+
+    def input_fingerprints(self, stage, paths, images=False):
+        """
+        return a dictionary of the fingerprints of the input files
+        for a stage (and the site image directories if images is
+        True) keyed by path relative to the archive directory.
+        """
+        old = self.stages.get(stage, {}).get("inputs", {})
+        fingerprints = {}
+        for path in paths:
+            key = os.path.relpath(path, config.archive_dir).replace(os.sep, "/")
+            fingerprints[key] = file_fingerprint(path, old.get(key))
+        if images:
+            fingerprints.update(image_dir_fingerprints(self.site))
+
+        return fingerprints
+
+    def unchanged(self, stage, inputs, outpath):
+        """
+        return True if the stage last ran with the same package
+        version and inputs (from input_fingerprints()) and the
+        output file hasn't changed since.
+        """
+        record = self.stages.get(stage)
+        if record is None or record.get("version") != __version__:
+            return False
+
+        old_inputs = record["inputs"]
+        if set(old_inputs) != set(inputs):
+            return False
+        for key, fingerprint in inputs.items():
+            if not same_fingerprint(old_inputs[key], fingerprint):
+                return False
+
+        output = file_fingerprint(outpath, record["output"])
+        return output is not None and same_fingerprint(record["output"], output)
+
+    def record(self, stage, inputs, outpath):
+        """
+        record that a stage ran successfully with the inputs (from
+        input_fingerprints() before it ran) giving the output file.
+        """
+        self.stages[stage] = {
+            "version": __version__,
+            "inputs": inputs,
+            "output": file_fingerprint(outpath),
+        }
+        self.modified = True
@@ -4,36 +4,57 @@ from __future__ import print_function
 import csv
 import re
 import sys
-from datetime import date
 from datetime import datetime
 from datetime import time
 
+import numpy as np
+
 from . import config
+from . import csvreader
 from . import utils
 
 ND_STRING = config.ND_STRING
 ND_FLOAT = config.ND_FLOAT
 ND_INT = config.ND_INT
 
-
-def _filter_comments(f):
-    """
-    filter comments from csv file
-    """
-    for line in f:
-        line = line.rstrip()
-        if line and not line.startswith("#"):
-            yield line
-
-
-def _get_comments(f):
-    """
-    return JUST the comment lines from a csv file
-    """
-    for line in f:
-        line = line.rstrip()
-        if line and line.startswith("#"):
-            yield line
+# columns of a GCC timeseries CSV file which are set to no-data for
+# days with no images
+GCC_MIDDAY_COLUMNS = ["midday_r", "midday_g", "midday_b", "midday_gcc", "midday_rcc"]
+
+# columns which are set to no-data for days with fewer than the
+# minimum number of images
+GCC_STATS_COLUMNS = [
+    "r_mean",
+    "r_std",
+    "g_mean",
+    "g_std",
+    "b_mean",
+    "b_std",
+    "gcc_mean",
+    "gcc_std",
+    "gcc_50",
+    "gcc_75",
+    "gcc_90",
+    "rcc_mean",
+    "rcc_std",
+    "rcc_50",
+    "rcc_75",
+    "rcc_90",
+    "max_solar_elev",
+]
+GCC_FLAG_COLUMNS = [
+    "snow_flag",
+    "outlierflag_gcc_mean",
+    "outlierflag_gcc_50",
+    "outlierflag_gcc_75",
+    "outlierflag_gcc_90",
+]
+
+# types of the numeric columns in a GCC timeseries CSV file
+GCC_COLUMN_KINDS = {"doy": csvreader.INT, "image_count": csvreader.INT}
+GCC_COLUMN_KINDS.update((name, csvreader.FLOAT) for name in GCC_MIDDAY_COLUMNS)
+GCC_COLUMN_KINDS.update((name, csvreader.FLOAT) for name in GCC_STATS_COLUMNS)
+GCC_COLUMN_KINDS.update((name, csvreader.INT) for name in GCC_FLAG_COLUMNS)
 
 
 def _get_comment_field(comments, var_string):
@@ -68,38 +89,6 @@ def _get_comment_field(comments, var_string):
     return var_value
 
 
-def _float_or_none(str):
-    """
-    Try to convert string to float. Return float or None value if a
-    ValueError exception is raised.
-    """
-    try:
-        retval = float(str)
-    except ValueError:
-        retval = ND_FLOAT
-
-    if retval == -9999.0:
-        retval = ND_FLOAT
-
-    return retval
-
-
-def _int_or_none(str):
-    """
-    Try to convert string to integer. Return int or None value
-    if ValueError is raised.
-    """
-    try:
-        retval = int(str)
-    except ValueError:
-        retval = ND_INT
-
-    if retval == -9999:
-        retval = ND_INT
-
-    return retval
-
-
 class GCCTimeSeries(object):
     """
     Class for CSV version of GCC Timeseries.  There is currently
@@ -183,17 +172,17 @@ class GCCTimeSeries(object):
         self.elev = si["elev"]
         self.tzoffset = si["tzoffset"]
 
-    def readCSV(self, gccTimeSeriesPath):
+    def readCSV(self, gccTimeSeriesPath, sidecar=False):
         """
         Method to read GCCTimeSeries object from CSV file and return
-        a GCCTimeSeries object.
+        a GCCTimeSeries object.  If sidecar is True the columns are
+        loaded from an up to date binary sidecar file if there is one.
         """
 
-        # open file for reading
-        f = open(gccTimeSeriesPath, "r")
-
-        # get comment lines
-        comments = list(_get_comments(f))
+        # read comment lines and data columns
+        comments, columns = csvreader.read_csv(
+            gccTimeSeriesPath, GCC_COLUMN_KINDS, sidecar=sidecar
+        )
 
         # no validation applied to sitename
         site = _get_comment_field(comments, "Site")
@@ -279,118 +268,29 @@ class GCCTimeSeries(object):
                 print("Invalid update date or time in CSV.")
 
         # get timeseries rows
-        f.seek(0)
-        csvrdr = csv.DictReader(_filter_comments(f))
-
-        gcctsRows = []
-        for row in csvrdr:
-
-            # convert date string to date object
-            [yr_str, mo_str, dom_str] = row["date"].split("-")
-            gcc_date = date(int(yr_str), int(mo_str), int(dom_str))
-            row["date"] = gcc_date
-            row["year"] = gcc_date.year
-
-            # turn strings to numbers checking for empty/missing and
-            # no-data values
-            row["image_count"] = int(row["image_count"])
-
-            if row["image_count"] == 0:
-                row["doy"] = _int_or_none(row["doy"])
-                row["midday_filename"] = ND_STRING
-                row["midday_r"] = ND_FLOAT
-                row["midday_g"] = ND_FLOAT
-                row["midday_b"] = ND_FLOAT
-                row["midday_gcc"] = ND_FLOAT
-                row["midday_rcc"] = ND_FLOAT
-                row["r_mean"] = ND_FLOAT
-                row["r_std"] = ND_FLOAT
-                row["g_mean"] = ND_FLOAT
-                row["g_std"] = ND_FLOAT
-                row["b_mean"] = ND_FLOAT
-                row["b_std"] = ND_FLOAT
-                row["gcc_mean"] = ND_FLOAT
-                row["gcc_std"] = ND_FLOAT
-                row["gcc_50"] = ND_FLOAT
-                row["gcc_75"] = ND_FLOAT
-                row["gcc_90"] = ND_FLOAT
-                row["rcc_mean"] = ND_FLOAT
-                row["rcc_std"] = ND_FLOAT
-                row["rcc_50"] = ND_FLOAT
-                row["rcc_75"] = ND_FLOAT
-                row["rcc_90"] = ND_FLOAT
-                row["max_solar_elev"] = ND_FLOAT
-                row["snow_flag"] = ND_INT
-                row["outlierflag_gcc_mean"] = ND_INT
-                row["outlierflag_gcc_50"] = ND_INT
-                row["outlierflag_gcc_75"] = ND_INT
-                row["outlierflag_gcc_90"] = ND_INT
-
-            elif row["image_count"] < self.nmin:
-                row["doy"] = _int_or_none(row["doy"])
-                if not row["midday_filename"]:
-                    row["midday_filename"] = ND_STRING
-                row["midday_r"] = _float_or_none(row["midday_r"])
-                row["midday_g"] = _float_or_none(row["midday_g"])
-                row["midday_b"] = _float_or_none(row["midday_b"])
-                row["midday_gcc"] = _float_or_none(row["midday_gcc"])
-                row["midday_rcc"] = _float_or_none(row["midday_rcc"])
-                row["r_mean"] = ND_FLOAT
-                row["r_std"] = ND_FLOAT
-                row["g_mean"] = ND_FLOAT
-                row["g_std"] = ND_FLOAT
-                row["b_mean"] = ND_FLOAT
-                row["b_std"] = ND_FLOAT
-                row["gcc_mean"] = ND_FLOAT
-                row["gcc_std"] = ND_FLOAT
-                row["gcc_50"] = ND_FLOAT
-                row["gcc_75"] = ND_FLOAT
-                row["gcc_90"] = ND_FLOAT
-                row["rcc_mean"] = ND_FLOAT
-                row["rcc_std"] = ND_FLOAT
-                row["rcc_50"] = ND_FLOAT
-                row["rcc_75"] = ND_FLOAT
-                row["rcc_90"] = ND_FLOAT
-                row["max_solar_elev"] = ND_FLOAT
-                row["snow_flag"] = ND_INT
-                row["outlierflag_gcc_mean"] = ND_INT
-                row["outlierflag_gcc_50"] = ND_INT
-                row["outlierflag_gcc_75"] = ND_INT
-                row["outlierflag_gcc_90"] = ND_INT
-
-            else:
-                row["doy"] = _int_or_none(row["doy"])
-                row["midday_r"] = _float_or_none(row["midday_r"])
-                row["midday_g"] = _float_or_none(row["midday_g"])
-                row["midday_b"] = _float_or_none(row["midday_b"])
-                row["midday_gcc"] = _float_or_none(row["midday_gcc"])
-                row["midday_rcc"] = _float_or_none(row["midday_rcc"])
-                row["r_mean"] = _float_or_none(row["r_mean"])
-                row["r_std"] = _float_or_none(row["r_std"])
-                row["g_mean"] = _float_or_none(row["g_mean"])
-                row["g_std"] = _float_or_none(row["g_std"])
-                row["b_mean"] = _float_or_none(row["b_mean"])
-                row["b_std"] = _float_or_none(row["b_std"])
-                row["gcc_mean"] = _float_or_none(row["gcc_mean"])
-                row["gcc_std"] = _float_or_none(row["gcc_std"])
-                row["gcc_50"] = _float_or_none(row["gcc_50"])
-                row["gcc_75"] = _float_or_none(row["gcc_75"])
-                row["gcc_90"] = _float_or_none(row["gcc_90"])
-                row["rcc_mean"] = _float_or_none(row["rcc_mean"])
-                row["rcc_std"] = _float_or_none(row["rcc_std"])
-                row["rcc_50"] = _float_or_none(row["rcc_50"])
-                row["rcc_75"] = _float_or_none(row["rcc_75"])
-                row["rcc_90"] = _float_or_none(row["rcc_90"])
-                row["max_solar_elev"] = _float_or_none(row["max_solar_elev"])
-                row["snow_flag"] = _int_or_none(row["snow_flag"])
-                row["outlierflag_gcc_mean"] = _int_or_none(row["outlierflag_gcc_mean"])
-                row["outlierflag_gcc_50"] = _int_or_none(row["outlierflag_gcc_50"])
-                row["outlierflag_gcc_75"] = _int_or_none(row["outlierflag_gcc_75"])
-                row["outlierflag_gcc_90"] = _int_or_none(row["outlierflag_gcc_90"])
-
-            gcctsRows.append(row)
-
-        self.rows = gcctsRows
+        if columns:
+
+            # convert date strings to date values
+            gcc_dates = csvreader.date_column(columns["date"])
+            columns["date"] = gcc_dates
+            columns["year"] = gcc_dates.astype("datetime64[Y]").astype(np.int64) + 1970
+
+            # set no-data values for days with no images or with
+            # fewer than the minimum number of images
+            no_images = columns["image_count"] == 0
+            too_few = columns["image_count"] < self.nmin
+            for name in GCC_MIDDAY_COLUMNS:
+                columns[name][no_images] = np.nan
+            for name in GCC_STATS_COLUMNS:
+                columns[name][too_few] = np.nan
+            for name in GCC_FLAG_COLUMNS:
+                columns[name][too_few] = csvreader.ND_INT_VALUE
+
+            midday_filename = columns["midday_filename"]
+            no_filename = no_images | (too_few & (midday_filename == ""))
+            midday_filename[no_filename] = ND_STRING
+
+        self.rows = csvreader.columns_to_rows(columns)
 
     def insert_row(
         self,
@@ -476,9 +376,8 @@ class GCCTimeSeries(object):
             row_index = None
 
         # replace or append
-        if row_index:
-            self.rows.pop(row_index)
-            self.rows.append(gccts_row)
+        if row_index is not None:
+            self.rows[row_index] = gccts_row
         else:
             self.rows.append(gccts_row)
 
@@ -567,11 +466,13 @@ class GCCTimeSeries(object):
 
         return csvstr
 
-    def writeCSV(self, file=""):
+    def writeCSV(self, file="", sidecar=None):
         """
         Method for writing GCCTimeSeries to CSV file.  The method opens
         the file, file, for writing.  If no file object is passed
-        write to standard out.
+        write to standard out.  If sidecar is True (or None and
+        config.write_sidecar is set) a binary sidecar file is also
+        written (see csvreader.write_sidecar()).
 
         Do we need to be careful to avoid overwriting files?
         """
@@ -717,6 +618,8 @@ class GCCTimeSeries(object):
         # close file
         if not file == "":
             fo.close()
+            if sidecar or (sidecar is None and config.write_sidecar):
+                csvreader.write_sidecar(file, GCC_COLUMN_KINDS)
 
         # return number of rows
         return len(self.rows)
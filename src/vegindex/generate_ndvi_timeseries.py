@@ -35,7 +35,7 @@ ND_INT = vi.config.ND_INT
 ND_STRING = vi.config.ND_STRING
 
 
-def main():
+def main(argv=None):
 
     # set up command line argument processing
     parser = argparse.ArgumentParser(
@@ -63,7 +63,7 @@ def main():
     parser.add_argument("roiname", help="ROI name, e.g. canopy_0001")
 
     # get args
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     sitename = args.site
     roiname = args.roiname
     verbose = args.verbose
@@ -17,12 +17,11 @@ from configparser import ConfigParser as configparser
 # use this because numpy/openblas is automatically multi-threaded.
 os.environ["OMP_NUM_THREADS"] = "1"
 os.environ["MKL_NUM_THREADS"] = "1"
-import numpy as np
-from PIL import Image
 
 import vegindex as vi
-from vegindex import utils
+from vegindex import imageindex
 from vegindex.ir_roitimeseries import IRROITimeSeries
+from vegindex.roimask import read_mask
 from vegindex.vegindex import get_roi_list
 
 # set vars
@@ -36,7 +35,7 @@ default_resize = vi.config.RESIZE
 
 
 # if __name__ == "__main__":
-def main():
+def main(argv=None):
     """
     generate IR ROI timeseries from a PhenoCam directory of images
     """
@@ -65,7 +64,7 @@ def main():
     parser.add_argument("roiname", help="ROI name, e.g. DB_0001")
 
     # get args
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     sitename = args.site
     roiname = args.roiname
     verbose = args.verbose
@@ -127,26 +126,15 @@ def main():
         maskfile = roimask["maskfile"]
 
         mask_path = os.path.join(archive_dir, sitename, "ROI", maskfile)
-        # open roi mask file
+        # open roi mask file (decoded masks are cached)
         try:
-            mask_img = Image.open(mask_path)
-
+            roimask = read_mask(mask_path).mask
         except IOError:
             sys.stderr.write("Unable to open ROI mask file\n")
             sys.exit(1)
 
-        # check that mask_img is in expected form
-        mask_mode = mask_img.mode
-        if mask_mode != "L":
-
-            # convert to 8-bit mask
-            mask_img = mask_img.convert("L")
-
-        # make a numpy mask
-        roimask = np.asarray(mask_img, dtype=np.bool8)
-
         # get list of images for this timeperiod
-        imglist = utils.getsiteimglist(
+        imglist = imageindex.getsiteimglist(
             sitename, getIR=True, startDT=startDT, endDT=endDT
         )
 
@@ -9,6 +9,7 @@ from __future__ import absolute_import
 from __future__ import print_function
 
 import argparse
+import multiprocessing
 import os
 import sys
 from configparser import ConfigParser as configparser
@@ -16,14 +17,13 @@ from configparser import ConfigParser as configparser
 # use this because numpy/openblas is automatically multi-threaded.
 os.environ["OMP_NUM_THREADS"] = "1"
 os.environ["MKL_NUM_THREADS"] = "1"
-import numpy as np
-from PIL import Image
 
 import vegindex as vi
+from vegindex.roimask import read_mask
 from vegindex.roitimeseries import ROITimeSeries
 from vegindex.vegindex import get_roi_list
 
-from . import utils
+from . import imageindex
 
 # set vars
 
@@ -33,10 +33,105 @@ archive_dir = vi.config.archive_dir
 
 debug = False
 default_resize = vi.config.RESIZE
+default_decode_scale = vi.config.DECODE_SCALE
+
+# maximum number of images sent to a worker process in one task
+max_chunk = 256
+
+# per-process state for worker processes
+_worker_roits = None
+
+
+def read_roimask(mask_path):
+    """
+    Read an ROI mask file (through the decoded mask cache) and return
+    it as a numpy boolean array.  Exits if the mask file can't be
+    opened.
+    """
+    try:
+        roimask = read_mask(mask_path).mask
+    except IOError:
+        sys.stderr.write("Unable to open ROI mask file\n")
+        sys.exit(1)
+
+    return roimask
+
+
+def read_roi_config(sitename, roiname):
+    """
+    Read the resize flag and decode scale from the config file for
+    a site and ROI (if it exists).  Exits if the decode scale isn't
+    valid.
+    """
+    config_file = "{0}_{1}.cfg".format(sitename, roiname)
+    config_path = os.path.join(archive_dir, sitename, "ROI", config_file)
+    if os.path.exists(config_path):
+        cfgparser = configparser(
+            defaults={
+                "resize": str(default_resize),
+                "decode_scale": str(default_decode_scale),
+            }
+        )
+        cfgparser.read(config_path)
+        if cfgparser.has_section("roi_timeseries"):
+            resizeFlg = cfgparser.getboolean("roi_timeseries", "resize")
+            decodeScale = cfgparser.getint("roi_timeseries", "decode_scale")
+        else:
+            resizeFlg = default_resize
+            decodeScale = default_decode_scale
+
+    else:
+        resizeFlg = default_resize
+        decodeScale = default_decode_scale
+
+    if decodeScale not in vi.config.DECODE_SCALES:
+        errmsg = "decode scale must be one of {0}\n"
+        sys.stderr.write(errmsg.format(vi.config.DECODE_SCALES))
+        sys.exit(1)
+
+    return resizeFlg, decodeScale
+
+
+def _init_worker(roits):
+    """
+    Initialize a worker process with a copy of the (empty)
+    ROITimeSeries object used to create rows.
+    """
+    global _worker_roits
+    _worker_roits = roits
+
+
+def _create_rows(task):
+    """
+    Create ROITimeSeries rows for a chunk of images which all use
+    the same ROI mask.  Returns a list of row dictionaries (or None
+    for images which couldn't be processed) in the same order as
+    the image list.
+    """
+    mask_path, mask_index, imglist = task
+
+    # the mask is only decoded once per worker
+    roimask = read_roimask(mask_path)
+
+    return _worker_roits.create_rows(imglist, roimask, mask_index)
+
+
+def _make_tasks(mask_path, mask_index, imglist, nworkers):
+    """
+    Split the image list for one ROI mask period into chunks
+    so that each worker gets several tasks.
+    """
+    nimg = len(imglist)
+    chunk = -(-nimg // (nworkers * 4))
+    chunk = max(1, min(max_chunk, chunk))
+
+    return [
+        (mask_path, mask_index, imglist[i : i + chunk]) for i in range(0, nimg, chunk)
+    ]
 
 
 # if __name__ == "__main__":
-def main():
+def main(argv=None):
     """
     generate ROI timeseries from a PhenoCam directory of images
     """
@@ -59,23 +154,36 @@ def main():
         action="store_true",
         default=False,
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        help="number of worker processes to use (default=1)",
+        type=int,
+        default=1,
+    )
 
     # positional arguments
     parser.add_argument("site", help="PhenoCam site name")
     parser.add_argument("roiname", help="ROI name, e.g. DB_0001")
 
     # get args
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     sitename = args.site
     roiname = args.roiname
     verbose = args.verbose
     dryrun = args.dry_run
+    nworkers = args.workers
+
+    if nworkers < 1:
+        sys.stderr.write("Number of workers must be at least 1\n")
+        sys.exit(1)
 
     if verbose:
         print("site: {0}".format(sitename))
         print("roiname: {0}".format(roiname))
         print("verbose: {0}".format(verbose))
         print("dryrun: {0}".format(dryrun))
+        print("workers: {0}".format(nworkers))
 
     # set output filename
     outname = "%s_%s_roistats.csv" % (sitename, roiname)
@@ -88,16 +196,7 @@ def main():
     # read in config file for this site if it exists
     config_file = "{0}_{1}.cfg".format(sitename, roiname)
     config_path = os.path.join(archive_dir, sitename, "ROI", config_file)
-    if os.path.exists(config_path):
-        cfgparser = configparser(defaults={"resize": str(default_resize)})
-        cfgparser.read(config_path)
-        if cfgparser.has_section("roi_timeseries"):
-            resizeFlg = cfgparser.getboolean("roi_timeseries", "resize")
-        else:
-            resizeFlg = default_resize
-
-    else:
-        resizeFlg = default_resize
+    resizeFlg, decodeScale = read_roi_config(sitename, roiname)
 
     # print config values
     if verbose:
@@ -110,13 +209,27 @@ def main():
         else:
             print("config file: None")
         print("Resize Flag: ", resizeFlg)
+        print("Decode Scale: ", decodeScale)
 
     # create new roi_timeseries object for this ROIList
-    roits = ROITimeSeries(site=sitename, ROIListID=roiname, resizeFlag=resizeFlg)
+    roits = ROITimeSeries(
+        site=sitename,
+        ROIListID=roiname,
+        resizeFlag=resizeFlg,
+        decodeScale=decodeScale,
+    )
 
     # grab roi list
     roi_list = get_roi_list(sitename, roiname)
 
+    # with more than one worker create the rows in a process pool
+    if nworkers > 1:
+        pool = multiprocessing.Pool(
+            processes=nworkers, initializer=_init_worker, initargs=(roits,)
+        )
+    else:
+        pool = None
+
     # loop over mask entries in ROI list
     nimage = 0
     nupdate = 0
@@ -127,48 +240,43 @@ def main():
         maskfile = roimask["maskfile"]
 
         mask_path = os.path.join(archive_dir, sitename, "ROI", maskfile)
-        # open roi mask file
-        try:
-            mask_img = Image.open(mask_path)
-
-        except IOError:
-            sys.stderr.write("Unable to open ROI mask file\n")
-            sys.exit(1)
-
-        # check that mask_img is in expected form
-        mask_mode = mask_img.mode
-        if mask_mode != "L":
-
-            # convert to 8-bit mask
-            mask_img = mask_img.convert("L")
-
-        # make a numpy mask
-        roimask = np.asarray(mask_img, dtype=np.bool8)
+        roimask = read_roimask(mask_path)
 
         # get list of images for this timeperiod
-        imglist = utils.getsiteimglist(
+        imglist = imageindex.getsiteimglist(
             sitename, getIR=False, startDT=startDT, endDT=endDT
         )
 
         nimage += len(imglist)
 
-        for impath in imglist:
-
-            # append row for this image/mask - shouldn't get
-            # any duplicates so just append
-            roits_row = roits.append_row(impath, roimask, roimask_index + 1)
-            if roits_row:
+        # rows are created in batches (in a process pool with more
+        # than one worker).  Results come back in the same order as
+        # the image list so the rows are appended in datetime order.
+        if pool is not None:
+            tasks = _make_tasks(mask_path, roimask_index + 1, imglist, nworkers)
+            results = pool.imap(_create_rows, tasks)
+        else:
+            results = (
+                roits.create_rows(
+                    imglist[i : i + max_chunk], roimask, roimask_index + 1
+                )
+                for i in range(0, len(imglist), max_chunk)
+            )
+
+        for rows in results:
+            for roits_row in rows:
+                if not roits_row:
+                    continue
+                roits.rows.append(roits_row)
                 nupdate += 1
-            else:
-                continue
 
-            if verbose:
-                csvstr = roits.format_csvrow(roits_row)
-                print(csvstr)
+                if verbose:
+                    csvstr = roits.format_csvrow(roits_row)
+                    print(csvstr)
 
-            if debug:
-                if nupdate == 10:
-                    break
+    if pool is not None:
+        pool.close()
+        pool.join()
 
     # output CSV file
     if dryrun:
@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+
+"""
+Command line script to generate the ROI timeseries CSV files for
+several (by default all) ROIs of a site from one pass over the
+images.  Each image is decoded once for all the ROIs using it and
+each ROI timeseries file is the same as the one written by
+generate_roi_timeseries for that ROI.
+
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+
+import argparse
+import multiprocessing
+import os
+import re
+import sys
+
+# use this because numpy/openblas is automatically multi-threaded.
+os.environ["OMP_NUM_THREADS"] = "1"
+os.environ["MKL_NUM_THREADS"] = "1"
+
+import vegindex as vi
+from vegindex.roitimeseries import ROITimeSeries
+from vegindex.vegindex import get_roi_list
+
+from . import imageindex
+from .generate_roi_timeseries import max_chunk
+from .generate_roi_timeseries import read_roi_config
+from .generate_roi_timeseries import read_roimask
+
+# set vars
+
+# you can set the archive directory to somewhere else for testing by
+# using the env variable, PHENOCAM_ARCHIVE_DIR.
+archive_dir = vi.config.archive_dir
+
+# per-process state for worker processes
+_worker_roits = None
+
+
+def find_roinames(sitename):
+    """
+    Return the sorted list of ROI names with an ROI list file in the
+    ROI directory of a site.
+    """
+    roi_re = re.compile(r"^%s_([A-Za-z]+_\d+)_roi\.csv$" % (re.escape(sitename),))
+    roidir = os.path.join(archive_dir, sitename, "ROI")
+    try:
+        roifiles = os.listdir(roidir)
+    except OSError:
+        return []
+
+    return sorted(m.group(1) for m in map(roi_re.match, roifiles) if m)
+
+
+def create_site_rows(roits_list, imglist, image_rois):
+    """
+    Create the ROITimeSeries rows for a list of images for all the
+    ROIs using each image.  image_rois[i] is a list of (ROI number,
+    mask path, mask index) for imglist[i] where the ROI number is
+    the index in roits_list.  Each image is decoded once for the
+    ROIs with the same decode scale and mask size.  Returns a list
+    of lists of rows (or None for rows which couldn't be created)
+    matching image_rois.
+    """
+    if len(imglist) == 0:
+        return []
+
+    # the solar elevation only depends on the site
+    sun_elevs = roits_list[0].get_sun_elevs(imglist)
+
+    results = []
+    for impath, sun_elev, rois in zip(imglist, sun_elevs, image_rois):
+        images = {}
+        rows = []
+        for roi_number, mask_path, mask_index in rois:
+            roits = roits_list[roi_number]
+            roimask = read_roimask(mask_path)
+
+            key = roits.decode_key(roimask)
+            if key not in images:
+                images[key] = roits.decode_image(impath, roimask)
+            if images[key] is None:
+                rows.append(None)
+                continue
+
+            rows.append(
+                roits.create_row(
+                    impath,
+                    roimask,
+                    mask_index,
+                    sun_elev=float(sun_elev),
+                    im=images[key],
+                )
+            )
+        results.append(rows)
+
+    return results
+
+
+def _init_worker(roits_list):
+    """
+    Initialize a worker process with copies of the (empty)
+    ROITimeSeries objects used to create rows.
+    """
+    global _worker_roits
+    _worker_roits = roits_list
+
+
+def _create_site_rows(task):
+    """
+    Create the rows for a chunk of images for all ROIs.
+    """
+    imglist, image_rois = task
+
+    return create_site_rows(_worker_roits, imglist, image_rois)
+
+
+def main(argv=None):
+    """
+    generate the ROI timeseries for several ROIs of a site from a
+    PhenoCam directory of images
+    """
+
+    # set up command line argument processing
+    parser = argparse.ArgumentParser(
+        description="Generate the ROI timeseries for several ROIs of a site"
+    )
+
+    # options
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        help="increase output verbosity",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "-n",
+        "--dry-run",
+        help="Process data but don't save results",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        help="number of worker processes to use (default=1)",
+        type=int,
+        default=1,
+    )
+
+    # positional arguments
+    parser.add_argument("site", help="PhenoCam site name")
+    parser.add_argument(
+        "roiname",
+        nargs="*",
+        help="ROI names, e.g. DB_0001 (default all ROI lists for the site)",
+    )
+
+    # get args
+    args = parser.parse_args(argv)
+    sitename = args.site
+    roinames = args.roiname
+    verbose = args.verbose
+    dryrun = args.dry_run
+    nworkers = args.workers
+
+    if nworkers < 1:
+        sys.stderr.write("Number of workers must be at least 1\n")
+        sys.exit(1)
+
+    if not roinames:
+        roinames = find_roinames(sitename)
+        if not roinames:
+            sys.stderr.write("No ROI lists found for site {0}\n".format(sitename))
+            sys.exit(1)
+
+    if verbose:
+        print("site: {0}".format(sitename))
+        print("roinames: {0}".format(" ".join(roinames)))
+        print("verbose: {0}".format(verbose))
+        print("dryrun: {0}".format(dryrun))
+        print("workers: {0}".format(nworkers))
+        print("archive dir: {0}".format(archive_dir))
+
+    # create new roi_timeseries object for each ROIList
+    roits_list = []
+    roi_lists = []
+    for roiname in roinames:
+        resizeFlg, decodeScale = read_roi_config(sitename, roiname)
+        if verbose:
+            print("")
+            print("ROI timeseries config for {0}:".format(roiname))
+            print("Resize Flag: ", resizeFlg)
+            print("Decode Scale: ", decodeScale)
+
+        roits_list.append(
+            ROITimeSeries(
+                site=sitename,
+                ROIListID=roiname,
+                resizeFlag=resizeFlg,
+                decodeScale=decodeScale,
+            )
+        )
+        roi_lists.append(get_roi_list(sitename, roiname))
+
+    # find the ROIs (and masks) using each image.  Each ROI gets a
+    # slot for each image of each mask period so the rows end up in
+    # the same order as with generate_roi_timeseries.
+    image_rois = {}
+    image_slots = {}
+    nimage = [0] * len(roinames)
+    for roi_number, roi_list in enumerate(roi_lists):
+        for roimask_index, roimask in enumerate(roi_list.masks):
+
+            startDT = roimask["start_dt"]
+            endDT = roimask["end_dt"]
+            maskfile = roimask["maskfile"]
+
+            # make sure the mask can be read before starting
+            mask_path = os.path.join(archive_dir, sitename, "ROI", maskfile)
+            read_roimask(mask_path)
+
+            # get list of images for this timeperiod
+            imglist = imageindex.getsiteimglist(
+                sitename, getIR=False, startDT=startDT, endDT=endDT
+            )
+
+            for impath in imglist:
+                image_rois.setdefault(impath, []).append(
+                    (roi_number, mask_path, roimask_index + 1)
+                )
+                image_slots.setdefault(impath, []).append(
+                    (roi_number, nimage[roi_number])
+                )
+                nimage[roi_number] += 1
+
+    # process the images in path (datetime) order in chunks (in a
+    # process pool with more than one worker)
+    images = sorted(image_rois)
+    if nworkers > 1:
+        chunk = -(-len(images) // (nworkers * 4))
+        chunk = max(1, min(max_chunk, chunk))
+    else:
+        chunk = max_chunk
+    tasks = []
+    for i in range(0, len(images), chunk):
+        imglist = images[i : i + chunk]
+        tasks.append((imglist, [image_rois[impath] for impath in imglist]))
+
+    if nworkers > 1:
+        pool = multiprocessing.Pool(
+            processes=nworkers, initializer=_init_worker, initargs=(roits_list,)
+        )
+        results = pool.imap(_create_site_rows, tasks)
+    else:
+        pool = None
+        results = (create_site_rows(roits_list, *task) for task in tasks)
+
+    roi_rows = [[None] * n for n in nimage]
+    for (imglist, _), chunk_rows in zip(tasks, results):
+        for impath, rows in zip(imglist, chunk_rows):
+            for (roi_number, slot), roits_row in zip(image_slots[impath], rows):
+                roi_rows[roi_number][slot] = roits_row
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    print("Images read: %d" % (len(images),))
+
+    # add the rows and write the CSV file for each ROI
+    for roi_number, roiname in enumerate(roinames):
+        roits = roits_list[roi_number]
+        nupdate = 0
+        for roits_row in roi_rows[roi_number]:
+            if not roits_row:
+                continue
+            roits.rows.append(roits_row)
+            nupdate += 1
+
+            if verbose:
+                csvstr = roits.format_csvrow(roits_row)
+                print(csvstr)
+
+        # output CSV file
+        outname = "%s_%s_roistats.csv" % (sitename, roiname)
+        outpath = os.path.join(archive_dir, sitename, "ROI", outname)
+        if dryrun:
+            nout = 0
+        else:
+            nout = roits.writeCSV(outpath)
+
+        print("")
+        print("ROI: %s" % (roiname,))
+        print("Images processed: %d" % (nimage[roi_number],))
+        print("Images added to CSV: %d" % (nupdate,))
+        print("Total: %d" % (nout,))
+
+
+if __name__ == "__main__":
+    main()
@@ -50,19 +50,14 @@ from __future__ import print_function
 import argparse
 import os
 from configparser import ConfigParser as configparser
-from datetime import datetime
 from datetime import time
-from datetime import timedelta
 
 os.environ["OMP_NUM_THREADS"] = "1"
-import numpy as np
-
 import vegindex as vi
 from vegindex.gcctimeseries import GCCTimeSeries
-from vegindex.vegindex import daterange2
 from vegindex.vegindex import get_roi_timeseries
 
-from .quantile import quantile
+from . import summary
 
 # set vars
 
@@ -87,7 +82,7 @@ default_brt_min = vi.config.MIN_BRT
 default_brt_max = vi.config.MAX_BRT
 
 
-def main():
+def main(argv=None):
 
     # set up command line argument processing
     parser = argparse.ArgumentParser()
@@ -123,7 +118,7 @@ def main():
     parser.add_argument("roiname", help="ROI name, e.g. canopy_0001")
 
     # get args
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     sitename = args.site
     roiname = args.roiname
     verbose = args.verbose
@@ -238,8 +233,8 @@ def main():
         print("update date: ", roits.updated_at)
         print("nrows: ", len(roits.rows))
 
-    # make list of rows which match image selection criteria
-    roits_rows = roits.select_rows(
+    # find rows which match image selection criteria
+    index = roits.select_index(
         tod_min=time_min,
         tod_max=time_max,
         sunelev_min=sunelev_min,
@@ -248,7 +243,7 @@ def main():
     )
 
     # check that some rows passed selection criteria
-    nrows = len(roits_rows)
+    nrows = len(index)
     if nrows == 0:
         print("No rows passed the selection criteria")
         return
@@ -256,262 +251,41 @@ def main():
     if verbose:
         print("Number of selected rows: {0}".format(nrows))
 
-    # make a list of dates for selected images
-    img_date = []
-    for row in roits_rows:
-        img_date.append(row["datetime"].date())
+    # columns for the selected rows in datetime order
+    columns = dict(
+        (name, roits.get_column(name)[index])
+        for name in [
+            "datetime",
+            "filename",
+            "r_mean",
+            "g_mean",
+            "b_mean",
+            "gcc",
+            "solar_elev",
+            "awbflag",
+        ]
+    )
 
     # list is ordered so find first and last dates
-    dt_first = img_date[0]
-    dt_last = img_date[nrows - 1]
+    img_date = columns["datetime"].astype("datetime64[D]")
+    dt_first = img_date[0].item()
+    dt_last = img_date[nrows - 1].item()
     if verbose:
         print("date first: {}".format(dt_first))
         print("date last: {}".format(dt_last))
 
-    # set up a generator which yields dates for the start
-    # of the next nday period covering the date range of image
-    gcc_dr = daterange2(dt_first, dt_last, ndays)
-
-    # calculate offset for timeseries based on nday
-    day_offset = ndays / 2
-    date_offset = timedelta(days=day_offset)
-
-    # roits_ndx will be index into ROI timeseries
-    roits_ndx = 0
-
-    # set up vars for accumulating stats
-    img_cnt = 0
-    filenames = []
-    r_dn_vals = []
-    rcc_vals = []
-    g_dn_vals = []
-    gcc_vals = []
-    b_dn_vals = []
-    bcc_vals = []
-    solar_elev_vals = []
-    midday_delta_vals = []
-
-    # loop over nday time periods
-    for gcc_ndx, start_date in enumerate(gcc_dr):
-
-        end_date = start_date + timedelta(ndays)
-        gcc_date = start_date + date_offset
-        doy = gcc_date.timetuple().tm_yday
-        midday_noon = datetime(gcc_date.year, gcc_date.month, gcc_date.day, 12, 0, 0)
-
-        # get roits rows for this time period
-        while (
-            roits_ndx < nrows
-            and img_date[roits_ndx] >= start_date
-            and img_date[roits_ndx] < end_date
-        ):
-
-            # skip this row if awbflag is 1
-            if roits_rows[roits_ndx]["awbflag"] == 1:
-                if roits_ndx < nrows:
-                    roits_ndx += 1
-                    continue
-                else:
-                    break
-
-            filenames.append(roits_rows[roits_ndx]["filename"])
-            r_dn = roits_rows[roits_ndx]["r_mean"]
-            r_dn_vals.append(r_dn)
-            g_dn = roits_rows[roits_ndx]["g_mean"]
-            g_dn_vals.append(g_dn)
-            b_dn = roits_rows[roits_ndx]["b_mean"]
-            b_dn_vals.append(b_dn)
-            dnsum = r_dn + g_dn + b_dn
-
-            # NOTE: I'm recomputing gcc, rcc, bcc from DN values rather
-            # than using value stored in roistats CSV
-            if dnsum <= 0:
-                rcc = np.nan
-                bcc = np.nan
-                gcc = np.nan
-            else:
-                img_cnt += 1
-                rcc = r_dn / dnsum
-                bcc = b_dn / dnsum
-                gcc = roits_rows[roits_ndx]["gcc"]
-
-            solar_elev = roits_rows[roits_ndx]["solar_elev"]
-
-            # note that rcc_vals can include NaN's
-            rcc_vals.append(rcc)
-            gcc_vals.append(gcc)
-            bcc_vals.append(bcc)
-            solar_elev_vals.append(solar_elev)
-            midday_td = roits_rows[roits_ndx]["datetime"] - midday_noon
-            midday_td_secs = np.abs(midday_td.days * 86400 + midday_td.seconds)
-            midday_delta_vals.append(midday_td_secs)
-
-            if roits_ndx < nrows:
-                roits_ndx += 1
-            else:
-                break
-
-        # check to see if we got any (good) images
-        if img_cnt == 0:
-            # nodata for this time period
-            image_count = 0
-            midday_filename = ND_STRING
-            midday_r = ND_FLOAT
-            midday_g = ND_FLOAT
-            midday_b = ND_FLOAT
-            midday_gcc = ND_FLOAT
-            midday_rcc = ND_FLOAT
-            r_mean = ND_FLOAT
-            r_std = ND_FLOAT
-            g_mean = ND_FLOAT
-            g_std = ND_FLOAT
-            b_mean = ND_FLOAT
-            b_std = ND_FLOAT
-            gcc_mean = ND_FLOAT
-            gcc_std = ND_FLOAT
-            gcc_50 = ND_FLOAT
-            gcc_75 = ND_FLOAT
-            gcc_90 = ND_FLOAT
-            rcc_mean = ND_FLOAT
-            rcc_std = ND_FLOAT
-            rcc_50 = ND_FLOAT
-            rcc_75 = ND_FLOAT
-            rcc_90 = ND_FLOAT
-            max_solar_elev = ND_FLOAT
-            snow_flag = ND_INT
-            outlierflag_gcc_mean = ND_INT
-            outlierflag_gcc_50 = ND_INT
-            outlierflag_gcc_75 = ND_INT
-            outlierflag_gcc_90 = ND_INT
-
-        # got some good images but not enough - probably there
-        # are cases where this will fail e.g. not images on the
-        # midday of a 3-day aggregation period.
-        elif img_cnt < nimage_threshold:
-            # not enough images
-            image_count = img_cnt
-            # find nearest image to midday (noon) on mid-interval date
-            mi_ndx = midday_delta_vals.index(min(midday_delta_vals))
-            midday_filename = filenames[mi_ndx]
-            midday_r = r_dn_vals[mi_ndx]
-            midday_g = g_dn_vals[mi_ndx]
-            midday_b = b_dn_vals[mi_ndx]
-            midday_gcc = gcc_vals[mi_ndx]
-            midday_rcc = rcc_vals[mi_ndx]
-
-            # no stats for this time interval
-            r_mean = ND_FLOAT
-            r_std = ND_FLOAT
-            g_mean = ND_FLOAT
-            g_std = ND_FLOAT
-            b_mean = ND_FLOAT
-            b_std = ND_FLOAT
-            gcc_mean = ND_FLOAT
-            gcc_std = ND_FLOAT
-            gcc_50 = ND_FLOAT
-            gcc_75 = ND_FLOAT
-            gcc_90 = ND_FLOAT
-            rcc_mean = ND_FLOAT
-            rcc_std = ND_FLOAT
-            rcc_50 = ND_FLOAT
-            rcc_75 = ND_FLOAT
-            rcc_90 = ND_FLOAT
-            max_solar_elev = max(solar_elev_vals)
-            snow_flag = ND_INT
-            outlierflag_gcc_mean = ND_INT
-            outlierflag_gcc_50 = ND_INT
-            outlierflag_gcc_75 = ND_INT
-            outlierflag_gcc_90 = ND_INT
-
-        # stats for this period should be complete - only
-        # snow flags are missing data
-        else:
-            # find nearest image to midday (noon) on mid-interval date
-            mi_ndx = midday_delta_vals.index(min(midday_delta_vals))
-            midday_filename = filenames[mi_ndx]
-            midday_r = r_dn_vals[mi_ndx]
-            midday_g = g_dn_vals[mi_ndx]
-            midday_b = b_dn_vals[mi_ndx]
-            midday_gcc = gcc_vals[mi_ndx]
-            midday_rcc = rcc_vals[mi_ndx]
-
-            # get stats for this time interval
-            image_count = img_cnt
-            r_mean = np.nanmean(r_dn_vals)
-            r_std = np.nanstd(r_dn_vals)
-            g_mean = np.nanmean(g_dn_vals)
-            g_std = np.nanstd(g_dn_vals)
-            b_mean = np.nanmean(b_dn_vals)
-            b_std = np.nanstd(b_dn_vals)
-            gcc_mean = np.nanmean(gcc_vals)
-            gcc_std = np.nanstd(gcc_vals)
-            gcc_50 = quantile(gcc_vals, 0.5)
-            gcc_75 = quantile(gcc_vals, 0.75)
-            gcc_90 = quantile(gcc_vals, 0.9)
-            rcc_mean = np.nanmean(rcc_vals)
-            rcc_std = np.nanstd(rcc_vals)
-            rcc_50 = quantile(rcc_vals, 0.5)
-            rcc_75 = quantile(rcc_vals, 0.75)
-            rcc_90 = quantile(rcc_vals, 0.9)
-            max_solar_elev = max(solar_elev_vals)
-            snow_flag = ND_INT
-            outlierflag_gcc_mean = ND_INT
-            outlierflag_gcc_50 = ND_INT
-            outlierflag_gcc_75 = ND_INT
-            outlierflag_gcc_90 = ND_INT
+    # calculate the summary values for each nday period covering
+    # the date range of the images
+    for summary_row in summary.gcc_summary_rows(columns, ndays, nimage_threshold):
 
         # append to gcc timeseries
-        gcc_ts_row = gcc_ts.insert_row(
-            gcc_date,
-            doy,
-            image_count,
-            midday_filename,
-            midday_r,
-            midday_g,
-            midday_b,
-            midday_gcc,
-            midday_rcc,
-            r_mean,
-            r_std,
-            g_mean,
-            g_std,
-            b_mean,
-            b_std,
-            gcc_mean,
-            gcc_std,
-            gcc_50,
-            gcc_75,
-            gcc_90,
-            rcc_mean,
-            rcc_std,
-            rcc_50,
-            rcc_75,
-            rcc_90,
-            max_solar_elev,
-            snow_flag,
-            outlierflag_gcc_mean,
-            outlierflag_gcc_50,
-            outlierflag_gcc_75,
-            outlierflag_gcc_90,
-        )
+        gcc_ts_row = gcc_ts.insert_row(**summary_row)
 
         # print(result if verbose)
         if verbose:
             csvstr = gcc_ts.format_csvrow(gcc_ts_row)
             print(csvstr)
 
-        # reset accumulated values
-        img_cnt = 0
-        filenames = []
-        r_dn_vals = []
-        rcc_vals = []
-        g_dn_vals = []
-        gcc_vals = []
-        b_dn_vals = []
-        bcc_vals = []
-        solar_elev_vals = []
-        midday_delta_vals = []
-
     if dryrun:
         nout = 0
     else:
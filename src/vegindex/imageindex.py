@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+
+"""
+Persistent per-site index of the images in the archive.
+
+Listing every year/month directory of a site (and checking every
+file) is slow on network file systems.  The index stores the sorted
+image file names for each YYYY/MM directory along with the directory
+modification time.  When the index is used only directories whose
+modification time has changed are listed again and image lists for
+a datetime range are found by binary search.
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import json
+import os
+import re
+import stat
+import sys
+import time
+from bisect import bisect_left
+from bisect import bisect_right
+from datetime import datetime
+
+from . import config
+from . import utils
+
+# version of the index file format
+INDEX_VERSION = 1
+
+# directories modified less than this many seconds before they are
+# listed are listed again next time (mtime resolution can be coarse)
+MTIME_SLOP = 2.0
+
+# indexes already loaded by this process
+_site_indexes = {}
+
+
+def _dt_key(dt):
+    """
+    return an integer key (YYYYMMDDhhmmss) for a datetime
+    """
+    return (
+        dt.year * 10000000000
+        + dt.month * 100000000
+        + dt.day * 1000000
+        + dt.hour * 10000
+        + dt.minute * 100
+        + dt.second
+    )
+
+
+def get_index_path(sitename):
+    """
+    return the path of the image index file for a site.  By default
+    the index is kept in the site directory but it can be put
+    somewhere else by setting config.image_index_dir.
+    """
+    index_file = "{0}_image_index.json".format(sitename)
+    if config.image_index_dir:
+        return os.path.join(config.image_index_dir, index_file)
+
+    return os.path.join(config.archive_dir, sitename, index_file)
+
+
+class ImageIndex(object):
+    """
+    Class for the index of images for a site.  For each month
+    directory (key "YYYY/MM") the index holds the directory mtime
+    and for RGB and IR images a list of [datetime key, filename]
+    pairs sorted by filename.  The "ordered" flag is set if the
+    pairs are also sorted by datetime.
+    """
+
+    def __init__(self, sitename, index_path=None):
+        """
+        create ImageIndex object and read the index file if it
+        exists
+        """
+        self.site = sitename
+        self.sitepath = os.path.join(config.archive_dir, sitename)
+        if index_path is None:
+            index_path = get_index_path(sitename)
+        self.index_path = index_path
+        self.months = {}
+        self.modified = False
+
+        self.read()
+
+    def read(self):
+        """
+        read the index file.  A missing or unreadable index file
+        just gives an empty index.
+        """
+        try:
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+
+        # make sure the index is for this site in this archive
+        if index.get("version") != INDEX_VERSION:
+            return
+        if index.get("site") != self.site or index.get("sitepath") != self.sitepath:
+            return
+
+        self.months = index["months"]
+
+    def write(self):
+        """
+        write the index file if it has been modified.  The file is
+        written to a temporary file and then renamed so readers never
+        see a partial index.  Failure to write the index is not
+        fatal.
+        """
+        if not self.modified:
+            return
+
+        index = {
+            "version": INDEX_VERSION,
+            "site": self.site,
+            "sitepath": self.sitepath,
+            "months": self.months,
+        }
+        tmp_path = "{0}.{1}.tmp".format(self.index_path, os.getpid())
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(index, f, separators=(",", ":"))
+            os.replace(tmp_path, self.index_path)
+        except (IOError, OSError) as e:
+            errmsg = "Unable to write image index {0}: {1}\n"
+            sys.stderr.write(errmsg.format(self.index_path, e))
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+
+        self.modified = False
+
+    def _list_month(self, yeardir, mondir, monpath):
+        """
+        list a month directory and return a dictionary of RGB and
+        IR image [datetime key, filename] pairs.
+        """
+        rgb_re = re.compile(r"^%s_%s_%s_.*\.jpg$" % (self.site, yeardir, mondir))
+        ir_re = re.compile(r"^%s_IR_%s_%s_.*\.jpg$" % (self.site, yeardir, mondir))
+
+        rgb = []
+        ir = []
+        for entry in os.scandir(monpath):
+            imgfile = entry.name
+            if rgb_re.match(imgfile):
+                imglist = rgb
+                irFlag = False
+            elif ir_re.match(imgfile):
+                imglist = ir
+                irFlag = True
+            else:
+                continue
+
+            # only add regular files
+            if entry.is_dir():
+                continue
+
+            try:
+                img_dt = utils.fn2datetime(self.site, imgfile, irFlag=irFlag)
+            except ValueError:
+                continue
+
+            imglist.append([_dt_key(img_dt), imgfile])
+
+        rgb.sort(key=lambda x: x[1])
+        ir.sort(key=lambda x: x[1])
+
+        # for standard file names sorting by name also sorts by
+        # datetime so we can use a binary search in query()
+        ordered = all(
+            imglist[i][0] <= imglist[i + 1][0]
+            for imglist in (rgb, ir)
+            for i in range(len(imglist) - 1)
+        )
+
+        return {"rgb": rgb, "ir": ir, "ordered": ordered}
+
+    def refresh(self, startDT=datetime(1990, 1, 1, 0, 0, 0), endDT=None):
+        """
+        bring the index up to date for the months between startDT
+        and endDT.  Only month directories which are new or have
+        been modified are listed.
+        """
+        if endDT is None:
+            endDT = datetime.now()
+
+        start_ym = (startDT.year, startDT.month)
+        end_ym = (endDT.year, endDT.month)
+
+        found = set()
+        if os.path.isdir(self.sitepath):
+            for yeardir in os.listdir(self.sitepath):
+                if not utils.YEAR_RE.match(yeardir):
+                    continue
+                year = int(yeardir)
+                if year < startDT.year or year > endDT.year:
+                    continue
+
+                yearpath = os.path.join(self.sitepath, yeardir)
+                if not os.path.isdir(yearpath):
+                    continue
+
+                for mondir in os.listdir(yearpath):
+                    if not utils.MONTH_RE.match(mondir):
+                        continue
+                    month = int(mondir)
+                    if month < 1 or month > 12:
+                        continue
+                    if (year, month) < start_ym or (year, month) > end_ym:
+                        continue
+
+                    monpath = os.path.join(yearpath, mondir)
+                    try:
+                        st = os.stat(monpath)
+                    except OSError:
+                        continue
+                    if not stat.S_ISDIR(st.st_mode):
+                        continue
+
+                    key = "{0}/{1}".format(yeardir, mondir)
+                    found.add(key)
+
+                    month_index = self.months.get(key)
+                    if month_index is not None and month_index["mtime"] == st.st_mtime:
+                        continue
+
+                    try:
+                        month_index = self._list_month(yeardir, mondir, monpath)
+                    except OSError as e:
+                        errstring = "Python OSError: %s" % (e,)
+                        print(errstring)
+                        continue
+
+                    # a directory modified very recently might change
+                    # again within the mtime resolution so make sure it
+                    # will be listed next time.
+                    if time.time() - st.st_mtime < MTIME_SLOP:
+                        month_index["mtime"] = None
+                    else:
+                        month_index["mtime"] = st.st_mtime
+
+                    self.months[key] = month_index
+                    self.modified = True
+
+        # drop months in the range which no longer exist
+        for key in list(self.months.keys()):
+            ym = (int(key[0:4]), int(key[5:7]))
+            if start_ym <= ym <= end_ym and key not in found:
+                del self.months[key]
+                self.modified = True
+
+    def query(self, startDT=datetime(1990, 1, 1, 0, 0, 0), endDT=None, getIR=False):
+        """
+        return a sorted list of image paths for images with
+        startDT <= image datetime <= endDT.  Call refresh() first to
+        make sure the index is up to date.
+        """
+        if endDT is None:
+            endDT = datetime.now()
+
+        start_key = _dt_key(startDT)
+        end_key = _dt_key(endDT)
+        start_ym = "{0:04d}/{1:02d}".format(startDT.year, startDT.month)
+        end_ym = "{0:04d}/{1:02d}".format(endDT.year, endDT.month)
+        imgtype = "ir" if getIR else "rgb"
+
+        imglist = []
+        for key in sorted(self.months.keys()):
+            if key < start_ym or key > end_ym:
+                continue
+
+            monpath = os.path.join(self.sitepath, key[0:4], key[5:7])
+            entries = self.months[key][imgtype]
+            if self.months[key]["ordered"]:
+                dt_keys = [entry[0] for entry in entries]
+                i0 = bisect_left(dt_keys, start_key)
+                i1 = bisect_right(dt_keys, end_key)
+                selected = entries[i0:i1]
+            else:
+                selected = [e for e in entries if start_key <= e[0] <= end_key]
+
+            imglist.extend([os.path.join(monpath, e[1]) for e in selected])
+
+        return imglist
+
+
+def get_image_index(sitename):
+    """
+    return the ImageIndex for a site, reading it from the index file
+    the first time it is needed in this process.
+    """
+    index = _site_indexes.get(sitename)
+    if (
+        index is None
+        or index.index_path != get_index_path(sitename)
+        or index.sitepath != os.path.join(config.archive_dir, sitename)
+    ):
+        index = ImageIndex(sitename)
+        _site_indexes[sitename] = index
+
+    return index
+
+
+def getsiteimglist(
+    sitename, startDT=datetime(1990, 1, 1, 0, 0, 0), endDT=None, getIR=False
+):
+    """
+    Returns a list of imagepath names for images in the archive for
+    the specified site using the site image index.  This returns the
+    same list as utils.getsiteimglist() but only lists directories
+    which have changed since the index was last updated.  Optional
+    arguments:
+      getIR   : If set to true only return IR images.
+      startDT : Start datetime for image list
+      endDT   : End datetime for image list (default is now)
+    """
+    if endDT is None:
+        endDT = datetime.now()
+
+    sitepath = os.path.join(config.archive_dir, sitename)
+    if not os.path.exists(sitepath):
+        return []
+
+    index = get_image_index(sitename)
+    index.refresh(startDT=startDT, endDT=endDT)
+    index.write()
+
+    return index.query(startDT=startDT, endDT=endDT, getIR=getIR)
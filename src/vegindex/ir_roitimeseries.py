@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function
 
-import csv
 import os
 import re
 import sys
@@ -10,115 +9,95 @@ from datetime import datetime
 import numpy as np
 from PIL import Image
 
+from . import columnar
 from . import config
+from . import csvreader
+from . import roistats
 from . import utils
+from .roimask import mask_info
 
 ND_FLOAT = config.ND_FLOAT
 ND_INT = config.ND_INT
 ND_STRING = config.ND_STRING
 
 
-def _float_or_none(str):
-    """
-    Try to convert string to float. Return float or None value if a
-    ValueError exception is raised.
-    """
-    try:
-        retval = float(str)
-    except ValueError:
-        retval = ND_FLOAT
-
-    if retval == -9999.0:
-        retval = ND_FLOAT
-
-    return retval
-
-
-def _int_or_none(str):
-    """
-    Try to convert string to integer. Return int or None value
-    if ValueError is raised.
-    """
-    try:
-        retval = int(str)
-    except ValueError:
-        retval = ND_INT
-
-    if retval == -9999:
-        retval = ND_INT
-
-    return retval
+# types of the numeric columns in an IR ROI timeseries CSV file
+IR_COLUMN_KINDS = {
+    "solar_elev": csvreader.FLOAT,
+    "exposure": csvreader.INT,
+    "awbflag": csvreader.INT,
+    "mask_index": csvreader.INT,
+    "ir_mean": csvreader.FLOAT,
+    "ir_std": csvreader.FLOAT,
+    "ir_5_qtl": csvreader.FLOAT,
+    "ir_10_qtl": csvreader.FLOAT,
+    "ir_25_qtl": csvreader.FLOAT,
+    "ir_50_qtl": csvreader.FLOAT,
+    "ir_75_qtl": csvreader.FLOAT,
+    "ir_90_qtl": csvreader.FLOAT,
+    "ir_95_qtl": csvreader.FLOAT,
+}
+
+# columns used for image selection
+IR_SELECT_COLUMNS = [
+    ("datetime", columnar.DATETIME),
+    ("ir_mean", columnar.FLOAT),
+    ("solar_elev", columnar.FLOAT),
+]
 
 
 ######################################################################
 
 
-def get_roi_IR_stats(im, roimask):
+def get_roi_IR_stats(im, roimask, decoded=None):
     """
     Function to return a more extensive collection of stats for DN
-    values for an IR image / mask pair.  NOTE: probably move this to
-    utils.py.
+    values for an IR image / mask pair.  Only the part of the image
+    within the bounding box of the ROI is converted to an array and
+    the stats for the IR band are calculated from a 256 bin
+    histogram of the ROI pixels (see roistats.py).  If decoded (the
+    roimask.DecodedMask for the mask) is passed its bounding box and
+    ROI pixel index are used rather than finding them from the mask.
     """
 
-    # split into bands (for IR images all the bands should be the same.)
-    try:
-        (im_ir, im_2, im_3) = im.split()
-    except ValueError:
+    # we need a 3-band 8-bit image (for IR images all the bands
+    # should be about the same.)
+    if len(im.getbands()) != 3:
         sys.stderr.write("Wrong image type\n")
         return None
 
-    # create numpy arrays with bands
-    ir_array = np.asarray(im_ir, dtype=np.int16)
-    array_2 = np.asarray(im_2, dtype=np.int16)
-    array_3 = np.asarray(im_3, dtype=np.int16)
-    brt_array = ir_array + array_2 + array_3
-
     # check that the image isn't nearly all black or all white in
     # which case getting the stats fails.  Eliminate the outer 30
     # pixels in case there is a banner/overlay on the image.
     #
-    # NOTE: this is using almost entire image not just ROI
+    # NOTE: this is using (a subsample of) almost entire image not
+    # just ROI.  The bands of a decoded IR JPEG are not exactly the
+    # same so the sum of all three is used.
+    brt_mean = roistats.image_brightness(im)
 
-    if brt_array[30:-30, 30:-30].mean() < 30.0:
+    if brt_mean < 30.0:
         warningstr = "WARNING: mostly dark image.\n"
         sys.stderr.write(warningstr)
-        ir_mean = ND_FLOAT
-        ir_std = ND_FLOAT
         ir_pcts = [ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT]
-        return {"mean": ir_mean, "stdev": ir_std, "percentiles": ir_pcts}
+        return {"mean": ND_FLOAT, "stdev": ND_FLOAT, "percentiles": ir_pcts}
 
-    if brt_array[30:-30, 30:-30].mean() > 725.0:
+    if brt_mean > 725.0:
         warningstr = "WARNING: mostly white image.\n"
         sys.stderr.write(warningstr)
-        ir_mean = ND_FLOAT
-        ir_std = ND_FLOAT
         ir_pcts = [ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT]
-        return {"mean": ir_mean, "stdev": ir_std, "percentiles": ir_pcts}
-
-    # try applying mask to ir image ... if mask and image don't
-    # have same size this will raise an exception.
-    try:
-        ir_ma = np.ma.array(ir_array, mask=roimask)
-    except Exception as inst:
-        print(inst)
+        return {"mean": ND_FLOAT, "stdev": ND_FLOAT, "percentiles": ir_pcts}
+
+    # check that mask and image have the same size
+    if np.shape(roimask)[0:2] != (im.size[1], im.size[0]):
         errstr = "Error applying mask to image file.\n"
         sys.stderr.write(errstr)
         return None
 
-    # find mean and std values
-    ir_vals = ir_ma.compressed()
-    ir_mean = ir_vals.mean()
-    ir_diff = np.float64(ir_vals) - ir_mean
-    ir_std = np.sqrt(np.dot(ir_diff, ir_diff) / ir_vals.size)
-
-    # calculate percentiles for each array
-    ir_pcts = np.percentile(ir_vals, (5.0, 10.0, 25.0, 50.0, 75.0, 90.0, 95.0))
+    if decoded is None:
+        decoded = mask_info(roimask)
 
-    # if the above calculation can return a NaN then
-    # I should probably trap that here and return a
-
-    # return list of values
-    return {"mean": ir_mean, "stdev": ir_std, "percentiles": ir_pcts}
+    im_array = decoded.crop_image(im)
+    return roistats.ir_roi_stats(im_array, decoded.crop_index())
 
 
 ######################################################################
@@ -154,26 +133,6 @@ def get_im_metadata(impath):
 ######################################################################
 
 
-def _filter_comments(f):
-    """
-    filter comments from csv file
-    """
-    for line in f:
-        line = line.rstrip()
-        if line and not line.startswith("#"):
-            yield line
-
-
-def _get_comments(f):
-    """
-    return JUST the comment lines from a csv file
-    """
-    for line in f:
-        line = line.rstrip()
-        if line and line.startswith("#"):
-            yield line
-
-
 def _get_comment_field(comments, var_string):
     """
     return value of a field from a list of comment lines
@@ -250,6 +209,18 @@ class IRROITimeSeries(object):
         self.updated_at = datetime.now()
         self.rows = []
 
+        # number of rows passing each selection criterion from the
+        # last call to select_index()
+        self.selection_counts = None
+
+        # datetime of the first row read for a partial timeseries
+        # read with readCSV(since=...), None if all rows were read
+        self.since = None
+
+        # cache of the decoded mask info for the last mask used
+        self._roimask = None
+        self._mask_info = None
+
         # split ROIListID into roitype, and sequence_number
         roitype, sequence_number = ROIListID.split("_")
         self.roitype = roitype
@@ -278,6 +249,18 @@ class IRROITimeSeries(object):
 
         return imglist
 
+    def _get_mask_info(self, roimask):
+        """
+        return the roimask.DecodedMask (with the bounding box and
+        index of the ROI pixels) for a mask.  It is only looked up
+        again when a different mask is passed.
+        """
+        if roimask is not self._roimask:
+            self._mask_info = mask_info(roimask)
+            self._roimask = roimask
+
+        return self._mask_info
+
     def create_row(self, impath, roimask, mask_index):
         """
         create an IR ROITimeSeries row dictionary for a given image and
@@ -322,7 +305,9 @@ class IRROITimeSeries(object):
         # find mean values over ROI
         try:
             # [dn_r, dn_g, dn_b, brt] = get_dn_means(im, roimask)
-            roistats_list = get_roi_IR_stats(im, roimask)
+            roistats_list = get_roi_IR_stats(
+                im, roimask, decoded=self._get_mask_info(roimask)
+            )
 
         except KeyboardInterrupt:
             sys.exit()
@@ -479,12 +464,21 @@ class IRROITimeSeries(object):
 
         return csvstr
 
-    def writeCSV(self, file=""):
+    def writeCSV(self, file="", sidecar=None):
         """
         Method for writing an IRROITimeSeries to CSV file.  The method
         opens the file for writing.  If no filename is passed
-        then write to stdout.
+        then write to stdout.  A partial timeseries (see readCSV())
+        can't be written.  If sidecar is True (or None and
+        config.write_sidecar is set) a binary sidecar file is also
+        written (see csvreader.write_sidecar()).
         """
+        if self.since is not None:
+            errmsg = "Partial timeseries (rows since {0}) can't be written".format(
+                self.since
+            )
+            raise ValueError(errmsg)
+
         if file == "":
             fo = sys.stdout
         else:
@@ -549,9 +543,40 @@ class IRROITimeSeries(object):
         # close output
         if not file == "":
             fo.close()
+            if sidecar or (sidecar is None and config.write_sidecar):
+                csvreader.write_sidecar(file, IR_COLUMN_KINDS)
 
         return nout
 
+    def select_index(
+        self,
+        tod_min=config.TIME_MIN,
+        tod_max=config.TIME_MAX,
+        sunelev_min=config.MIN_SUN_ANGLE,
+        brt_min=config.MIN_BRT,
+        brt_max=config.MAX_BRT,
+    ):
+        """
+        return an array of the indices (in datetime order) of the
+        rows in self.rows which meet the selection criteria for
+        brightness, solar elevation and time of day.  The number of
+        rows passing each criterion is saved in self.selection_counts.
+        """
+        columns = columnar.ColumnStore.from_rows(IR_SELECT_COLUMNS, self.rows).columns
+        brt = columns["ir_mean"] * 3
+        index, self.selection_counts = columnar.select_index(
+            columns["datetime"],
+            brt,
+            columns["solar_elev"],
+            tod_min,
+            tod_max,
+            sunelev_min,
+            brt_min,
+            brt_max,
+        )
+
+        return index
+
     def select_rows(
         self,
         tod_min=config.TIME_MIN,
@@ -561,42 +586,34 @@ class IRROITimeSeries(object):
         brt_max=config.MAX_BRT,
     ):
         """
-        routine to return a list of the rows in self.rows
-        which meet the selection criteria for brightness
-        and time of day.  Numpy probably has a better (i.e. faster)
-        way to do this. Also remove rows where thie image is
-        completely black.
+        routine to return a list of the rows in self.rows which meet
+        the selection criteria for brightness and time of day (see
+        select_index()) sorted by datetime.
         """
-        selected_rows = []
-        for row in self.rows:
-            brt = row["ir_mean"] * 3
-            if (
-                (row["datetime"].time() < tod_min)
-                or (row["datetime"].time() > tod_max)
-                or (brt < brt_min)
-                or (brt > brt_max)
-                or (row["solar_elev"] < sunelev_min)
-            ):
-                continue
-            else:
-                selected_rows.append(row)
-
-        rows = sorted(selected_rows, key=lambda k: k["datetime"])
-
-        return rows
-
-    def readCSV(self, roiTimeSeriesPath):
+        index = self.select_index(
+            tod_min=tod_min,
+            tod_max=tod_max,
+            sunelev_min=sunelev_min,
+            brt_min=brt_min,
+            brt_max=brt_max,
+        )
+
+        return [self.rows[i] for i in index]
+
+    def readCSV(self, roiTimeSeriesPath, since=None, sidecar=False):
         """
         Method to read ROITimeSeries object from CSV file and return
         a ROITimeSeries object.  If the comment fields are not present
-        they must be set before the object can be written.
+        they must be set before the object can be written.  If since
+        (a datetime) is given only rows at or after since are read.
+        If sidecar is True the columns are loaded from an up to date
+        binary sidecar file if there is one.
         """
 
-        # open file for reading
-        f = open(roiTimeSeriesPath, "r")
-
-        # get comment lines
-        comments = list(_get_comments(f))
+        # read comment lines and data columns
+        comments, columns = csvreader.read_csv(
+            roiTimeSeriesPath, IR_COLUMN_KINDS, since=since, sidecar=sidecar
+        )
 
         # no validation applied to sitename
         site = _get_comment_field(comments, "Site")
@@ -648,53 +665,13 @@ class IRROITimeSeries(object):
 
         # do I need to grab lat, lon, elev and tzoffset?  Probably!
 
-        # get timeseries rows
-        f.seek(0)
-        csvrdr = csv.DictReader(_filter_comments(f))
-
-        roitsRows = []
-        for row in csvrdr:
-
-            # turn date and time strings into datetime values
-            (im_yr, im_mo, im_dom) = row["date"].split("-")
-            (im_hr, im_min, im_sec) = row["local_std_time"].split(":")
-            im_dt = datetime(
-                int(im_yr),
-                int(im_mo),
-                int(im_dom),
-                int(im_hr),
-                int(im_min),
-                int(im_sec),
+        # turn date and time strings into datetime values.  Missing
+        # numeric columns (e.g. awbflag or exposure in older files)
+        # are filled with no-data values.
+        if columns and "datetime" not in columns:
+            columns["datetime"] = csvreader.datetime_column(
+                columns["date"], columns["local_std_time"]
             )
 
-            row["datetime"] = im_dt
-
-            # check for awbflag
-            if "awbflag" not in row.keys():
-                row["awbflag"] = ND_INT
-
-            # check for exposure
-            if "exposure" not in row.keys():
-                row["exposure"] = ND_INT
-
-            # convert strings to numbers - there's got to be a more
-            # efficient way to do this!
-            row["solar_elev"] = _float_or_none(row["solar_elev"])
-            row["exposure"] = _int_or_none(_float_or_none(row["exposure"]))
-            row["awbflag"] = _int_or_none(_float_or_none(row["awbflag"]))
-            row["mask_index"] = _int_or_none(row["mask_index"])
-            row["ir_mean"] = _float_or_none(row["ir_mean"])
-            row["ir_std"] = _float_or_none(row["ir_std"])
-            row["ir_5_qtl"] = _float_or_none(row["ir_5_qtl"])
-            row["ir_10_qtl"] = _float_or_none(row["ir_10_qtl"])
-            row["ir_25_qtl"] = _float_or_none(row["ir_25_qtl"])
-            row["ir_50_qtl"] = _float_or_none(row["ir_50_qtl"])
-            row["ir_75_qtl"] = _float_or_none(row["ir_75_qtl"])
-            row["ir_90_qtl"] = _float_or_none(row["ir_90_qtl"])
-            row["ir_95_qtl"] = _float_or_none(row["ir_95_qtl"])
-            roitsRows.append(row)
-
-        # do I need to sort here?
-
-        self.rows = roitsRows
-        f.close()
+        self.rows = csvreader.columns_to_rows(columns)
+        self.since = since
@@ -4,36 +4,43 @@ from __future__ import print_function
 import csv
 import re
 import sys
-from datetime import date
 from datetime import datetime
 from datetime import time
 
+import numpy as np
+
 from . import config
+from . import csvreader
 from . import utils
 
 ND_STRING = config.ND_STRING
 ND_FLOAT = config.ND_FLOAT
 ND_INT = config.ND_INT
 
-
-def _filter_comments(f):
-    """
-    filter comments from csv file
-    """
-    for line in f:
-        line = line.rstrip()
-        if line and not line.startswith("#"):
-            yield line
-
-
-def _get_comments(f):
-    """
-    return JUST the comment lines from a csv file
-    """
-    for line in f:
-        line = line.rstrip()
-        if line and line.startswith("#"):
-            yield line
+# columns of an NDVI summary timeseries CSV file which are set to
+# no-data for days with no images
+NDVI_DAILY_COLUMNS = ["midday_ndvi", "ndvi_mean", "ndvi_std"]
+
+# columns which are set to no-data for days with fewer than the
+# minimum number of images
+NDVI_STATS_COLUMNS = ["ndvi_50", "ndvi_75", "ndvi_90", "max_solar_elev"]
+NDVI_FLAG_COLUMNS = [
+    "snow_flag",
+    "outlierflag_ndvi_mean",
+    "outlierflag_ndvi_50",
+    "outlierflag_ndvi_75",
+    "outlierflag_ndvi_90",
+]
+
+# types of the numeric columns in an NDVI summary timeseries CSV file
+NDVI_COLUMN_KINDS = {
+    "doy": csvreader.INT,
+    "image_count": csvreader.INT,
+    "gcc_90": csvreader.FLOAT,
+}
+NDVI_COLUMN_KINDS.update((name, csvreader.FLOAT) for name in NDVI_DAILY_COLUMNS)
+NDVI_COLUMN_KINDS.update((name, csvreader.FLOAT) for name in NDVI_STATS_COLUMNS)
+NDVI_COLUMN_KINDS.update((name, csvreader.INT) for name in NDVI_FLAG_COLUMNS)
 
 
 def _get_comment_field(comments, var_string):
@@ -68,38 +75,6 @@ def _get_comment_field(comments, var_string):
     return var_value
 
 
-def _float_or_none(str):
-    """
-    Try to convert string to float. Return float or None value if a
-    ValueError exception is raised.
-    """
-    try:
-        retval = float(str)
-    except ValueError:
-        retval = ND_FLOAT
-
-    if retval == -9999.0:
-        retval = ND_FLOAT
-
-    return retval
-
-
-def _int_or_none(str):
-    """
-    Try to convert string to integer. Return int or None value
-    if ValueError is raised.
-    """
-    try:
-        retval = int(str)
-    except ValueError:
-        retval = ND_INT
-
-    if retval == -9999:
-        retval = ND_INT
-
-    return retval
-
-
 class NDVISummaryTimeSeries(object):
     """
     Class for CSV version of NDVI summary timeseries.
@@ -180,17 +155,18 @@ class NDVISummaryTimeSeries(object):
         self.elev = si["elev"]
         self.tzoffset = si["tzoffset"]
 
-    def readCSV(self, ndvi_summary_path):
+    def readCSV(self, ndvi_summary_path, sidecar=False):
         """
         Method to read NDVISummaryTimeSeries object from CSV file and return
-        a NDVISummaryTimeSeries object.
+        a NDVISummaryTimeSeries object.  If sidecar is True the
+        columns are loaded from an up to date binary sidecar file if
+        there is one.
         """
 
-        # open file for reading
-        f = open(ndvi_summary_path, "r")
-
-        # get comment lines
-        comments = list(_get_comments(f))
+        # read comment lines and data columns
+        comments, columns = csvreader.read_csv(
+            ndvi_summary_path, NDVI_COLUMN_KINDS, sidecar=sidecar
+        )
 
         # no validation applied to sitename
         site = _get_comment_field(comments, "Site")
@@ -276,79 +252,34 @@ class NDVISummaryTimeSeries(object):
                 print("Invalid update date or time in CSV.")
 
         # get timeseries rows
-        f.seek(0)
-        csvrdr = csv.DictReader(_filter_comments(f))
-
-        ndvisummary_rows = []
-        for row in csvrdr:
-
-            # convert date string to date object
-            [yr_str, mo_str, dom_str] = row["date"].split("-")
-            ndvi_date = date(int(yr_str), int(mo_str), int(dom_str))
-            row["date"] = ndvi_date
-            row["year"] = ndvi_date.year
-
-            # turn strings to numbers checking for empty/missing and
-            # no-data values
-            row["image_count"] = int(row["image_count"])
-
-            if row["image_count"] == 0:
-                row["doy"] = _int_or_none(row["doy"])
-                row["midday_rgb_filename"] = ND_STRING
-                row["midday_ir_filename"] = ND_STRING
-                row["midday_ndvi"] = ND_FLOAT
-                row["gcc_mean"] = ND_FLOAT
-                row["ndvi_mean"] = ND_FLOAT
-                row["ndvi_std"] = ND_FLOAT
-                row["ndvi_50"] = ND_FLOAT
-                row["ndvi_75"] = ND_FLOAT
-                row["ndvi_90"] = ND_FLOAT
-                row["max_solar_elev"] = ND_FLOAT
-                row["snow_flag"] = ND_INT
-                row["outlierflag_ndvi_mean"] = ND_INT
-                row["outlierflag_ndvi_50"] = ND_INT
-                row["outlierflag_ndvi_75"] = ND_INT
-                row["outlierflag_ndvi_90"] = ND_INT
-
-            elif row["image_count"] < self.nmin:
-                row["doy"] = _int_or_none(row["doy"])
-                if not row["midday_rgb_filename"]:
-                    row["midday_rgb_filename"] = ND_STRING
-                if not row["midday_ir_filename"]:
-                    row["midday_ir_filename"] = ND_STRING
-                row["midday_ndvi"] = _float_or_none(row["midday_ndvi"])
-                row["gcc_90"] = _float_or_none(row["gcc_90"])
-                row["ndvi_mean"] = _float_or_none(row["ndvi_mean"])
-                row["ndvi_std"] = _float_or_none(row["ndvi_std"])
-                row["ndvi_50"] = ND_FLOAT
-                row["ndvi_75"] = ND_FLOAT
-                row["ndvi_90"] = ND_FLOAT
-                row["max_solar_elev"] = ND_FLOAT
-                row["snow_flag"] = ND_INT
-                row["outlierflag_ndvi_mean"] = ND_INT
-                row["outlierflag_ndvi_50"] = ND_INT
-                row["outlierflag_ndvi_75"] = ND_INT
-                row["outlierflag_ndvi_90"] = ND_INT
-
-            else:
-                row["doy"] = _int_or_none(row["doy"])
-                row["midday_ndvi"] = _float_or_none(row["midday_ndvi"])
-                row["gcc_90"] = _float_or_none(row["gcc_90"])
-                row["ndvi_mean"] = _float_or_none(row["ndvi_mean"])
-                row["ndvi_std"] = _float_or_none(row["ndvi_std"])
-                row["ndvi_50"] = _float_or_none(row["ndvi_50"])
-                row["ndvi_75"] = _float_or_none(row["ndvi_75"])
-                row["ndvi_90"] = _float_or_none(row["ndvi_90"])
-                row["max_solar_elev"] = _float_or_none(row["max_solar_elev"])
-                row["snow_flag"] = _int_or_none(row["snow_flag"])
-                row["outlierflag_ndvi_mean"] = _int_or_none(
-                    row["outlierflag_ndvi_mean"]
-                )
-                row["outlierflag_ndvi_50"] = _int_or_none(row["outlierflag_ndvi_50"])
-                row["outlierflag_ndvi_75"] = _int_or_none(row["outlierflag_ndvi_75"])
-                row["outlierflag_ndvi_90"] = _int_or_none(row["outlierflag_ndvi_90"])
-
-            ndvisummary_rows.append(row)
+        if not columns:
+            self.rows = []
+            return
+
+        # convert date strings to date values
+        ndvi_dates = csvreader.date_column(columns["date"])
+        columns["date"] = ndvi_dates
+        columns["year"] = ndvi_dates.astype("datetime64[Y]").astype(np.int64) + 1970
+
+        # set no-data values for days with no images or with fewer
+        # than the minimum number of images
+        no_images = columns["image_count"] == 0
+        too_few = columns["image_count"] < self.nmin
+        for name in NDVI_DAILY_COLUMNS:
+            columns[name][no_images] = np.nan
+        for name in NDVI_STATS_COLUMNS:
+            columns[name][too_few] = np.nan
+        for name in NDVI_FLAG_COLUMNS:
+            columns[name][too_few] = csvreader.ND_INT_VALUE
+
+        for name in ["midday_rgb_filename", "midday_ir_filename"]:
+            midday_filename = columns[name]
+            no_filename = no_images | (too_few & (midday_filename == ""))
+            midday_filename[no_filename] = ND_STRING
+
+        ndvisummary_rows = csvreader.columns_to_rows(columns)
+        for i in np.flatnonzero(no_images):
+            ndvisummary_rows[i]["gcc_mean"] = ND_FLOAT
 
         self.rows = ndvisummary_rows
 
@@ -482,11 +413,13 @@ class NDVISummaryTimeSeries(object):
 
         return csvstr
 
-    def writeCSV(self, file=""):
+    def writeCSV(self, file="", sidecar=None):
         """
         Method for writing NDVISummaryTimeSeries to CSV file.  The method
         opens the file, file, for writing.  If no file object is
-        passed write to standard out.
+        passed write to standard out.  If sidecar is True (or None
+        and config.write_sidecar is set) a binary sidecar file is also
+        written (see csvreader.write_sidecar()).
 
         Do we need to be careful to avoid overwriting files?
 
@@ -606,6 +539,8 @@ class NDVISummaryTimeSeries(object):
         # close file
         if not file == "":
             fo.close()
+            if sidecar or (sidecar is None and config.write_sidecar):
+                csvreader.write_sidecar(file, NDVI_COLUMN_KINDS)
 
         # return number of rows
         return len(self.rows)
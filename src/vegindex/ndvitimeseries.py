@@ -1,39 +1,56 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function
 
-import csv
 import re
 import sys
 from datetime import date
 from datetime import datetime
 from datetime import time
 
+from . import columnar
 from . import config
+from . import csvreader
 from . import utils
 
 ND_STRING = config.ND_STRING
 ND_FLOAT = config.ND_FLOAT
 ND_INT = config.ND_INT
 
-
-def _filter_comments(f):
-    """
-    filter comments from csv file
-    """
-    for line in f:
-        line = line.rstrip()
-        if line and not line.startswith("#"):
-            yield line
-
-
-def _get_comments(f):
-    """
-    return JUST the comment lines from a csv file
-    """
-    for line in f:
-        line = line.rstrip()
-        if line and line.startswith("#"):
-            yield line
+# types of the numeric columns in an NDVI timeseries CSV file
+NDVI_COLUMN_KINDS = {
+    "solar_elev": csvreader.FLOAT,
+    "exposure_rgb": csvreader.INT,
+    "exposure_ir": csvreader.INT,
+    "mask_index": csvreader.INT,
+    "gcc": csvreader.FLOAT,
+    "r_mean": csvreader.FLOAT,
+    "g_mean": csvreader.FLOAT,
+    "b_mean": csvreader.FLOAT,
+    "ir_mean": csvreader.FLOAT,
+    "ir_std": csvreader.FLOAT,
+    "ir_5_qtl": csvreader.FLOAT,
+    "ir_10_qtl": csvreader.FLOAT,
+    "ir_25_qtl": csvreader.FLOAT,
+    "ir_50_qtl": csvreader.FLOAT,
+    "ir_75_qtl": csvreader.FLOAT,
+    "ir_90_qtl": csvreader.FLOAT,
+    "ir_95_qtl": csvreader.FLOAT,
+    "Y": csvreader.FLOAT,
+    "Z_prime": csvreader.FLOAT,
+    "R_prime": csvreader.FLOAT,
+    "Y_prime": csvreader.FLOAT,
+    "X_prime": csvreader.FLOAT,
+    "NDVI_c": csvreader.FLOAT,
+}
+
+# columns used for image selection
+NDVI_SELECT_COLUMNS = [
+    ("datetime", columnar.DATETIME),
+    ("r_mean", columnar.FLOAT),
+    ("g_mean", columnar.FLOAT),
+    ("b_mean", columnar.FLOAT),
+    ("solar_elev", columnar.FLOAT),
+]
 
 
 def _get_comment_field(comments, var_string):
@@ -68,38 +85,6 @@ def _get_comment_field(comments, var_string):
     return var_value
 
 
-def _float_or_none(str):
-    """
-    Try to convert string to float. Return float or None value if a
-    ValueError exception is raised.
-    """
-    try:
-        retval = float(str)
-    except ValueError:
-        retval = ND_FLOAT
-
-    if retval == -9999.0:
-        retval = ND_FLOAT
-
-    return retval
-
-
-def _int_or_none(str):
-    """
-    Try to convert string to integer. Return int or None value
-    if ValueError is raised.
-    """
-    try:
-        retval = int(str)
-    except ValueError:
-        retval = ND_INT
-
-    if retval == -9999:
-        retval = ND_INT
-
-    return retval
-
-
 class NDVITimeSeries(object):
     """
     Class for CSV version of NDVI Timeseries.  There is currently
@@ -145,6 +130,14 @@ class NDVITimeSeries(object):
         self.updated_at = datetime.now()
         self.rows = []
 
+        # number of rows passing each selection criterion from the
+        # last call to select_index()
+        self.selection_counts = None
+
+        # datetime of the first row read for a partial timeseries
+        # read with readCSV(since=...), None if all rows were read
+        self.since = None
+
         # split ROIListID into roitype, and sequence_number
         roitype, sequence_number = ROIListID.split("_")
         self.roitype = roitype
@@ -585,7 +578,7 @@ class NDVITimeSeries(object):
 
     #     return nout
 
-    def select_rows(
+    def select_index(
         self,
         tod_min=config.TIME_MIN,
         tod_max=config.TIME_MAX,
@@ -594,29 +587,48 @@ class NDVITimeSeries(object):
         brt_max=config.MAX_BRT,
     ):
         """
-        routine to return a list of the rows in self.rows
-        which meet the selection criteria for brightness
-        and time of day.  Numpy probably has a better (i.e. faster)
-        way to do this. Also remove rows where thie image is
-        completely black.
+        return an array of the indices (in datetime order) of the
+        rows in self.rows which meet the selection criteria for
+        brightness, solar elevation and time of day.  The number of
+        rows passing each criterion is saved in self.selection_counts.
         """
-        selected_rows = []
-        for row in self.rows:
-            brt = row["r_mean"] + row["g_mean"] + row["b_mean"]
-            if (
-                (row["datetime"].time() < tod_min)
-                or (row["datetime"].time() > tod_max)
-                or (brt < brt_min)
-                or (brt > brt_max)
-                or (row["solar_elev"] < sunelev_min)
-            ):
-                continue
-            else:
-                selected_rows.append(row)
+        columns = columnar.ColumnStore.from_rows(NDVI_SELECT_COLUMNS, self.rows).columns
+        brt = columns["r_mean"] + columns["g_mean"] + columns["b_mean"]
+        index, self.selection_counts = columnar.select_index(
+            columns["datetime"],
+            brt,
+            columns["solar_elev"],
+            tod_min,
+            tod_max,
+            sunelev_min,
+            brt_min,
+            brt_max,
+        )
+
+        return index
 
-        rows = sorted(selected_rows, key=lambda k: k["datetime"])
+    def select_rows(
+        self,
+        tod_min=config.TIME_MIN,
+        tod_max=config.TIME_MAX,
+        sunelev_min=config.MIN_SUN_ANGLE,
+        brt_min=config.MIN_BRT,
+        brt_max=config.MAX_BRT,
+    ):
+        """
+        routine to return a list of the rows in self.rows which meet
+        the selection criteria for brightness and time of day (see
+        select_index()) sorted by datetime.
+        """
+        index = self.select_index(
+            tod_min=tod_min,
+            tod_max=tod_max,
+            sunelev_min=sunelev_min,
+            brt_min=brt_min,
+            brt_max=brt_max,
+        )
 
-        return rows
+        return [self.rows[i] for i in index]
 
     def filter_rows(self, NDVI_c_min=-1.0, NDVI_c_max=1.0):
         """
@@ -641,18 +653,20 @@ class NDVITimeSeries(object):
 
         return rows
 
-    def readCSV(self, ndviTimeSeriesPath):
+    def readCSV(self, ndviTimeSeriesPath, since=None, sidecar=False):
         """
         Method to read NDVITimeSeries object from CSV file and return
         a ROITimeSeries object.  If the comment fields are not present
-        they must be set before the object can be written.
+        they must be set before the object can be written.  If since
+        (a datetime) is given only rows at or after since are read.
+        If sidecar is True the columns are loaded from an up to date
+        binary sidecar file if there is one.
         """
 
-        # open file for reading
-        f = open(ndviTimeSeriesPath, "r")
-
-        # get comment lines
-        comments = list(_get_comments(f))
+        # read comment lines and data columns
+        comments, columns = csvreader.read_csv(
+            ndviTimeSeriesPath, NDVI_COLUMN_KINDS, since=since, sidecar=sidecar
+        )
 
         # no validation applied to sitename
         site = _get_comment_field(comments, "Site")
@@ -699,61 +713,11 @@ class NDVITimeSeries(object):
 
         # do I need to grab lat, lon, elev and tzoffset?  Probably!
 
-        # get timeseries rows
-        f.seek(0)
-        csvrdr = csv.DictReader(_filter_comments(f))
-
-        ndvitsRows = []
-        for row in csvrdr:
-
-            # turn date and time strings into datetime values
-            (im_yr, im_mo, im_dom) = row["date"].split("-")
-            (im_hr, im_min, im_sec) = row["local_std_time"].split(":")
-            im_dt = datetime(
-                int(im_yr),
-                int(im_mo),
-                int(im_dom),
-                int(im_hr),
-                int(im_min),
-                int(im_sec),
+        # turn date and time strings into datetime values
+        if columns and "datetime" not in columns:
+            columns["datetime"] = csvreader.datetime_column(
+                columns["date"], columns["local_std_time"]
             )
 
-            row["datetime"] = im_dt
-
-            # # check for awbflag
-            # if "awbflag" not in row.keys():
-            #     row["awbflag"] = ND_INT
-
-            # convert strings to numbers - there's got to be a more
-            # efficient way to do this!
-            row["solar_elev"] = _float_or_none(row["solar_elev"])
-            row["exposure_rgb"] = _int_or_none(_float_or_none(row["exposure_rgb"]))
-            row["exposure_ir"] = _int_or_none(_float_or_none(row["exposure_ir"]))
-            # row["awbflag"] = _int_or_none(_float_or_none(row["awbflag"]))
-            row["mask_index"] = _int_or_none(row["mask_index"])
-            row["gcc"] = _float_or_none(row["gcc"])
-            row["r_mean"] = _float_or_none(row["r_mean"])
-            row["g_mean"] = _float_or_none(row["g_mean"])
-            row["b_mean"] = _float_or_none(row["b_mean"])
-            row["ir_mean"] = _float_or_none(row["ir_mean"])
-            row["ir_std"] = _float_or_none(row["ir_std"])
-            row["ir_5_qtl"] = _float_or_none(row["ir_5_qtl"])
-            row["ir_10_qtl"] = _float_or_none(row["ir_10_qtl"])
-            row["ir_25_qtl"] = _float_or_none(row["ir_25_qtl"])
-            row["ir_50_qtl"] = _float_or_none(row["ir_50_qtl"])
-            row["ir_75_qtl"] = _float_or_none(row["ir_75_qtl"])
-            row["ir_90_qtl"] = _float_or_none(row["ir_90_qtl"])
-            row["ir_95_qtl"] = _float_or_none(row["ir_95_qtl"])
-            row["Y"] = _float_or_none(row["Y"])
-            row["Z_prime"] = _float_or_none(row["Z_prime"])
-            row["R_prime"] = _float_or_none(row["R_prime"])
-            row["Y_prime"] = _float_or_none(row["Y_prime"])
-            row["X_prime"] = _float_or_none(row["X_prime"])
-            row["NDVI_c"] = _float_or_none(row["NDVI_c"])
-
-            ndvitsRows.append(row)
-
-        # do I need to sort here?
-
-        self.rows = ndvitsRows
-        f.close()
+        self.rows = csvreader.columns_to_rows(columns)
+        self.since = since
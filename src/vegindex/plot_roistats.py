@@ -25,7 +25,7 @@ MAX_BRT = config.MAX_BRT
 MIN_BRT = config.MIN_BRT
 
 
-def main():
+def main(argv=None):
     """
     Use pandas to generate plot of gcc values from roistats file.
     """
@@ -41,21 +41,30 @@ def main():
         action="store_true",
         default=False,
     )
+    parser.add_argument(
+        "-n",
+        "--dry-run",
+        help="Process data but don't save results",
+        action="store_true",
+        default=False,
+    )
 
     # positional arguments
     parser.add_argument("site", help="PhenoCam site name")
     parser.add_argument("roiname", help="ROI name, e.g. DB_0001")
 
     # get args
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     sitename = args.site
     roiname = args.roiname
     verbose = args.verbose
+    dryrun = args.dry_run
 
     if verbose:
         print("site: {0}".format(sitename))
         print("roiname: {0}".format(roiname))
         print("verbose: {0}".format(verbose))
+        print("dryrun: {0}".format(dryrun))
 
     # set roistats input filename
     inname = "{}_{}_roistats.csv".format(sitename, roiname)
@@ -120,8 +129,12 @@ def main():
     else:
         ax.legend(lines[1:], ["3-day gcc 90th percentile"], loc="best")
 
+    # close the figure so repeated calls (e.g. from vegindex-batch)
+    # don't keep every plot in memory
     fig = ax.get_figure()
-    fig.savefig(outpath)
+    if not dryrun:
+        fig.savefig(outpath)
+    plt.close(fig)
 
 
 if __name__ == "__main__":
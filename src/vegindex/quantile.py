@@ -10,6 +10,30 @@ from __future__ import print_function
 from math import floor
 from math import modf
 
+import numpy as np
+
+# Parameters (a, b, c, d) for the Hyndman and Fan algorithm
+HF_PARAMETERS = [
+    # inverse empirical distrib.function., R type 1
+    (0, 0, 1, 0),
+    # similar to type 1, averaged, R type 2
+    (0.5, 0, 1, 0),
+    # nearest order statistic,(SAS) R type 3
+    (0.5, 0, 0, 0),
+    # California linear interpolation, R type 4
+    (0, 0, 0, 1),
+    # hydrologists method, R type 5
+    (0.5, 0, 0, 1),
+    # mean-based estimate(Weibull method), (SPSS, Minitab), type 6
+    (0, 1, 0, 1),
+    # mode-based method,(S, S-Plus), R type 7
+    (1, -1, 0, 1),
+    # median-unbiased ,  R type 8
+    (1.0 / 3, 1.0 / 3, 0, 1),
+    # normal-unbiased, R type 9.
+    (3 / 8.0, 0.25, 0, 1),
+]
+
 
 def quantile(x, q, qtype=7, issorted=False):
     """
@@ -38,29 +62,7 @@ def quantile(x, q, qtype=7, issorted=False):
         if not (1 <= qtype <= 9):
             return None  # error!
 
-    # Parameters for the Hyndman and Fan algorithm
-    abcd = [
-        # inverse empirical distrib.function., R type 1
-        (0, 0, 1, 0),
-        # similar to type 1, averaged, R type 2
-        (0.5, 0, 1, 0),
-        # nearest order statistic,(SAS) R type 3
-        (0.5, 0, 0, 0),
-        # California linear interpolation, R type 4
-        (0, 0, 0, 1),
-        # hydrologists method, R type 5
-        (0.5, 0, 0, 1),
-        # mean-based estimate(Weibull method), (SPSS, Minitab), type 6
-        (0, 1, 0, 1),
-        # mode-based method,(S, S-Plus), R type 7
-        (1, -1, 0, 1),
-        # median-unbiased ,  R type 8
-        (1.0 / 3, 1.0 / 3, 0, 1),
-        # normal-unbiased, R type 9.
-        (3 / 8.0, 0.25, 0, 1),
-    ]
-
-    a, b, c, d = abcd[qtype - 1]
+    a, b, c, d = HF_PARAMETERS[qtype - 1]
     n = len(x)
     g, j = modf(a + (n + b) * q - 1)
     if j < 0:
@@ -76,6 +78,80 @@ def quantile(x, q, qtype=7, issorted=False):
         return y[j] + (y[j + 1] - y[j]) * (c + d * g)
 
 
+def _sorted_quantiles(y, n, q, qtype):
+    """
+    Hyndman and Fan quantiles q for each row of the 2-d array y where
+    the first n values of each row are sorted.  This is the same
+    calculation as quantile() for all rows and quantiles at once.
+    """
+    a, b, c, d = HF_PARAMETERS[qtype - 1]
+    n = n[:, np.newaxis]
+    g, j = np.modf(a + (n + b) * q[np.newaxis, :] - 1)
+
+    # quantile() would raise an IndexError where hi is clipped
+    last = np.maximum(n - 1, 0)
+    lo = np.clip(j, 0, last).astype(np.int64)
+    hi = np.minimum(lo + 1, last)
+    y_lo = np.take_along_axis(y, lo, axis=1)
+    y_hi = np.take_along_axis(y, hi, axis=1)
+
+    with np.errstate(invalid="ignore"):
+        result = np.where(g == 0, y_lo, y_lo + (y_hi - y_lo) * (c + d * g))
+    result = np.where(j < 0, y[:, :1], result)
+    result = np.where(j >= n, np.take_along_axis(y, last, axis=1), result)
+    result[n[:, 0] == 0, :] = np.nan
+
+    return result
+
+
+def quantiles(x, q, qtype=7, issorted=False, skipnan=False):
+    """
+    Numpy version of quantile() which returns several quantiles
+    (q can be a sequence) from one sort of the data.  The results
+    are the same as calling quantile() for each value of q.
+
+    For 1-d x NaN values are sorted the same way as sorted() does in
+    quantile() unless skipnan is True, in which case they are dropped.
+    For 2-d x each row is a separate sample, padded at the end with
+    NaN if the rows have different lengths, and NaN values are always
+    dropped.
+
+    Returns a float (1-d x and scalar q), an array with a value for
+    each q (1-d x) or an array with a row for each row of x.
+    """
+    if not (1 <= qtype <= 9):
+        raise ValueError("qtype must be between 1 and 9")
+
+    qs = np.asarray(q, dtype=np.float64)
+    x = np.asarray(x, dtype=np.float64)
+    if x.ndim == 1:
+        if skipnan:
+            x = x[~np.isnan(x)]
+        if issorted:
+            y = x
+        elif np.isnan(x).any():
+            y = np.array(sorted(x.tolist()))
+        else:
+            y = np.sort(x)
+        y = y[np.newaxis, :]
+        n = np.array([len(x)])
+    elif x.ndim == 2:
+        y = x if issorted else np.sort(x, axis=1)
+        n = np.count_nonzero(~np.isnan(y), axis=1)
+    else:
+        raise ValueError("x must be 1-d or 2-d")
+
+    result = _sorted_quantiles(y, n, np.atleast_1d(qs), qtype)
+    if qs.ndim == 0:
+        result = result[:, 0]
+    if x.ndim == 1:
+        result = result[0]
+        if qs.ndim == 0:
+            return float(result)
+
+    return result
+
+
 def Test():
     x = [11.4, 17.3, 21.3, 25.9, 40.1, 50.5, 60.0, 70.0, 75]
 
@@ -1,10 +1,225 @@
 # -*- coding: utf-8 -*-
 
+"""
+ROI mask files and an in-process cache of decoded masks.
+
+The timeseries scripts (RGB and IR, generate and update) all need
+the decoded mask image and the structures derived from it.  Decoded
+masks are kept in a small LRU cache keyed by the mask path and file
+modification time and size, so a mask is only decoded once per
+process (e.g. in the vegindex-batch workers) and the derived
+structures are only computed once per mask.
+
+If a ``.npz`` sidecar file with the same base name as the mask TIFF
+exists and is stamped with the modification time and size of the
+TIFF the decoded mask is loaded from it instead.  The sidecar is
+written when config.write_sidecar is set.
+"""
+
+import os
 import sys
+import zipfile
+from collections import OrderedDict
 
 import numpy as np
 from PIL import Image
 
+from . import config
+from . import roistats
+
+# number of decoded masks kept by each process
+MASK_CACHE_SIZE = 8
+
+# decoded masks by (path, mtime_ns, size), least recently used first
+_mask_cache = OrderedDict()
+
+
+class DecodedMask(object):
+    """
+    Class for a decoded ROI mask.  mask is a read-only boolean
+    array where True (non-zero in the mask image) means the pixel is
+    excluded from the ROI.  The derived structures (ROI pixel index,
+    bounding box, index within the bounding box and reduced masks)
+    are computed when first used.
+    """
+
+    def __init__(self, mask):
+        mask = np.asarray(mask, dtype=np.bool_)
+        mask.flags.writeable = False
+        self.mask = mask
+        self.shape = mask.shape
+        self._roi_index = None
+        self._bbox = None
+        self._crop_index = None
+        self._reduced = {}
+
+    def roi_index(self):
+        """
+        return the flat (raveled) indices of the ROI pixels
+        """
+        if self._roi_index is None:
+            self._roi_index = roistats.get_roi_index(self.mask)
+            self._roi_index.flags.writeable = False
+
+        return self._roi_index
+
+    def npixels(self):
+        """
+        return the number of pixels in the ROI
+        """
+        return len(self.roi_index())
+
+    def bbox(self):
+        """
+        return the bounding box (row0, row1, col0, col1) of the ROI
+        pixels with the usual exclusive end indices, or None for an
+        empty ROI.
+        """
+        if self._bbox is None and self.npixels() > 0:
+            rows = np.flatnonzero(~self.mask.all(axis=1))
+            cols = np.flatnonzero(~self.mask.all(axis=0))
+            self._bbox = (
+                int(rows[0]),
+                int(rows[-1]) + 1,
+                int(cols[0]),
+                int(cols[-1]) + 1,
+            )
+
+        return self._bbox
+
+    def crop_index(self):
+        """
+        return the flat indices of the ROI pixels within the bounding
+        box, i.e. in an image cropped to bbox()
+        """
+        if self._crop_index is None:
+            bbox = self.bbox()
+            if bbox is None:
+                self._crop_index = self.roi_index()
+            else:
+                row0, row1, col0, col1 = bbox
+                crop = self.mask[row0:row1, col0:col1]
+                self._crop_index = roistats.get_roi_index(crop)
+                self._crop_index.flags.writeable = False
+
+        return self._crop_index
+
+    def crop_image(self, im):
+        """
+        return the part of a PIL image within the bounding box as a
+        numpy array (the whole image for an empty ROI)
+        """
+        bbox = self.bbox()
+        if bbox is None:
+            return np.asarray(im)
+
+        row0, row1, col0, col1 = bbox
+        return np.asarray(im.crop((col0, row0, col1, row1)))
+
+    def reduced(self, scale):
+        """
+        return the DecodedMask for the mask reduced by an integer
+        scale factor (see roistats.reduce_mask())
+        """
+        if scale == 1:
+            return self
+        if scale not in self._reduced:
+            self._reduced[scale] = DecodedMask(roistats.reduce_mask(self.mask, scale))
+
+        return self._reduced[scale]
+
+
+def mask_sidecar_path(mask_path):
+    """
+    return the path of the .npz sidecar file for a mask file
+    """
+    return os.path.splitext(mask_path)[0] + ".npz"
+
+
+def _decode_mask(mask_path, st):
+    """
+    decode a mask file (or load it from a sidecar stamped with the
+    modification time and size of the mask file) and return the
+    boolean mask array.  Raises IOError if the mask file can't be
+    read.
+    """
+    stamp = np.array([st.st_mtime_ns, st.st_size], dtype=np.int64)
+    sidecar = mask_sidecar_path(mask_path)
+    try:
+        with np.load(sidecar, allow_pickle=False) as npz:
+            if np.array_equal(npz["__stamp__"], stamp):
+                mask = npz["mask"]
+                if mask.dtype == np.bool_ and mask.ndim == 2:
+                    return mask
+    except (IOError, OSError, ValueError, KeyError, zipfile.BadZipFile):
+        pass
+
+    try:
+        mask_img = Image.open(mask_path)
+
+        # convert to 8-bit mask
+        if mask_img.mode != "L":
+            mask_img = mask_img.convert("L")
+
+        mask = np.asarray(mask_img, dtype=np.bool_)
+    except (IOError, OSError, ValueError) as e:
+        raise IOError("Unable to read ROI mask {0}: {1}".format(mask_path, e))
+
+    if config.write_sidecar:
+        tmp_path = "{0}.{1}.tmp".format(sidecar, os.getpid())
+        try:
+            with open(tmp_path, "wb") as f:
+                np.savez(f, mask=mask, __stamp__=stamp)
+            os.replace(tmp_path, sidecar)
+        except (IOError, OSError):
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    return mask
+
+
+def read_mask(mask_path):
+    """
+    return the DecodedMask for a mask file from the cache, decoding
+    the file if it isn't cached or has changed.  Raises IOError if
+    the mask file can't be read.
+    """
+    try:
+        st = os.stat(mask_path)
+    except OSError as e:
+        raise IOError("Unable to read ROI mask {0}: {1}".format(mask_path, e))
+
+    key = (os.path.abspath(mask_path), st.st_mtime_ns, st.st_size)
+    decoded = _mask_cache.get(key)
+    if decoded is not None:
+        _mask_cache.move_to_end(key)
+        return decoded
+
+    decoded = DecodedMask(_decode_mask(mask_path, st))
+    _mask_cache[key] = decoded
+    while len(_mask_cache) > MASK_CACHE_SIZE:
+        _mask_cache.popitem(last=False)
+
+    return decoded
+
+
+def mask_info(mask):
+    """
+    return the cached DecodedMask for a mask array from read_mask()
+    or DecodedMask.reduced() (so the derived structures are shared)
+    or a new DecodedMask for any other mask array.
+    """
+    for decoded in _mask_cache.values():
+        if decoded.mask is mask:
+            return decoded
+        for reduced in decoded._reduced.values():
+            if reduced.mask is mask:
+                return reduced
+
+    return DecodedMask(mask)
+
 
 class ROIMask(object):
     """
@@ -57,14 +272,11 @@ class ROIMask(object):
         Read ROIMask file and return a numpy array.
         """
 
-        # read using PIL
+        # read using the mask cache
         try:
-            mask_img = Image.open(roiMaskPath)
+            mask = read_mask(roiMaskPath).mask
         except IOError:
             sys.stderr.write("Unable to open mask file\n")
             return None
 
-        # convert to numpy boolean mask
-        mask = np.asarray(mask_img, dtype=np.bool8)
-
         return mask
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+"""
+Histogram based statistics for 8-bit image bands over an ROI mask.
+
+For 8-bit data the mean, standard deviation and percentiles of the
+pixel values can be found exactly from a 256 bin histogram.  This is
+much cheaper than building masked arrays and sorting the pixel values
+for every image.
+"""
+
+import numpy as np
+from PIL import Image
+
+# percentiles reported in the roistats files
+PERCENTILES = (5.0, 10.0, 25.0, 50.0, 75.0, 90.0, 95.0)
+
+# number of histogram bins for 8-bit data
+NBINS = 256
+
+# the brightness check uses every BRIGHTNESS_STEP'th pixel (in each
+# direction) of the image
+BRIGHTNESS_STEP = 4
+
+_DN = np.arange(NBINS, dtype=np.int64)
+_DN2 = _DN * _DN
+
+
+def get_roi_index(roimask):
+    """
+    Return the flat (raveled) indices of the pixels in the ROI.  As
+    with numpy masked arrays a True (non-zero) mask value means the
+    pixel is excluded.
+    """
+    mask = np.asarray(roimask, dtype=np.bool_)
+    return np.flatnonzero(~mask)
+
+
+def reduce_mask(roimask, scale):
+    """
+    Return an ROI mask reduced by an integer scale factor to match
+    an image decoded at reduced resolution.  The reduced size is
+    rounded up (as for libjpeg DCT scaling) and a reduced pixel is
+    only in the ROI if every pixel of the block it covers is in the
+    ROI.
+    """
+    mask = np.asarray(roimask, dtype=np.bool_)
+    if scale == 1:
+        return mask
+
+    nrows, ncols = mask.shape
+    rrows = -(-nrows // scale)
+    rcols = -(-ncols // scale)
+
+    # pad partial blocks at the edges with excluded pixels
+    padded = np.ones((rrows * scale, rcols * scale), dtype=np.bool_)
+    padded[0:nrows, 0:ncols] = mask
+
+    return padded.reshape(rrows, scale, rcols, scale).any(axis=(1, 3))
+
+
+def image_brightness(im, border=30, step=BRIGHTNESS_STEP):
+    """
+    Return the mean brightness (sum of the bands) of a PIL image
+    after removing a border of pixels where a banner/overlay might
+    be.  This is only used to spot mostly dark or white images so it
+    is estimated from a nearest neighbor subsample of every step'th
+    pixel (so the full frame never has to be converted to an array).
+    """
+    xsize, ysize = im.size
+    box = (border, border, xsize - border, ysize - border)
+    if box[2] <= box[0] or box[3] <= box[1]:
+        return np.nan
+
+    size = (max(1, (box[2] - box[0]) // step), max(1, (box[3] - box[1]) // step))
+    sub = np.asarray(im.resize(size, Image.NEAREST, box=box))
+    npix = size[0] * size[1]
+
+    return np.float64(int(sub.sum(dtype=np.int64))) / npix
+
+
+def hist_moments(hist):
+    """
+    Return number of values, sum and sum of squares (as python
+    integers) for a histogram of 8-bit values.
+    """
+    n = int(hist.sum())
+    s1 = int(np.dot(hist, _DN))
+    s2 = int(np.dot(hist, _DN2))
+
+    return n, s1, s2
+
+
+def hist_mean_std(hist):
+    """
+    Return the mean and (population) standard deviation of the
+    values in a histogram of 8-bit values.
+    """
+    n, s1, s2 = hist_moments(hist)
+    mean = np.float64(s1) / n
+    std = np.sqrt(np.float64(n * s2 - s1 * s1)) / n
+
+    return mean, std
+
+
+def hist_percentiles(hist, pcts=PERCENTILES):
+    """
+    Return percentiles for the values in a histogram of 8-bit
+    values.  The interpolation follows the default ("linear")
+    method of np.percentile so the results are the same as calling
+    np.percentile() on the pixel values.
+    """
+    cum = np.cumsum(hist)
+    n = int(cum[-1])
+
+    quantiles = np.true_divide(np.asarray(pcts, dtype=np.float64), 100)
+    virtual_indexes = (n - 1) * quantiles
+    previous_indexes = np.floor(virtual_indexes)
+    gamma = virtual_indexes - previous_indexes
+    next_indexes = previous_indexes + 1
+
+    # clip at the last value
+    above = virtual_indexes >= n - 1
+    previous_indexes[above] = n - 1
+    next_indexes[above] = n - 1
+
+    # the value at sorted position i is the first bin with a
+    # cumulative count greater than i
+    previous = np.searchsorted(cum, previous_indexes, side="right")
+    next = np.searchsorted(cum, next_indexes, side="right")
+    previous = previous.astype(np.float64)
+    next = next.astype(np.float64)
+
+    # linear interpolation as in numpy
+    diff = next - previous
+    pct_vals = previous + diff * gamma
+    upper = gamma >= 0.5
+    pct_vals[upper] = next[upper] - diff[upper] * (1 - gamma[upper])
+
+    return pct_vals
+
+
+def band_stats(hist):
+    """
+    Return a dictionary with the mean, standard deviation and
+    percentiles for a histogram of 8-bit values.
+    """
+    mean, std = hist_mean_std(hist)
+    return {"mean": mean, "stdev": std, "percentiles": hist_percentiles(hist)}
+
+
+def rgb_roi_stats(im_array, roi_index):
+    """
+    Return the ROI stats for an RGB image array with shape (rows,
+    cols, 3) and the flat index of the ROI pixels.  The bands are
+    gathered in a single pass, the band stats come from histograms
+    and the band correlations are found from integer sums.
+    """
+    # gather the ROI pixels, one row per band
+    pixels = np.ascontiguousarray(im_array.reshape(-1, 3).take(roi_index, axis=0).T)
+    npix = pixels.shape[1]
+    if npix == 0:
+        raise ValueError("No pixels in ROI mask")
+
+    hists = [np.bincount(band, minlength=NBINS) for band in pixels]
+    sums = [hist_moments(hist)[1:] for hist in hists]
+
+    # n**2 times the variances
+    var = [npix * s2 - s1 * s1 for (s1, s2) in sums]
+
+    def _correl(i, j):
+        # products of 8-bit values fit in uint16 and the sum is
+        # done with (exact) 64-bit integers
+        prod = np.multiply(pixels[i], pixels[j], dtype=np.uint16)
+        cross = int(prod.sum(dtype=np.uint64))
+        cov = npix * cross - sums[i][0] * sums[j][0]
+        return np.float64(cov) / (
+            np.sqrt(np.float64(var[i])) * np.sqrt(np.float64(var[j]))
+        )
+
+    return [
+        band_stats(hists[0]),
+        band_stats(hists[1]),
+        band_stats(hists[2]),
+        _correl(0, 1),
+        _correl(1, 2),
+        _correl(2, 0),
+    ]
+
+
+def ir_roi_stats(im_array, roi_index):
+    """
+    Return the ROI stats for the first band of an IR image array
+    with shape (rows, cols, bands) and the flat index of the ROI
+    pixels.
+    """
+    nbands = im_array.shape[2]
+    pixels = im_array.reshape(-1, nbands)[:, 0].take(roi_index)
+    if pixels.size == 0:
+        raise ValueError("No pixels in ROI mask")
+
+    return band_stats(np.bincount(pixels, minlength=NBINS))
@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function
 
-import csv
 import os
 import re
 import sys
@@ -10,44 +9,144 @@ from datetime import datetime
 import numpy as np
 from PIL import Image
 
+from . import columnar
 from . import config
+from . import csvreader
+from . import roistats
 from . import utils
+from .roimask import mask_info
 
 ND_FLOAT = config.ND_FLOAT
 ND_INT = config.ND_INT
 ND_STRING = config.ND_STRING
 
+# number of rows formatted at a time when writing CSV files
+CSV_WRITE_ROWS = 10000
 
-def _float_or_none(str):
+# block size for counting the rows of a CSV file
+CSV_COUNT_BLOCK = 1 << 20
+
+
+def _roits_columns():
     """
-    Try to convert string to float. Return float or None value if a
-    ValueError exception is raised.
+    return the (name, kind) column spec for an ROI timeseries (see
+    columnar.py)
     """
-    try:
-        retval = float(str)
-    except ValueError:
-        retval = ND_FLOAT
+    columns = [
+        ("datetime", columnar.DATETIME),
+        ("filename", columnar.STR),
+        ("solar_elev", columnar.FLOAT),
+        ("exposure", columnar.INT),
+        ("awbflag", columnar.INT),
+        ("mask_index", columnar.INT),
+        ("gcc", columnar.FLOAT),
+        ("rcc", columnar.FLOAT),
+    ]
+    for band in ("r", "g", "b"):
+        columns.append(("{0}_mean".format(band), columnar.FLOAT))
+        columns.append(("{0}_std".format(band), columnar.FLOAT))
+        for pct in (5, 10, 25, 50, 75, 90, 95):
+            columns.append(("{0}_{1}_qtl".format(band, pct), columnar.FLOAT))
+    columns.append(("r_g_correl", columnar.FLOAT))
+    columns.append(("g_b_correl", columnar.FLOAT))
+    columns.append(("b_r_correl", columnar.FLOAT))
+
+    return columns
 
-    if retval == -9999.0:
-        retval = ND_FLOAT
 
-    return retval
+ROITS_COLUMNS = _roits_columns()
 
 
-def _int_or_none(str):
+def _roits_csv_groups():
     """
-    Try to convert string to integer. Return int or None value
-    if ValueError is raised.
+    return the groups of fields in an ROI timeseries CSV row.  Each
+    group is (fields, format, nd_fields): the fields are written with
+    the format unless one of the nd_fields is no-data in which case
+    all the fields in the group are written with "{}" (so "NA").
+    This follows the formatting in ROITimeSeries.format_csvrow().
     """
-    try:
-        retval = int(str)
-    except ValueError:
-        retval = ND_INT
+    groups = [
+        (["date", "local_std_time", "doy", "filename"], "{}", []),
+        (["solar_elev"], "{:.5f}", ["solar_elev"]),
+        (["exposure", "awbflag", "mask_index"], "{}", []),
+        (["gcc", "rcc"], "{:.5f}", ["gcc"]),
+    ]
+    for band in ("r", "g", "b"):
+        stats = ["{0}_mean".format(band), "{0}_std".format(band)]
+        groups.append((stats, "{:.5f}", stats[0:1]))
+        pcts = ["{0}_{1}_qtl".format(band, pct) for pct in (5, 10, 25, 50, 75, 90, 95)]
+        groups.append((pcts, "{:.0f}", pcts[0:1]))
+    correls = ["r_g_correl", "g_b_correl", "b_r_correl"]
+    groups.append((correls, "{:.5f}", correls))
+
+    return groups
+
+
+ROITS_CSV_GROUPS = _roits_csv_groups()
 
-    if retval == -9999:
-        retval = ND_INT
+# fields in an ROI timeseries CSV file
+ROITS_CSV_FIELDS = [name for group in ROITS_CSV_GROUPS for name in group[0]]
 
-    return retval
+
+def _csv_row_format(nd_code):
+    """
+    return the format string for an ROI timeseries CSV row where bit
+    i of nd_code is set if group i of ROITS_CSV_GROUPS is no-data.
+    """
+    specs = []
+    for i, (fields, fmt, nd_fields) in enumerate(ROITS_CSV_GROUPS):
+        if nd_code & (1 << i):
+            fmt = "{}"
+        specs.extend([fmt] * len(fields))
+
+    return ",".join(specs) + "\n"
+
+
+def format_csv_rows(store, start, stop):
+    """
+    Return rows start to stop of an ROI timeseries ColumnStore
+    formatted as CSV lines (in a single string).  The rows are
+    grouped by which fields are no-data and each group is formatted
+    with a single format string, giving the same output as
+    ROITimeSeries.format_csvrow() for each row.
+    """
+    values = store.get_values(start, stop)
+    dates, times, doys = columnar.datetime_strings(store.column("datetime")[start:stop])
+    values["date"] = dates
+    values["local_std_time"] = times
+    values["doy"] = doys
+
+    # find the no-data pattern for each row
+    nd_codes = np.zeros(stop - start, dtype=np.int64)
+    for i, (fields, fmt, nd_fields) in enumerate(ROITS_CSV_GROUPS):
+        for name in nd_fields:
+            nd = columnar.is_nodata(store.column(name)[start:stop])
+            nd_codes[nd] |= 1 << i
+
+    formats = {}
+    for nd_code in np.unique(nd_codes).tolist():
+        formats[nd_code] = _csv_row_format(nd_code).format
+
+    rowvals = zip(*[values[name] for name in ROITS_CSV_FIELDS])
+    return "".join(
+        [formats[nd_code](*row) for nd_code, row in zip(nd_codes.tolist(), rowvals)]
+    )
+
+
+def _make_rows(store, start, stop):
+    """
+    Return a list of ROITimeSeries row dictionaries for rows start
+    to stop of a ColumnStore.  The rows have the same form as rows
+    read from a CSV file.
+    """
+    values = store.get_values(start, stop)
+    dates, times, doys = columnar.datetime_strings(store.column("datetime")[start:stop])
+    values["date"] = dates
+    values["local_std_time"] = times
+    values["doy"] = doys
+
+    names = list(values.keys())
+    return [dict(zip(names, rowvals)) for rowvals in zip(*values.values())]
 
 
 ######################################################################
@@ -94,137 +193,67 @@ def get_dn_means(im, roimask):
     return [r_mean_roi, g_mean_roi, b_mean_roi, brt]
 
 
-def get_roi_stats(im, roimask):
+def _nd_roi_stats():
+    """
+    Return an ROI stats list filled with no-data values.
+    """
+    nd_pcts = [ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT]
+    return [
+        {"mean": ND_FLOAT, "stdev": ND_FLOAT, "percentiles": list(nd_pcts)},
+        {"mean": ND_FLOAT, "stdev": ND_FLOAT, "percentiles": list(nd_pcts)},
+        {"mean": ND_FLOAT, "stdev": ND_FLOAT, "percentiles": list(nd_pcts)},
+        ND_FLOAT,
+        ND_FLOAT,
+        ND_FLOAT,
+    ]
+
+
+def get_roi_stats(im, roimask, decoded=None):
     """
     Function to return a more extensive collection of stats for DN
-    values for an image / mask pair.  NOTE: probably move this to
-    utils.py.
+    values for an image / mask pair.  Only the part of the image
+    within the bounding box of the ROI is converted to an array, the
+    ROI pixels are gathered from it in a single pass and the stats
+    are calculated from 256 bin histograms (see roistats.py).  If
+    decoded (the roimask.DecodedMask for the mask) is passed its
+    bounding box and ROI pixel index are used rather than finding
+    them from the mask.
     """
 
-    # split into bands
-    try:
-        (im_r, im_g, im_b) = im.split()
-    except ValueError:
+    # we need a 3-band 8-bit image
+    if len(im.getbands()) != 3:
         sys.stderr.write("Wrong image type\n")
         return None
 
-    # create numpy arrays with bands
-    r_array = np.asarray(im_r, dtype=np.int16)
-    g_array = np.asarray(im_g, dtype=np.int16)
-    b_array = np.asarray(im_b, dtype=np.int16)
-    brt_array = r_array + g_array + b_array
-
     # check that the image isn't nearly all black or all white in
     # which case getting the stats fails.  Eliminate the outer 30
     # pixels in case there is a banner/overlay on the image.
     #
-    # NOTE: this is using almost entire image not just ROI
+    # NOTE: this is using (a subsample of) almost entire image not
+    # just ROI
+    brt_mean = roistats.image_brightness(im)
 
-    if brt_array[30:-30, 30:-30].mean() < 30.0:
+    if brt_mean < 30.0:
         warningstr = "WARNING: mostly dark image.\n"
         sys.stderr.write(warningstr)
-        r_mean = ND_FLOAT
-        r_std = ND_FLOAT
-        r_pcts = [ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT]
-        g_mean = ND_FLOAT
-        g_std = ND_FLOAT
-        g_pcts = [ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT]
-        b_mean = ND_FLOAT
-        b_std = ND_FLOAT
-        b_pcts = [ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT]
-        RG_cor = ND_FLOAT
-        GB_cor = ND_FLOAT
-        BR_cor = ND_FLOAT
-        return [
-            {"mean": r_mean, "stdev": r_std, "percentiles": r_pcts},
-            {"mean": g_mean, "stdev": g_std, "percentiles": g_pcts},
-            {"mean": b_mean, "stdev": b_std, "percentiles": b_pcts},
-            RG_cor,
-            GB_cor,
-            BR_cor,
-        ]
+        return _nd_roi_stats()
 
-    if brt_array[30:-30, 30:-30].mean() > 725.0:
+    if brt_mean > 725.0:
         warningstr = "WARNING: mostly white image.\n"
         sys.stderr.write(warningstr)
-        r_mean = ND_FLOAT
-        r_std = ND_FLOAT
-        r_pcts = [ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT]
-        g_mean = ND_FLOAT
-        g_std = ND_FLOAT
-        g_pcts = [ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT]
-        b_mean = ND_FLOAT
-        b_std = ND_FLOAT
-        b_pcts = [ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT, ND_FLOAT]
-        RG_cor = ND_FLOAT
-        GB_cor = ND_FLOAT
-        BR_cor = ND_FLOAT
-        return [
-            {"mean": r_mean, "stdev": r_std, "percentiles": r_pcts},
-            {"mean": g_mean, "stdev": g_std, "percentiles": g_pcts},
-            {"mean": b_mean, "stdev": b_std, "percentiles": b_pcts},
-            RG_cor,
-            GB_cor,
-            BR_cor,
-        ]
+        return _nd_roi_stats()
 
-    # try applying mask to red image ... if mask and image don't
-    # have same size this will raise an exception.
-    try:
-        r_ma = np.ma.array(r_array, mask=roimask)
-    except Exception as inst:
-        print(inst)
+    # check that mask and image have the same size
+    if np.shape(roimask)[0:2] != (im.size[1], im.size[0]):
         errstr = "Error applying mask to image file.\n"
         sys.stderr.write(errstr)
         return None
 
-    # make masked arrays for G,B
-    g_ma = np.ma.array(g_array, mask=roimask)
-    b_ma = np.ma.array(b_array, mask=roimask)
+    if decoded is None:
+        decoded = mask_info(roimask)
 
-    # find mean and std values
-    r_vals = r_ma.compressed()
-    r_mean = r_vals.mean()
-    r_diff = np.float64(r_vals) - r_mean
-    r_std = np.sqrt(np.dot(r_diff, r_diff) / r_vals.size)
-
-    g_vals = g_ma.compressed()
-    g_mean = g_vals.mean()
-    g_diff = np.float64(g_vals) - g_mean
-    g_std = np.sqrt(np.dot(g_diff, g_diff) / g_vals.size)
-
-    b_vals = b_ma.compressed()
-    b_mean = b_vals.mean()
-    b_diff = np.float64(b_vals) - b_mean
-    b_std = np.sqrt(np.dot(b_diff, b_diff) / b_vals.size)
-
-    # calculate percentiles for each array
-    r_pcts = np.percentile(r_vals, (5.0, 10.0, 25.0, 50.0, 75.0, 90.0, 95.0))
-    g_pcts = np.percentile(g_vals, (5.0, 10.0, 25.0, 50.0, 75.0, 90.0, 95.0))
-    b_pcts = np.percentile(b_vals, (5.0, 10.0, 25.0, 50.0, 75.0, 90.0, 95.0))
-
-    # calculate covariance matrices and get cross-diagonal terms
-    rg_cov = np.dot(r_diff, g_diff) / r_diff.size
-    gb_cov = np.dot(g_diff, b_diff) / g_diff.size
-    br_cov = np.dot(b_diff, r_diff) / b_diff.size
-
-    # calculate correlation coefficient
-    RG_cor = rg_cov / (r_std * g_std)
-    GB_cor = gb_cov / (g_std * b_std)
-    BR_cor = br_cov / (b_std * r_std)
-
-    # if the above calculation can return a NaN then
-    # I should probably trap that here and return a
-
-    # return list of values
-    return [
-        {"mean": r_mean, "stdev": r_std, "percentiles": r_pcts},
-        {"mean": g_mean, "stdev": g_std, "percentiles": g_pcts},
-        {"mean": b_mean, "stdev": b_std, "percentiles": b_pcts},
-        RG_cor,
-        GB_cor,
-        BR_cor,
-    ]
+    im_array = decoded.crop_image(im)
+    return roistats.rgb_roi_stats(im_array, decoded.crop_index())
 
 
 ######################################################################
@@ -260,26 +289,6 @@ def get_im_metadata(impath):
 ######################################################################
 
 
-def _filter_comments(f):
-    """
-    filter comments from csv file
-    """
-    for line in f:
-        line = line.rstrip()
-        if line and not line.startswith("#"):
-            yield line
-
-
-def _get_comments(f):
-    """
-    return JUST the comment lines from a csv file
-    """
-    for line in f:
-        line = line.rstrip()
-        if line and line.startswith("#"):
-            yield line
-
-
 def _get_comment_field(comments, var_string):
     """
     return value of a field from a list of comment lines
@@ -350,18 +359,45 @@ class ROITimeSeries(object):
 
     """
 
-    def __init__(self, site="", ROIListID="", resizeFlag=False):
+    def __init__(self, site="", ROIListID="", resizeFlag=False, decodeScale=1):
         """
-        create ROITimeSeries object
+        create ROITimeSeries object.  If decodeScale is greater than
+        1 images are decoded at reduced resolution (1/2, 1/4 or 1/8)
+        and the ROI masks are reduced to match.
         """
 
+        if decodeScale not in config.DECODE_SCALES:
+            errmsg = "Invalid decode scale: {0}".format(decodeScale)
+            raise ValueError(errmsg)
+
         self.site = site
         self.roilistid = ROIListID
         # self.irFlg = irFlag
         self.resizeFlg = resizeFlag
+        self.decodeScale = decodeScale
         self.created_at = datetime.now()
         self.updated_at = datetime.now()
-        self.rows = []
+
+        # the rows are kept as columns of numpy arrays (see
+        # columnar.py) with self.rows as a list-like view of row
+        # dictionaries.
+        self._set_data(columnar.ColumnStore(ROITS_COLUMNS))
+
+        # number of rows passing each selection criterion from the
+        # last call to select_index()
+        self.selection_counts = None
+
+        # datetime of the first row read for a partial timeseries
+        # read with readCSV(since=...), None if all rows were read
+        self.since = None
+
+        # cache of the decoded mask info for the last mask used
+        self._roimask = None
+        self._mask_info = None
+
+        # cache of the reduced ROI mask for the last mask used
+        self._fullmask = None
+        self._reducedmask = None
 
         # split ROIListID into roitype, and sequence_number
         roitype, sequence_number = ROIListID.split("_")
@@ -383,35 +419,142 @@ class ROITimeSeries(object):
         self.elev = si["elev"]
         self.tzoffset = si["tzoffset"]
 
+    @property
+    def rows(self):
+        """
+        list-like view of the timeseries rows as dictionaries.  The
+        dictionaries are created when accessed so changing one
+        doesn't change the timeseries.
+        """
+        return columnar.RowsView(self.data, _make_rows)
+
+    @rows.setter
+    def rows(self, rows):
+        self._set_data(columnar.ColumnStore.from_rows(ROITS_COLUMNS, rows))
+
+    def _set_data(self, store):
+        """
+        set the column store for the rows, indexed by filename and
+        ordered by datetime.
+        """
+        store.set_key("filename")
+        store.set_order("datetime")
+        self.data = store
+
+    def find_row(self, filename):
+        """
+        return the index of the row for an image file name or None
+        if the image isn't in the timeseries.
+        """
+        return self.data.find(filename)
+
+    def get_row_indices(self, startDT, endDT):
+        """
+        return the indices of the rows with image datetimes between
+        startDT and endDT (inclusive) in datetime order.
+        """
+        return self.data.range_index(
+            np.datetime64(startDT, "s"), np.datetime64(endDT, "s")
+        )
+
+    def get_column(self, name):
+        """
+        return the numpy array of values for a column.  Missing
+        float values are NaN, missing int values are -9999 and
+        datetimes are datetime64 values.
+        """
+        return self.data.column(name)
+
     def get_image_list(self):
         """
         return list of images in an ROI timeseries
         """
-        imglist = [row["filename"] for row in self.rows]
+        imglist = self.data.column("filename").tolist()
 
         return imglist
 
-    def create_row(self, impath, roimask, mask_index):
+    def _get_mask_info(self, roimask):
         """
-        create a ROITimeSeries row dictionary for a given image and
-        ROI mask.
+        return the roimask.DecodedMask (with the bounding box and
+        index of the ROI pixels) for a mask.  It is only looked up
+        again when a different mask is passed.
         """
+        if roimask is not self._roimask:
+            self._mask_info = mask_info(roimask)
+            self._roimask = roimask
 
-        # extract datetime from filename
-        img_file = os.path.basename(impath)
-        img_DT = utils.fn2datetime(self.site, img_file, irFlag=False)
-        img_date = img_DT.date()
-        img_time = img_DT.time()
+        return self._mask_info
 
-        # get doy
-        # img_doy = img_DT.timetuple().tm_yday
+    def _get_reduced_mask(self, roimask):
+        """
+        return the ROI mask reduced to match images decoded at the
+        decode scale.  The reduced mask is only recalculated when a
+        different mask is passed.
+        """
+        if roimask is not self._fullmask:
+            self._reducedmask = mask_info(roimask).reduced(self.decodeScale).mask
+            self._fullmask = roimask
 
-        # find sun elevation (degrees)
-        sun_elev = utils.sunelev(self.lat, self.lon, img_DT, self.tzoffset)
+        return self._reducedmask
+
+    def get_sun_elevs(self, imglist):
+        """
+        return an array of solar elevations (degrees) for a list of
+        image paths calculated in a single batch.
+        """
+        img_DTs = [
+            utils.fn2datetime(self.site, os.path.basename(impath), irFlag=False)
+            for impath in imglist
+        ]
 
-        # Try to load image
+        return utils.sunelev_array(self.lat, self.lon, img_DTs, self.tzoffset)
+
+    def create_rows(self, imglist, roimask, mask_index):
+        """
+        create ROITimeSeries row dictionaries for a list of images
+        which use the same ROI mask.  The solar elevations are
+        calculated for the whole batch.  Returns a list of rows (or
+        None for images which couldn't be processed) in the same
+        order as the image list.
+        """
+        if len(imglist) == 0:
+            return []
+
+        sun_elevs = self.get_sun_elevs(imglist)
+
+        return [
+            self.create_row(impath, roimask, mask_index, sun_elev=float(sun_elev))
+            for impath, sun_elev in zip(imglist, sun_elevs)
+        ]
+
+    def decode_key(self, roimask):
+        """
+        return a key for the decoded image used with an ROI mask.
+        The image decoded by decode_image() only depends on the
+        decode scale and the mask size so ROIs (or ROITimeSeries
+        objects) with the same key can share a decoded image.
+        """
+        return (self.decodeScale, np.shape(roimask))
+
+    def decode_image(self, impath, roimask):
+        """
+        decode an image for use with an ROI mask, at reduced
+        resolution if the decode scale is greater than one.  Returns
+        the PIL image or None if the image couldn't be read.
+        """
+
+        # reduce the mask to match a reduced resolution decode
+        if self.decodeScale > 1:
+            fullsize = np.shape(roimask)
+            roimask = self._get_reduced_mask(roimask)
+
+        # Try to load image.  For a reduced resolution decode let
+        # libjpeg do the scaling (a no-op for other formats).
         try:
             im = Image.open(impath, "r")
+            if self.decodeScale > 1:
+                ysize, xsize = roimask.shape
+                im.draft("RGB", (xsize, ysize))
             im.load()
         except IOError:
             errstr1 = "Unable to open file: %s\n" % (impath,)
@@ -420,6 +563,45 @@ class ROITimeSeries(object):
             sys.stderr.write(errstr2)
             return None
 
+        # if the image wasn't scaled when decoded reduce it here
+        if self.decodeScale > 1:
+            if (im.size[1], im.size[0]) == fullsize:
+                im = im.reduce(self.decodeScale)
+
+        return im
+
+    def create_row(self, impath, roimask, mask_index, sun_elev=None, im=None):
+        """
+        create a ROITimeSeries row dictionary for a given image and
+        ROI mask.  If the solar elevation isn't passed it is
+        calculated for the image.  If im (the image decoded by
+        decode_image() for this or another ROI with the same
+        decode_key()) is passed the image isn't decoded again.
+        """
+
+        # extract datetime from filename
+        img_file = os.path.basename(impath)
+        img_DT = utils.fn2datetime(self.site, img_file, irFlag=False)
+        img_date = img_DT.date()
+        img_time = img_DT.time()
+
+        # get doy
+        # img_doy = img_DT.timetuple().tm_yday
+
+        # find sun elevation (degrees)
+        if sun_elev is None:
+            sun_elev = utils.sunelev(self.lat, self.lon, img_DT, self.tzoffset)
+
+        # decode the image
+        if im is None:
+            im = self.decode_image(impath, roimask)
+            if im is None:
+                return None
+
+        # reduce the mask to match a reduced resolution decode
+        if self.decodeScale > 1:
+            roimask = self._get_reduced_mask(roimask)
+
         # Try to load image metadata file
         im_metadata = get_im_metadata(impath)
 
@@ -430,12 +612,14 @@ class ROITimeSeries(object):
                 warnmsg = "Resizing image {0} to match mask.\n"
                 warnmsg = warnmsg.format(img_file)
                 sys.stdout.write(warnmsg)
-                im = im.resize((xsize, ysize), Image.ANTIALIAS)
+                im = im.resize((xsize, ysize), Image.LANCZOS)
 
         # find mean values over ROI
         try:
             # [dn_r, dn_g, dn_b, brt] = get_dn_means(im, roimask)
-            roistats_list = get_roi_stats(im, roimask)
+            roistats_list = get_roi_stats(
+                im, roimask, decoded=self._get_mask_info(roimask)
+            )
 
         except KeyboardInterrupt:
             sys.exit()
@@ -552,7 +736,7 @@ class ROITimeSeries(object):
 
         return roits_row
 
-    def insert_row(self, impath, roimask, mask_index):
+    def insert_row(self, impath, roimask, mask_index, sun_elev=None):
         """
         create a ROITimeSeries row dictionary and insert it into
         self.rows list and return the row dictionary.  If there is
@@ -560,35 +744,29 @@ class ROITimeSeries(object):
         """
 
         # create row dictionary
-        roits_row = self.create_row(impath, roimask, mask_index)
+        roits_row = self.create_row(impath, roimask, mask_index, sun_elev=sun_elev)
         if not roits_row:
             return None
 
         # use file name as key, only one row per image file
-        rowfn = roits_row["filename"]
-        FN_INDEX = [row["filename"] for row in self.rows]
-        try:
-            row_index = FN_INDEX.index(rowfn)
-        except ValueError:
-            row_index = None
+        row_index = self.find_row(roits_row["filename"])
 
         # replace or append
-        if row_index:
-            self.rows.pop(row_index)
-            self.rows.append(roits_row)
+        if row_index is not None:
+            self.data.set_row(row_index, roits_row)
         else:
             self.rows.append(roits_row)
 
         return roits_row
 
-    def append_row(self, impath, roimask, mask_index):
+    def append_row(self, impath, roimask, mask_index, sun_elev=None):
         """
         create a ROITimeSeries row dictionary and append it to
         self.rows list and return the row dictionary.
         """
 
         # create row dictionary
-        roits_row = self.create_row(impath, roimask, mask_index)
+        roits_row = self.create_row(impath, roimask, mask_index, sun_elev=sun_elev)
 
         # append row
         if roits_row:
@@ -726,18 +904,11 @@ class ROITimeSeries(object):
 
         return csvstr
 
-    def writeCSV(self, file=""):
+    def get_csv_header(self):
         """
-        Method for writing an ROITimeSeries to CSV file.  The method
-        opens the file for writing.  If no filename is passed
-        then write to stdout.
+        return a list of the CSV header lines (the comment lines and
+        the fields line) for the timeseries.
         """
-        if file == "":
-            fo = sys.stdout
-        else:
-            fo = open(file, "w")
-
-        # write header
         hdstrings = []
         hdstrings.append("#\n")
         hdstrings.append(
@@ -752,6 +923,8 @@ class ROITimeSeries(object):
         hdstrings.append("# Elev: {0}\n".format(self.elev))
         hdstrings.append("# UTC Offset: {0}\n".format(self.tzoffset))
         hdstrings.append("# Resize Flag: {0}\n".format(self.resizeFlg))
+        if self.decodeScale != 1:
+            hdstrings.append("# Decode Scale: {0}\n".format(self.decodeScale))
         hdstrings.append("# Version: 1\n")
         hdstrings.append("# Creation Date: {0}\n".format(self.created_at.date()))
         create_time = self.created_at.time()
@@ -760,9 +933,6 @@ class ROITimeSeries(object):
                 create_time.hour, create_time.minute, create_time.second
             )
         )
-
-        # set update date and time
-        self.updated_at = datetime.now()
         update_time = self.updated_at.time()
         hdstrings.append("# Update Date: {0}\n".format(self.updated_at.date()))
         hdstrings.append(
@@ -771,41 +941,181 @@ class ROITimeSeries(object):
             )
         )
         hdstrings.append("#\n")
-        for line in hdstrings:
-            fo.write(line)
 
-        # write fields line
-        fields_str = (
-            "date,local_std_time,doy,filename,solar_elev,"
-            + "exposure,awbflag,mask_index,gcc,rcc,"
-            + "r_mean,r_std,r_5_qtl,r_10_qtl,r_25_qtl,r_50_qtl,"
-            + "r_75_qtl,r_90_qtl,r_95_qtl,"
-            + "g_mean,g_std,g_5_qtl,g_10_qtl,g_25_qtl,g_50_qtl,"
-            + "g_75_qtl,g_90_qtl,g_95_qtl,"
-            + "b_mean,b_std,b_5_qtl,b_10_qtl,b_25_qtl,b_50_qtl,"
-            + "b_75_qtl,b_90_qtl,b_95_qtl,"
-            + "r_g_correl,g_b_correl,b_r_correl\n"
-        )
-        fo.write(fields_str)
+        # fields line
+        hdstrings.append(",".join(ROITS_CSV_FIELDS) + "\n")
+
+        return hdstrings
+
+    def writeCSV(self, file="", sidecar=None):
+        """
+        Method for writing an ROITimeSeries to CSV file.  The method
+        opens the file for writing.  If no filename is passed
+        then write to stdout.  A partial timeseries (see readCSV())
+        can't be written, use appendCSV() or read_earlier_rows()
+        first.  If sidecar is True (or None and
+        config.write_sidecar is set) a binary sidecar file is also
+        written (see csvreader.write_sidecar()).
+        """
+        if self.since is not None:
+            errmsg = "Partial timeseries (rows since {0}) can't be written".format(
+                self.since
+            )
+            raise ValueError(errmsg)
+
+        if file == "":
+            fo = sys.stdout
+        else:
+            fo = open(file, "w")
+
+        # set update date and time and write header
+        self.updated_at = datetime.now()
+        for line in self.get_csv_header():
+            fo.write(line)
 
         # sort rows by datetime before writing
-        rows = self.rows
-        rows_sorted = sorted(rows, key=lambda k: k["datetime"])
-        self.rows = rows_sorted
+        self.data.sort("datetime")
 
-        # print rows in timeseries
-        nout = 0
-        for row in self.rows:
-            rowstr = self.format_csvrow(row)
-            fo.write("{0}\n".format(rowstr))
-            nout += 1
+        # write rows in timeseries a block at a time
+        nout = len(self.data)
+        for start in range(0, nout, CSV_WRITE_ROWS):
+            stop = min(start + CSV_WRITE_ROWS, nout)
+            fo.write(format_csv_rows(self.data, start, stop))
 
         # close output
         if not file == "":
             fo.close()
+            if sidecar or (sidecar is None and config.write_sidecar):
+                csvreader.write_sidecar(file, dict(ROITS_COLUMNS))
 
         return nout
 
+    def appendCSV(self, file, start, sidecar=None):
+        """
+        Method for updating an ROITimeSeries CSV file (written by
+        writeCSV) by appending the rows from index start on.  Only
+        the Update Date and Update Time header lines are rewritten
+        (in place since they have a fixed width) and the new rows
+        are written at the end of the file.
+
+        The file can only be updated this way if the rows are in
+        datetime order (so writeCSV would write them in the same
+        order) and the rest of the header is unchanged.  If not,
+        None is returned without changing the file and writeCSV
+        should be used.  Otherwise the number of rows in the file is
+        returned.
+
+        A partial timeseries (see readCSV()) can be appended as long
+        as start is after the rows which were read.  The rows already
+        in the file are then counted to get the number of rows.  The
+        sidecar argument is the same as for writeCSV(), except an up
+        to date sidecar is extended with the new rows (see
+        csvreader.extend_sidecar()) rather than written again.
+        """
+        nrows = len(self.data)
+        dts = self.data.column("datetime")
+        if np.any(dts[1:] < dts[:-1]):
+            return None
+
+        # the sidecar is extended with the appended rows, so read
+        # it while it's still up to date
+        kinds = dict(ROITS_COLUMNS)
+        old_sidecar = None
+        write_sidecar = sidecar or (sidecar is None and config.write_sidecar)
+        if write_sidecar:
+            old_sidecar = csvreader.read_sidecar(file, kinds)
+
+        self.updated_at = datetime.now()
+        hdlines = [line.encode("utf-8") for line in self.get_csv_header()]
+
+        with open(file, "r+b") as fo:
+
+            # compare header lines, keeping track of the position of
+            # the lines which need to change.
+            updates = []
+            for hdline in hdlines:
+                pos = fo.tell()
+                line = fo.readline()
+                if line == hdline:
+                    continue
+                if (
+                    len(line) == len(hdline)
+                    and line.startswith((b"# Update Date: ", b"# Update Time: "))
+                    and line[0:15] == hdline[0:15]
+                ):
+                    updates.append((pos, hdline))
+                    continue
+                return None
+
+            # the rest of the file should be the rows already read
+            data_start = fo.tell()
+            fo.seek(0, os.SEEK_END)
+            file_end = fo.tell()
+            if file_end > data_start:
+                fo.seek(file_end - 1)
+                if fo.read(1) != b"\n":
+                    return None
+
+            # the rows before start are in the file unless only the
+            # end of the file was read
+            nfile = start
+            if self.since is not None:
+                fo.seek(data_start)
+                blocks = iter(lambda: fo.read(CSV_COUNT_BLOCK), b"")
+                nfile = sum(block.count(b"\n") for block in blocks)
+
+            # append the new rows, then update the header
+            fo.seek(file_end)
+            appended = []
+            for block_start in range(start, nrows, CSV_WRITE_ROWS):
+                block_stop = min(block_start + CSV_WRITE_ROWS, nrows)
+                csv_rows = format_csv_rows(self.data, block_start, block_stop)
+                fo.write(csv_rows.encode("utf-8"))
+                if write_sidecar:
+                    appended.append(csv_rows)
+
+            for pos, hdline in updates:
+                fo.seek(pos)
+                fo.write(hdline)
+
+        if write_sidecar:
+            csvreader.extend_sidecar(file, kinds, old_sidecar, "".join(appended))
+        return nfile + nrows - start
+
+    def select_index(
+        self,
+        tod_min=config.TIME_MIN,
+        tod_max=config.TIME_MAX,
+        sunelev_min=config.MIN_SUN_ANGLE,
+        brt_min=config.MIN_BRT,
+        brt_max=config.MAX_BRT,
+    ):
+        """
+        return an array of the indices (in datetime order) of the
+        rows which meet the selection criteria for brightness, solar
+        elevation and time of day.  Rows where the image is
+        completely black (no-data means) are not selected.  The
+        number of rows passing each criterion is saved in
+        self.selection_counts.
+        """
+        brt = (
+            self.data.column("r_mean")
+            + self.data.column("g_mean")
+            + self.data.column("b_mean")
+        )
+        index, self.selection_counts = columnar.select_index(
+            self.data.column("datetime"),
+            brt,
+            self.data.column("solar_elev"),
+            tod_min,
+            tod_max,
+            sunelev_min,
+            brt_min,
+            brt_max,
+        )
+
+        return index
+
     def select_rows(
         self,
         tod_min=config.TIME_MIN,
@@ -815,43 +1125,41 @@ class ROITimeSeries(object):
         brt_max=config.MAX_BRT,
     ):
         """
-        routine to return a list of the rows in self.rows
-        which meet the selection criteria for brightness
-        and time of day.  Numpy probably has a better (i.e. faster)
-        way to do this. Also remove rows where thie image is
-        completely black.
-        """
-        selected_rows = []
-        for row in self.rows:
-            brt = row["r_mean"] + row["g_mean"] + row["b_mean"]
-            if (
-                (row["datetime"].time() < tod_min)
-                or (row["datetime"].time() > tod_max)
-                or (row["r_mean"] == ND_INT)
-                or (brt < brt_min)
-                or (brt > brt_max)
-                or (row["solar_elev"] < sunelev_min)
-            ):
-                continue
-            else:
-                selected_rows.append(row)
-
-        rows = sorted(selected_rows, key=lambda k: k["datetime"])
-
-        return rows
-
-    def readCSV(self, roiTimeSeriesPath):
+        routine to return the rows which meet the selection criteria
+        for brightness and time of day (see select_index()) sorted
+        by datetime.  The rows are a list-like view of a copy of the
+        selected columns.
+        """
+        index = self.select_index(
+            tod_min=tod_min,
+            tod_max=tod_max,
+            sunelev_min=sunelev_min,
+            brt_min=brt_min,
+            brt_max=brt_max,
+        )
+
+        return columnar.RowsView(self.data.take(index), _make_rows)
+
+    def readCSV(self, roiTimeSeriesPath, since=None, sidecar=False, mmap=False):
         """
         Method to read ROITimeSeries object from CSV file and return
         a ROITimeSeries object.  If the comment fields are not present
-        they must be set before the object can be written.
+        they must be set before the object can be written.  If since
+        (a datetime) is given only rows at or after since are read
+        (the rows are found by reading back from the end of the
+        file).  The partial timeseries can be extended and written
+        with appendCSV().  If sidecar is True the columns are loaded
+        from an up to date binary sidecar file if there is one.  If
+        mmap is True the numeric columns are read-only memory maps of
+        the sidecar file, which is written first if needed (see
+        csvreader.read_csv()).  They are copied if rows are changed.
         """
 
-        # open file for reading
-        f = open(roiTimeSeriesPath, "r")
-
-        # get comment lines
-        comments = list(_get_comments(f))
+        # read comment lines and data columns
+        kinds = dict(ROITS_COLUMNS)
+        comments, columns = csvreader.read_csv(
+            roiTimeSeriesPath, kinds, since=since, sidecar=sidecar, mmap=mmap
+        )
 
         # no validation applied to sitename
         site = _get_comment_field(comments, "Site")
@@ -875,6 +1183,11 @@ class ROITimeSeries(object):
             if resizeflg == "True":
                 self.resizeFlg = True
 
+        # get Decode Scale if found in header
+        decodescale = _get_comment_field(comments, "Decode Scale")
+        if decodescale != "":
+            self.decodeScale = int(decodescale)
+
         # make sure we can form a proper date time from create_date and
         # create_time
         create_date = _get_comment_field(comments, "Creation Date")
@@ -903,72 +1216,39 @@ class ROITimeSeries(object):
 
         # do I need to grab lat, lon, elev and tzoffset?  Probably!
 
-        # get timeseries rows
-        f.seek(0)
-        csvrdr = csv.DictReader(_filter_comments(f))
-
-        roitsRows = []
-        for row in csvrdr:
-
-            # turn date and time strings into datetime values
-            (im_yr, im_mo, im_dom) = row["date"].split("-")
-            (im_hr, im_min, im_sec) = row["local_std_time"].split(":")
-            im_dt = datetime(
-                int(im_yr),
-                int(im_mo),
-                int(im_dom),
-                int(im_hr),
-                int(im_min),
-                int(im_sec),
+        # turn date and time strings into datetime values.  Missing
+        # columns (e.g. awbflag in older files) are filled with no-data
+        # values.
+        if columns and "datetime" not in columns:
+            columns["datetime"] = csvreader.datetime_column(
+                columns["date"], columns["local_std_time"]
             )
 
-            row["datetime"] = im_dt
-
-            # check for awbflag
-            if "awbflag" not in row.keys():
-                row["awbflag"] = ND_INT
-
-            # convert strings to numbers - there's got to be a more
-            # efficient way to do this!
-            row["solar_elev"] = _float_or_none(row["solar_elev"])
-            row["exposure"] = _int_or_none(_float_or_none(row["exposure"]))
-            row["awbflag"] = _int_or_none(_float_or_none(row["awbflag"]))
-            row["mask_index"] = _int_or_none(row["mask_index"])
-            row["gcc"] = _float_or_none(row["gcc"])
-            row["rcc"] = _float_or_none(row["rcc"])
-            row["r_mean"] = _float_or_none(row["r_mean"])
-            row["r_std"] = _float_or_none(row["r_std"])
-            row["r_5_qtl"] = _float_or_none(row["r_5_qtl"])
-            row["r_10_qtl"] = _float_or_none(row["r_10_qtl"])
-            row["r_25_qtl"] = _float_or_none(row["r_25_qtl"])
-            row["r_50_qtl"] = _float_or_none(row["r_50_qtl"])
-            row["r_75_qtl"] = _float_or_none(row["r_75_qtl"])
-            row["r_90_qtl"] = _float_or_none(row["r_90_qtl"])
-            row["r_95_qtl"] = _float_or_none(row["r_95_qtl"])
-            row["g_mean"] = _float_or_none(row["g_mean"])
-            row["g_std"] = _float_or_none(row["g_std"])
-            row["g_5_qtl"] = _float_or_none(row["g_5_qtl"])
-            row["g_10_qtl"] = _float_or_none(row["g_10_qtl"])
-            row["g_25_qtl"] = _float_or_none(row["g_25_qtl"])
-            row["g_50_qtl"] = _float_or_none(row["g_50_qtl"])
-            row["g_75_qtl"] = _float_or_none(row["g_75_qtl"])
-            row["g_90_qtl"] = _float_or_none(row["g_90_qtl"])
-            row["g_95_qtl"] = _float_or_none(row["g_95_qtl"])
-            row["b_mean"] = _float_or_none(row["b_mean"])
-            row["b_std"] = _float_or_none(row["b_std"])
-            row["b_5_qtl"] = _float_or_none(row["b_5_qtl"])
-            row["b_10_qtl"] = _float_or_none(row["b_10_qtl"])
-            row["b_25_qtl"] = _float_or_none(row["b_25_qtl"])
-            row["b_50_qtl"] = _float_or_none(row["b_50_qtl"])
-            row["b_75_qtl"] = _float_or_none(row["b_75_qtl"])
-            row["b_90_qtl"] = _float_or_none(row["b_90_qtl"])
-            row["b_95_qtl"] = _float_or_none(row["b_95_qtl"])
-            row["r_g_correl"] = _float_or_none(row["r_g_correl"])
-            row["g_b_correl"] = _float_or_none(row["g_b_correl"])
-            row["b_r_correl"] = _float_or_none(row["b_r_correl"])
-            roitsRows.append(row)
-
-        # do I need to sort here?
-
-        self.rows = roitsRows
-        f.close()
+        self._set_data(columnar.ColumnStore.from_columns(ROITS_COLUMNS, columns))
+        self.since = since
+
+    def read_earlier_rows(self, roiTimeSeriesPath):
+        """
+        add the rows before since from the CSV file to a partial
+        timeseries (from readCSV() with since) so the whole timeseries
+        can be written with writeCSV().
+        """
+        if self.since is None:
+            return
+
+        kinds = dict(ROITS_COLUMNS)
+        comments, columns = csvreader.read_csv(roiTimeSeriesPath, kinds)
+        if columns:
+            columns["datetime"] = csvreader.datetime_column(
+                columns["date"], columns["local_std_time"]
+            )
+            earlier = columns["datetime"] < np.datetime64(self.since, "s")
+            for name, kind in ROITS_COLUMNS:
+                columns[name] = np.concatenate(
+                    [columns[name][earlier], self.data.column(name)]
+                )
+
+            store = columnar.ColumnStore.from_columns(ROITS_COLUMNS, columns)
+            self._set_data(store)
+
+        self.since = None
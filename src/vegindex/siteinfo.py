@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+"""
+Site information lookups.
+
+Site information (lat, lon, elev, tzoffset, ...) comes from the
+local site information CSV file if the site is found there.  The
+file is only read once per process (or again if it changes).  For
+other sites the information is requested from the PhenoCam server
+with a timeout and cached on disk so it is only requested again when
+the cached copy is older than config.SITE_INFO_TTL seconds.  If
+config.offline is set no network requests are made.
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+import requests
+
+from . import config
+
+INFO_URL = "https://phenocam.nau.edu/webcam/sites/{0}/info/"
+
+# process wide caches
+_local_cache = {"key": None, "sites": None}
+_remote_cache = {}
+
+
+def clear_cache():
+    """
+    clear the in memory site info caches
+    """
+    _local_cache["key"] = None
+    _local_cache["sites"] = None
+    _remote_cache.clear()
+
+
+def read_local_site_info(site_info_file=None):
+    """
+    Return a dictionary of site info dictionaries (keyed by site
+    name) from the local site information CSV file.  The file is
+    only parsed again if its modification time or size has changed.
+    Returns None if the file can't be read.
+    """
+    if site_info_file is None:
+        site_info_file = config.site_info_file
+
+    try:
+        st = os.stat(site_info_file)
+    except OSError:
+        return None
+
+    key = (site_info_file, st.st_mtime, st.st_size)
+    if _local_cache["key"] == key:
+        return _local_cache["sites"]
+
+    try:
+        df = pd.read_csv(site_info_file, comment="#")
+    except IOError:
+        return None
+
+    # convert through JSON so values have the same types as the
+    # remote site info
+    records = json.loads(df.to_json(orient="records"))
+    sites = {}
+    for record in records:
+        sites.setdefault(record["sitename"], record)
+
+    _local_cache["key"] = key
+    _local_cache["sites"] = sites
+
+    return sites
+
+
+def _get_cache_path(sitename):
+    """
+    return the path of the disk cache file for a site
+    """
+    cache_dir = config.site_info_cache_dir
+    return os.path.join(cache_dir, "{0}_info.json".format(sitename))
+
+
+def _read_disk_cache(sitename, max_age=None):
+    """
+    return cached site info for a site if there is a cached copy
+    no older than max_age seconds (any age if max_age is None).
+    """
+    if not config.site_info_cache_dir:
+        return None
+
+    cache_path = _get_cache_path(sitename)
+    try:
+        age = time.time() - os.path.getmtime(cache_path)
+        if max_age is not None and age > max_age:
+            return None
+        with open(cache_path, "r") as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _write_disk_cache(sitename, siteinfo):
+    """
+    write site info to the disk cache.  Failure to write the cache
+    is not fatal.
+    """
+    if not config.site_info_cache_dir:
+        return
+
+    cache_path = _get_cache_path(sitename)
+    tmp_path = "{0}.{1}.tmp".format(cache_path, os.getpid())
+    try:
+        if not os.path.isdir(config.site_info_cache_dir):
+            os.makedirs(config.site_info_cache_dir)
+        with open(tmp_path, "w") as f:
+            json.dump(siteinfo, f)
+        os.replace(tmp_path, cache_path)
+    except (IOError, OSError):
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def get_remote_site_info(sitename):
+    """
+    Return the site info for a site from the PhenoCam server (or the
+    disk cache if it is recent enough).  Returns None if offline or
+    if the request fails and there is no cached copy.
+    """
+    if sitename in _remote_cache:
+        return _remote_cache[sitename]
+
+    siteinfo = _read_disk_cache(sitename, max_age=config.SITE_INFO_TTL)
+
+    if siteinfo is None and not config.offline:
+        infourl = INFO_URL.format(sitename)
+        try:
+            response = requests.get(infourl, timeout=config.SITE_INFO_TIMEOUT)
+            response.raise_for_status()
+            siteinfo = response.json()
+            _write_disk_cache(sitename, siteinfo)
+        except (requests.exceptions.RequestException, ValueError):
+            siteinfo = None
+
+    # an out of date copy is better than nothing
+    if siteinfo is None:
+        siteinfo = _read_disk_cache(sitename)
+
+    if siteinfo is not None:
+        _remote_cache[sitename] = siteinfo
+
+    return siteinfo
+
+
+def get_site_info(sitename):
+    """
+    Return the site info for a single site in a dictionary.  The
+    local site information file is used first and then the
+    (cached) site info from the PhenoCam server.  Exits if the site
+    can't be found and the local file can't be read.
+    """
+    sites = read_local_site_info()
+    if sites is not None and sitename in sites:
+        return dict(sites[sitename])
+
+    siteinfo = get_remote_site_info(sitename)
+    if siteinfo is not None:
+        return dict(siteinfo)
+
+    if sites is None:
+        sys.stderr.write("Error getting site info from file.\n")
+        sys.exit(-1)
+
+    return None
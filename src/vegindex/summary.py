@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+
+"""
+Grouped statistics for the GCC summary timeseries.
+
+The summary scripts used to walk the selected ROI timeseries rows one
+aggregation period at a time, accumulating lists of values and
+computing each statistic separately.  Here every row is assigned the
+id of the period it falls in (following the daterange2() periods)
+and the statistics for all periods are computed together with numpy.
+
+Sums are done with np.sum() over blocks of equal length periods so
+that the means and standard deviations are exactly the same as
+np.nanmean() and np.nanstd() on each period.  Quantiles are calculated
+with quantile.quantiles() and are the same as quantile.quantile()
+(R type 7).
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+from datetime import datetime
+from datetime import timedelta
+
+import numpy as np
+
+from . import config
+from .quantile import quantiles
+from .vegindex import daterange2
+
+ND_FLOAT = config.ND_FLOAT
+ND_INT = config.ND_INT
+ND_STRING = config.ND_STRING
+
+# statistics which are no-data unless a period has enough images
+GCC_STATS_FIELDS = [
+    "r_mean",
+    "r_std",
+    "g_mean",
+    "g_std",
+    "b_mean",
+    "b_std",
+    "gcc_mean",
+    "gcc_std",
+    "gcc_50",
+    "gcc_75",
+    "gcc_90",
+    "rcc_mean",
+    "rcc_std",
+    "rcc_50",
+    "rcc_75",
+    "rcc_90",
+]
+
+# flags which aren't calculated here
+GCC_FLAG_FIELDS = [
+    "snow_flag",
+    "outlierflag_gcc_mean",
+    "outlierflag_gcc_50",
+    "outlierflag_gcc_75",
+    "outlierflag_gcc_90",
+]
+
+
+def period_dates(start_date, ndays):
+    """
+    return the date a summary value is reported for (the middle of
+    the period) and the time of midday on that date for a period
+    starting on start_date.
+    """
+    period_date = start_date + timedelta(days=ndays / 2)
+    midday_noon = datetime(
+        period_date.year, period_date.month, period_date.day, 12, 0, 0
+    )
+    return period_date, midday_noon
+
+
+def period_start(day, ndays):
+    """
+    return the start date of the first daterange2() period which
+    includes day.  At the end of a year this can be a period which
+    started in the previous year.
+    """
+    for start_date in daterange2(day - timedelta(ndays), day, ndays):
+        if start_date + timedelta(ndays) > day:
+            return start_date
+
+    return day
+
+
+def assign_periods(days, starts, ndays):
+    """
+    return the index of the nday period (from the sorted array of
+    period start dates, starts) for each of a sorted array of
+    datetime64[D] days.  Rows are assigned to periods in order, the
+    same way the summary scripts always have, so each row goes in the
+    first period which hasn't ended.  Rows which don't fall in a
+    period (and all rows after them) get -1.
+    """
+    period = np.searchsorted(starts + np.timedelta64(ndays, "D"), days, side="right")
+
+    inside = period < len(starts)
+    inside[inside] = starts[period[inside]] <= days[inside]
+    outside = np.flatnonzero(~inside)
+    if len(outside) > 0:
+        period[outside[0] :] = -1
+
+    return period
+
+
+def _group_sum(values, first, sizes):
+    """
+    return the sums of the groups of values starting at first with
+    lengths sizes.  Groups with the same length are summed together
+    along the rows of a 2-d array so each sum is the same as np.sum()
+    on the group.
+    """
+    sums = np.empty(len(first))
+    for size in np.unique(sizes):
+        sel = np.flatnonzero(sizes == size)
+        index = first[sel][:, np.newaxis] + np.arange(size)
+        sums[sel] = np.sum(values[index], axis=1)
+
+    return sums
+
+
+def group_nanmean(values, first, sizes):
+    """
+    return np.nanmean() for each group of values
+    """
+    nd = np.isnan(values)
+    counts = np.add.reduceat((~nd).astype(np.int64), first)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return _group_sum(np.where(nd, 0.0, values), first, sizes) / counts
+
+
+def group_nanstd(values, first, sizes):
+    """
+    return np.nanstd() for each group of values
+    """
+    nd = np.isnan(values)
+    counts = np.add.reduceat((~nd).astype(np.int64), first)
+    means = group_nanmean(values, first, sizes)
+
+    devs = np.where(nd, 0.0, values - np.repeat(means, sizes))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.sqrt(_group_sum(devs * devs, first, sizes) / counts)
+
+
+def group_quantiles(values, first, sizes, qs):
+    """
+    return an array with quantile.quantile(group, q) for each q in
+    qs for each group of values.  The groups are sorted together as
+    rows of a NaN padded 2-d array.  Groups with NaN values are done
+    one at a time so the (odd) results of sorting NaN's as sorted()
+    does are kept.
+    """
+    group = np.repeat(np.arange(len(first)), sizes)
+    batch = np.full((len(first), np.max(sizes)), np.nan)
+    batch[group, np.arange(len(values)) - first[group]] = values
+    results = quantiles(batch, qs)
+
+    nd_groups = np.flatnonzero(np.logical_or.reduceat(np.isnan(values), first))
+    for k in nd_groups:
+        results[k] = quantiles(values[first[k] : first[k] + sizes[k]], qs)
+
+    return results
+
+
+def group_argmin(values, first, sizes):
+    """
+    return the index of the (first) minimum value in each group
+    """
+    group = np.repeat(np.arange(len(first)), sizes)
+    return np.lexsort((values, group))[first]
+
+
+def gcc_summary_rows(columns, ndays, nimage_threshold, start_date=None):
+    """
+    Calculate the GCC summary values for the selected rows of an ROI
+    timeseries.  columns is a dictionary of the datetime, filename,
+    r_mean, g_mean, b_mean, gcc, solar_elev and awbflag column arrays
+    in datetime order.  Returns a list of dictionaries (with the
+    arguments of GCCTimeSeries.insert_row()) for each nday period
+    from daterange2() covering the rows.  If start_date is given the
+    periods start with the period including start_date rather than
+    the first row.
+    """
+    dts = columns["datetime"]
+    if len(dts) == 0:
+        return []
+
+    # assign rows to periods and skip rows where awbflag is 1
+    days = dts.astype("datetime64[D]")
+    if start_date is None:
+        start_date = days[0].item()
+    starts = list(daterange2(start_date, days[-1].item(), ndays))
+    period = assign_periods(days, np.array(starts, dtype="datetime64[D]"), ndays)
+    period[columns["awbflag"] == 1] = -1
+    rows = np.flatnonzero(period >= 0)
+    period = period[rows]
+
+    dates = [period_dates(d, ndays) for d in starts]
+    noons = np.array([noon for period_date, noon in dates], dtype="datetime64[s]")
+
+    # NOTE: rcc is recomputed from the DN values rather than using a
+    # value stored in the roistats CSV.  Images with no DN values are
+    # kept for the DN stats but aren't counted.
+    r_dn = columns["r_mean"][rows]
+    g_dn = columns["g_mean"][rows]
+    b_dn = columns["b_mean"][rows]
+    dnsum = r_dn + g_dn + b_dn
+    good = dnsum > 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rcc = np.where(good, r_dn / dnsum, np.nan)
+    gcc = np.where(good, columns["gcc"][rows], np.nan)
+    solar_elev = columns["solar_elev"][rows]
+    midday_delta = np.abs((dts[rows] - noons[period]).astype(np.int64))
+
+    # group statistics, one value per period with rows
+    group_periods, first, sizes = np.unique(
+        period, return_index=True, return_counts=True
+    )
+    if len(first) > 0:
+        img_cnt = np.add.reduceat(good.astype(np.int64), first)
+        midday = group_argmin(midday_delta, first, sizes)
+        max_solar_elev = np.maximum.reduceat(solar_elev, first)
+        stats = {}
+        for name, values in [("r", r_dn), ("g", g_dn), ("b", b_dn)]:
+            stats[name + "_mean"] = group_nanmean(values, first, sizes)
+            stats[name + "_std"] = group_nanstd(values, first, sizes)
+        for name, values in [("gcc", gcc), ("rcc", rcc)]:
+            stats[name + "_mean"] = group_nanmean(values, first, sizes)
+            stats[name + "_std"] = group_nanstd(values, first, sizes)
+            qvals = group_quantiles(values, first, sizes, [0.5, 0.75, 0.9])
+            for k, suffix in enumerate(["50", "75", "90"]):
+                stats[name + "_" + suffix] = qvals[:, k]
+
+        stats = dict((name, values.tolist()) for name, values in stats.items())
+        img_cnt = img_cnt.tolist()
+        max_solar_elev = max_solar_elev.tolist()
+
+    group_index = dict((p, k) for k, p in enumerate(group_periods.tolist()))
+
+    summary_rows = []
+    for p, (period_date, midday_noon) in enumerate(dates):
+        summary_row = {
+            "date": period_date,
+            "doy": period_date.timetuple().tm_yday,
+            "image_count": 0,
+            "midday_filename": ND_STRING,
+            "midday_r": ND_FLOAT,
+            "midday_g": ND_FLOAT,
+            "midday_b": ND_FLOAT,
+            "midday_gcc": ND_FLOAT,
+            "midday_rcc": ND_FLOAT,
+            "max_solar_elev": ND_FLOAT,
+        }
+        for name in GCC_STATS_FIELDS:
+            summary_row[name] = ND_FLOAT
+        for name in GCC_FLAG_FIELDS:
+            summary_row[name] = ND_INT
+
+        k = group_index.get(p)
+        if k is not None and img_cnt[k] > 0:
+            # nearest image to midday (noon) on mid-interval date
+            i = midday[k]
+            summary_row["image_count"] = img_cnt[k]
+            summary_row["midday_filename"] = columns["filename"][rows[i]]
+            summary_row["midday_r"] = float(r_dn[i])
+            summary_row["midday_g"] = float(g_dn[i])
+            summary_row["midday_b"] = float(b_dn[i])
+            summary_row["midday_gcc"] = float(gcc[i])
+            summary_row["midday_rcc"] = float(rcc[i])
+            summary_row["max_solar_elev"] = max_solar_elev[k]
+
+            # stats only if there are enough images
+            if img_cnt[k] >= nimage_threshold:
+                for name in GCC_STATS_FIELDS:
+                    summary_row[name] = stats[name][k]
+
+        summary_rows.append(summary_row)
+
+    return summary_rows
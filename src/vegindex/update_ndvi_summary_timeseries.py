@@ -52,6 +52,7 @@ import vegindex as vi
 from vegindex.ndvi_summary_timeseries import NDVISummaryTimeSeries
 from vegindex.ndvitimeseries import NDVITimeSeries
 from vegindex.quantile import quantile
+from vegindex.quantile import quantiles
 from vegindex.vegindex import daterange2
 from vegindex.vegindex import get_ndvi_timeseries
 
@@ -77,7 +78,7 @@ default_brt_min = vi.config.MIN_BRT
 default_brt_max = vi.config.MAX_BRT
 
 
-def main():
+def main(argv=None):
 
     # set up command line argument processing
     parser = argparse.ArgumentParser(
@@ -115,7 +116,7 @@ def main():
     parser.add_argument("roiname", help="ROI name, e.g. canopy_0001")
 
     # get args
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     sitename = args.site
     roiname = args.roiname
     verbose = args.verbose
@@ -412,9 +413,7 @@ def main():
             gcc_90 = quantile(gcc_vals, 0.9)
             ndvi_mean = np.nanmean(ndvi_vals)
             ndvi_std = np.nanstd(ndvi_vals)
-            ndvi_50 = quantile(ndvi_vals, 0.5)
-            ndvi_75 = quantile(ndvi_vals, 0.75)
-            ndvi_90 = quantile(ndvi_vals, 0.9)
+            ndvi_50, ndvi_75, ndvi_90 = quantiles(ndvi_vals, [0.5, 0.75, 0.9]).tolist()
             max_solar_elev = max(solar_elev_vals)
             snow_flag = ND_INT
             outlierflag_ndvi_mean = ND_INT
@@ -16,14 +16,13 @@ from datetime import timedelta
 # use this because numpy/openblas is automatically multi-threaded.
 os.environ["OMP_NUM_THREADS"] = "1"
 os.environ["MKL_NUM_THREADS"] = "1"
-import numpy as np
-from PIL import Image
 
 import vegindex as vi
 from vegindex.ir_roitimeseries import IRROITimeSeries
+from vegindex.roimask import read_mask
 from vegindex.vegindex import get_roi_list
 
-from . import utils
+from . import imageindex
 
 # use this because numpy/openblas is automatically multi-threaded.
 os.environ["OMP_NUM_THREADS"] = "1"
@@ -41,7 +40,7 @@ default_resize = vi.config.RESIZE
 # if __name__ == "__main__":
 
 
-def main():
+def main(argv=None):
 
     # set up command line argument processing
     parser = argparse.ArgumentParser()
@@ -67,7 +66,7 @@ def main():
     parser.add_argument("roiname", help="ROI name, e.g. canopy_0001")
 
     # get args
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     sitename = args.site
     roiname = args.roiname
     verbose = args.verbose
@@ -178,25 +177,15 @@ def main():
             dt_start = roi_startDT
 
         mask_path = os.path.join(archive_dir, sitename, "ROI", maskfile)
-        # print roi_path
+        # open roi mask file (decoded masks are cached)
         try:
-            mask_img = Image.open(mask_path)
-        except Exception:
+            roimask = read_mask(mask_path).mask
+        except IOError:
             sys.stderr.write("Unable to open ROI mask file\n")
             sys.exit(1)
 
-        # check that mask_img is in expected form
-        mask_mode = mask_img.mode
-        if mask_mode != "L":
-
-            # convert to 8-bit mask
-            mask_img = mask_img.convert("L")
-
-        # make a numpy mask
-        roimask = np.asarray(mask_img, dtype=np.bool8)
-
         # get list of images for this timeperiod
-        imglist = utils.getsiteimglist(
+        imglist = imageindex.getsiteimglist(
             sitename, getIR=True, startDT=dt_start, endDT=roi_endDT
         )
 
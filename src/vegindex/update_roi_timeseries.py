@@ -16,14 +16,14 @@ from datetime import timedelta
 # use this because numpy/openblas is automatically multi-threaded.
 os.environ["OMP_NUM_THREADS"] = "1"
 os.environ["MKL_NUM_THREADS"] = "1"
-import numpy as np
-from PIL import Image
 
 import vegindex as vi
+from vegindex.roimask import read_mask
 from vegindex.roitimeseries import ROITimeSeries
 from vegindex.vegindex import get_roi_list
 
-from . import utils
+from . import csvreader
+from . import imageindex
 
 # set vars
 
@@ -33,12 +33,13 @@ archive_dir = vi.config.archive_dir
 
 debug = False
 default_resize = vi.config.RESIZE
+default_decode_scale = vi.config.DECODE_SCALE
 
 
 # if __name__ == "__main__":
 
 
-def main():
+def main(argv=None):
     # set up command line argument processing
     parser = argparse.ArgumentParser()
 
@@ -57,23 +58,32 @@ def main():
         action="store_true",
         default=False,
     )
+    parser.add_argument(
+        "-r",
+        "--rewrite",
+        help="Rewrite the whole CSV file rather than appending new rows",
+        action="store_true",
+        default=False,
+    )
 
     # positional arguments
     parser.add_argument("site", help="PhenoCam site name")
     parser.add_argument("roiname", help="ROI name, e.g. canopy_0001")
 
     # get args
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     sitename = args.site
     roiname = args.roiname
     verbose = args.verbose
     dryrun = args.dry_run
+    rewrite = args.rewrite
 
     if verbose:
         print("site: {0}".format(sitename))
         print("roiname: {0}".format(roiname))
         print("verbose: {0}".format(verbose))
         print("dryrun: {0}".format(dryrun))
+        print("rewrite: {0}".format(rewrite))
 
     # set output filename
     inname = "%s_%s_roistats.csv" % (sitename, roiname)
@@ -87,10 +97,12 @@ def main():
     roi_list = get_roi_list(sitename, roiname)
 
     # read existing CSV file - since this is an update throw
-    # exception if the file doesn't already exist
+    # exception if the file doesn't already exist.  Only the rows at
+    # the end of the file are needed to find the last image and to
+    # append the new rows.
     try:
         roits = ROITimeSeries(site=sitename, ROIListID=roiname)
-        roits.readCSV(outpath)
+        roits.readCSV(outpath, since=csvreader.last_datetime(outpath))
     except IOError:
         errmsg = "Unable to read CSV file: {0}\n".format(outpath)
         sys.stderr.write(errmsg)
@@ -100,12 +112,19 @@ def main():
     config_file = "{0}_{1}.cfg".format(sitename, roiname)
     config_path = os.path.join(archive_dir, sitename, "ROI", config_file)
     if os.path.exists(config_path):
-        cfgparser = configparser(defaults={"resize": str(default_resize)})
+        cfgparser = configparser(
+            defaults={
+                "resize": str(default_resize),
+                "decode_scale": str(default_decode_scale),
+            }
+        )
         cfgparser.read(config_path)
         if cfgparser.has_section("roi_timeseries"):
             resizeFlg = cfgparser.getboolean("roi_timeseries", "resize")
+            decodeScale = cfgparser.getint("roi_timeseries", "decode_scale")
         else:
             resizeFlg = default_resize
+            decodeScale = default_decode_scale
 
         # verify that config matches CSV header!
         if resizeFlg != roits.resizeFlg:
@@ -115,6 +134,14 @@ def main():
 
     else:
         resizeFlg = default_resize
+        decodeScale = default_decode_scale
+
+    # the decode scale changes the stats so it must match the CSV
+    # header even if there's no config file
+    if decodeScale != roits.decodeScale:
+        errmsg = "decode scale from config doesn't match CSV header\n"
+        sys.stderr.write(errmsg)
+        sys.exit(1)
 
     # print config values
     if verbose:
@@ -127,9 +154,10 @@ def main():
         else:
             print("config file: None")
         print("Resize Flag: ", resizeFlg)
+        print("Decode Scale: ", decodeScale)
 
-    # get list of images already in CSV
-    old_imglist = roits.get_image_list()
+    # number of rows already in CSV
+    nrows_old = len(roits.rows)
 
     # find last dt in current timeseries CSV
     nlast = len(roits.rows) - 1
@@ -174,48 +202,42 @@ def main():
             dt_start = roi_startDT
 
         mask_path = os.path.join(archive_dir, sitename, "ROI", maskfile)
-        # print roi_path
+        # open roi mask file (decoded masks are cached)
         try:
-            mask_img = Image.open(mask_path)
-        except Exception:
+            roimask = read_mask(mask_path).mask
+        except IOError:
             sys.stderr.write("Unable to open ROI mask file\n")
             sys.exit(1)
 
-        # check that mask_img is in expected form
-        mask_mode = mask_img.mode
-        if mask_mode != "L":
-
-            # convert to 8-bit mask
-            mask_img = mask_img.convert("L")
-
-        # make a numpy mask
-        roimask = np.asarray(mask_img, dtype=np.bool8)
-
         # get list of images for this timeperiod
-        imglist = utils.getsiteimglist(
+        imglist = imageindex.getsiteimglist(
             sitename, getIR=False, startDT=dt_start, endDT=roi_endDT
         )
 
+        # calculate the solar elevations for all the images at once
+        sun_elevs = roits.get_sun_elevs(imglist)
+
         nimage += len(imglist)
-        for impath in imglist:
+        for impath, sun_elev in zip(imglist, sun_elevs):
 
             if debug:
                 print(maskfile, impath)
 
             # check if image already exists in list -- just to be
             # sure!
-            fn = os.path.basename(impath)
-            try:
-                row_index = old_imglist.index(fn)
-            except Exception:
-                row_index = None
+            row_index = roits.find_row(os.path.basename(impath))
 
             # append/insert row for this image/mask - shouldn't happen
             # but just to be on safe side!
-            if row_index:
-                roits_row = roits.insert_row(impath, roimask, imask + 1)
+            if row_index is not None:
+                roits_row = roits.insert_row(
+                    impath, roimask, imask + 1, sun_elev=float(sun_elev)
+                )
+                rewrite = True
             else:
-                roits_row = roits.append_row(impath, roimask, imask + 1)
+                roits_row = roits.append_row(
+                    impath, roimask, imask + 1, sun_elev=float(sun_elev)
+                )
 
             # check that we could append/insert a row
             if roits_row:
@@ -231,10 +253,17 @@ def main():
                 if nupdate == 10:
                     break
 
-    # output CSV file
+    # output CSV file.  If only new rows were added just append them
+    # to the file.
+    nout = None
     if dryrun:
         nout = 0
-    else:
+    elif not rewrite:
+        nout = roits.appendCSV(outpath, nrows_old)
+        if nout is None and verbose:
+            print("Unable to append to CSV file, rewriting it.")
+    if nout is None:
+        roits.read_earlier_rows(outpath)
         nout = roits.writeCSV(outpath)
 
     print("Images processed: %d" % (nimage,))
@@ -4,18 +4,16 @@
 Utility functions for accessing image archive.
 """
 
-import json
 import os
 import re
-import sys
 from datetime import datetime
 from datetime import timedelta
 
 import ephem
-import pandas as pd
-import requests
+import numpy as np
 
 from . import config
+from . import siteinfo
 
 # ####################################################################
 
@@ -100,107 +98,97 @@ def fn2datetime(sitename, filename, irFlag=False):
 # ####################################################################
 
 
-def getsiteimglist(
-    sitename, startDT=datetime(1990, 1, 1, 0, 0, 0), endDT=datetime.now(), getIR=False
+# names of the year and month image directories
+YEAR_RE = re.compile(r"^\d\d\d\d$")
+MONTH_RE = re.compile(r"^\d\d$")
+
+
+def _sorted_dirs(path, pattern):
+    """
+    Return a sorted list of (name, path) for the subdirectories of
+    path with names matching a compiled regex.
+    """
+    dirs = []
+    with os.scandir(path) as it:
+        for entry in it:
+            if pattern.match(entry.name) and entry.is_dir():
+                dirs.append((entry.name, entry.path))
+
+    dirs.sort()
+    return dirs
+
+
+def iter_site_images(
+    sitename, startDT=datetime(1990, 1, 1, 0, 0, 0), endDT=None, getIR=False
 ):
     """
-    Returns a list of imagepath names for ALL images in
-    archive for specified site.  Optional arguments:
+    Generator which yields the imagepath names for images in the
+    archive for the specified site in chronological order.
+    Directories are visited in sorted order and only the year and
+    month directories in the datetime range are listed so the first
+    images are available right away.  Optional arguments:
       getIR   : If set to true only return IR images.
       startDT : Start datetime for image list
-      endDT   : End datetime for image list
-
-    NOTE: This might be lots faster if we just do a glob.glob()
-    on a pattern.  Might not be quite as robust since we're skipping
-    the check the .jpg file being a regular file.  See, getImageCount()
-    below for how this would work!
+      endDT   : End datetime for image list (default is now)
     """
 
-    # get startyear and endyear
-    startYear = startDT.year
-    endYear = endDT.year
-
-    # get startmonth and endmonth
-    startMonth = startDT.month
-    endMonth = endDT.month
+    if endDT is None:
+        endDT = datetime.now()
 
-    imglist = []
     sitepath = os.path.join(config.archive_dir, sitename)
-    if not os.path.exists(sitepath):
-        return imglist
+    if not os.path.isdir(sitepath):
+        return
 
-    # get a list of files in the directory
-    yeardirs = os.listdir(sitepath)
-
-    # loop over all files
-    for yeardir in yeardirs:
+    if getIR:
+        image_re = re.compile(r"^%s_IR_(\d\d\d\d)_(\d\d)_.*\.jpg$" % (sitename,))
+    else:
+        image_re = re.compile(r"^%s_(\d\d\d\d)_(\d\d)_.*\.jpg$" % (sitename,))
 
-        # check that its a directory
-        yearpath = os.path.join(sitepath, yeardir)
-        if not os.path.isdir(yearpath):
-            continue
+    start_ym = (startDT.year, startDT.month)
+    end_ym = (endDT.year, endDT.month)
 
-        # check if this yeardir could be a 4-digit year.  if not skip
-        if not re.match(r"^\d\d\d\d$", yeardir):
-            continue
+    for yeardir, yearpath in _sorted_dirs(sitepath, YEAR_RE):
 
-        # check if we're before startYear
-        if (int(yeardir) < startYear) | (int(yeardir) > endYear):
+        # check year range
+        year = int(yeardir)
+        if year < startDT.year:
             continue
+        if year > endDT.year:
+            break
 
-        # get a list of all files in year directory
-        mondirs = os.listdir(yearpath)
-
-        # loop over all files
-        for mondir in mondirs:
-
-            # check that its a directory
-            monpath = os.path.join(yearpath, mondir)
-            if not os.path.isdir(monpath):
-                continue
-
-            # check if this mondir could be a 2-digit month.  if not skip
-            if not re.match(r"^\d\d$", mondir):
-                continue
+        for mondir, monpath in _sorted_dirs(yearpath, MONTH_RE):
 
             # check month range
-            if (int(mondir) < 1) | (int(mondir) > 12):
+            month = int(mondir)
+            if (month < 1) | (month > 12):
                 continue
-
-            # check start year/month
-            if (int(yeardir) == startYear) & (int(mondir) < startMonth):
-                continue
-
-            # check end year/month
-            if (int(yeardir) == endYear) & (int(mondir) > endMonth):
+            if (year, month) < start_ym:
                 continue
+            if (year, month) > end_ym:
+                break
 
             try:
-                imgfiles = os.listdir(monpath)
-                if getIR:
-                    image_re = r"^%s_IR_%s_%s_.*\.jpg$" % (sitename, yeardir, mondir)
-                else:
-                    image_re = r"^%s_%s_%s_.*\.jpg$" % (sitename, yeardir, mondir)
-
-                for imgfile in imgfiles:
-                    # check for pattern match
-                    if not re.match(image_re, imgfile):
-                        continue
-
-                    # get image time
-                    [yr, mo, md, hr, mn, sc] = fn2date(sitename, imgfile, irFlag=getIR)
-                    img_dt = datetime(yr, mo, md, hr, mn, sc)
-
-                    if img_dt < startDT:
-                        continue
-
-                    if img_dt > endDT:
-                        continue
-
-                    # only add regular files
-                    imgpath = os.path.join(monpath, imgfile)
-                    if not os.path.isdir(imgpath):
-                        imglist.append(imgpath)
+                imgfiles = []
+                with os.scandir(monpath) as it:
+                    for entry in it:
+                        # check for pattern match
+                        imgfile = entry.name
+                        m = image_re.match(imgfile)
+                        if m is None:
+                            continue
+                        if m.group(1) != yeardir or m.group(2) != mondir:
+                            continue
+
+                        # get image time
+                        img_dt = fn2datetime(sitename, imgfile, irFlag=getIR)
+                        if img_dt < startDT:
+                            continue
+                        if img_dt > endDT:
+                            continue
+
+                        # only add regular files
+                        if not entry.is_dir():
+                            imgfiles.append(imgfile)
 
             except OSError as e:
                 if e.errno == 20:
@@ -208,9 +196,28 @@ def getsiteimglist(
                 else:
                     errstring = "Python OSError: %s" % (e,)
                     print(errstring)
+                    continue
+
+            imgfiles.sort()
+            for imgfile in imgfiles:
+                yield os.path.join(monpath, imgfile)
+
+
+def getsiteimglist(
+    sitename, startDT=datetime(1990, 1, 1, 0, 0, 0), endDT=datetime.now(), getIR=False
+):
+    """
+    Returns a list of imagepath names for ALL images in
+    archive for specified site.  Optional arguments:
+      getIR   : If set to true only return IR images.
+      startDT : Start datetime for image list
+      endDT   : End datetime for image list
+
+    The list is sorted in chronological order.  See, iter_site_images()
+    for a version which doesn't build the whole list.
+    """
 
-    imglist.sort()
-    return imglist
+    return list(iter_site_images(sitename, startDT=startDT, endDT=endDT, getIR=getIR))
 
 
 # ####################################################################
@@ -219,37 +226,13 @@ def getsiteimglist(
 def getsiteinfo(sitename):
     """
     Simple function to return the site info for a single site in a
-    dictionary by grabbing JSON from a URL, or a locally defined CSV
-    file with similar information for a lightweight implementation.
+    dictionary from the locally defined CSV file, or by grabbing JSON
+    from a URL for sites not in the file.  Lookups are cached, see
+    siteinfo.py.
 
     """
 
-    siteinfo = None
-    infourl = "https://phenocam.nau.edu/webcam/" + "sites/{0}/info/".format(sitename)
-
-    # first try to get siteinfo from URL
-    try:
-        response = requests.get(infourl)
-        response.raise_for_status()
-        siteinfo = response.json()
-    except requests.exceptions.RequestException:
-        pass
-
-    # if there was an error then try a local file
-    if siteinfo is None:
-        try:
-            df = pd.read_csv(config.site_info_file, comment="#")
-        except IOError:
-            sys.stderr.write("Error getting site info from file.\n")
-            sys.exit(-1)
-
-        try:
-            json_string = df[df.sitename == sitename].to_json(orient="records")
-            siteinfo = json.loads(json_string)[0]
-        except IndexError:
-            siteinfo = None
-
-    return siteinfo
+    return siteinfo.get_site_info(sitename)
 
 
 # ####################################################################
@@ -311,3 +294,162 @@ def sunelev(lat, lon, dt, tzoffset):
     elev = sun.alt / ephem.degree
 
     return elev
+
+
+# ####################################################################
+
+
+def _dms_angle(angle):
+    """
+    helper function to return the angle (in radians) that ephem
+    uses for an angle passed through deg2dms().  This truncates the
+    angle to whole seconds (and drops the sign of angles between 0
+    and -1 degrees) so the results match sunelev().
+    """
+    dmsstr = deg2dms(angle)
+    (dd, mm, ss) = dmsstr.split(":")
+    degrees = abs(int(dd)) + int(mm) / 60.0 + int(ss) / 3600.0
+    if dmsstr.startswith("-"):
+        degrees = -degrees
+
+    return np.radians(degrees)
+
+
+def _unrefract(aa, pressure=1010.0, temp=15.0):
+    """
+    helper function to return the true altitude for an array of
+    apparent altitudes (radians) using the same refraction model as
+    ephem (libastro).
+    """
+    aadeg = np.degrees(aa)
+
+    # model for altitudes below 15 degrees (0 below about -5 degrees)
+    a = ((2e-5 * aadeg + 1.96e-2) * aadeg + 1.594e-1) * pressure
+    b = (273 + temp) * ((8.45e-2 * aadeg + 5.05e-1) * aadeg + 1)
+    r = np.radians(a / b)
+    ta_lt = np.where((aa < 0) & (r < 0), aa, aa - r)
+
+    # model for altitudes above 15 degrees
+    with np.errstate(divide="ignore"):
+        ta_ge = aa - 7.888888e-5 * pressure / ((273 + temp) * np.tan(aa))
+
+    # smooth blend between the two
+    p = (aadeg - 14.5) / (15.5 - 14.5)
+    ta = ta_lt + (ta_ge - ta_lt) * p
+    ta = np.where(aadeg < 14.5, ta_lt, ta)
+    ta = np.where(aadeg >= 15.5, ta_ge, ta)
+
+    return ta
+
+
+def _refract(ta, pressure=1010.0, temp=15.0):
+    """
+    helper function to return the apparent altitude (radians) for an
+    array of true altitudes.  As in ephem (libastro) the inverse of
+    _unrefract() is found with the secant method.
+    """
+    maxrerr = np.radians(0.1 / 3600.0)
+
+    t = _unrefract(ta, pressure, temp)
+    d = 0.8 * (ta - t)
+    t0 = t
+    aa = ta.copy()
+
+    # iterate until all values have converged
+    active = np.ones(ta.shape, dtype=np.bool_)
+    for i in range(100):
+        aa = np.where(active, aa + d, aa)
+        t = _unrefract(aa, pressure, temp)
+        active = active & (np.abs(ta - t) > maxrerr)
+        if not active.any():
+            break
+        with np.errstate(divide="ignore", invalid="ignore"):
+            d = np.where(active, d * -(ta - t) / (t0 - t), d)
+        t0 = t
+
+    return aa
+
+
+def sunelev_array(lat, lon, dts, tzoffset):
+    """
+    function to return an array of solar elevations (decimal
+    degrees) for an array of local standard times (numpy datetime64
+    or a list of datetimes) at a given latitude and longitude
+    (decimal degrees).  The offset is the rawOffset from UTC/GMT
+    as for sunelev().
+
+    The solar position is calculated with the NOAA (Meeus) low
+    precision formulae plus the largest planetary and lunar
+    perturbations of the solar longitude.  The elevation includes
+    parallax and atmospheric refraction as calculated by ephem, and
+    agrees with sunelev() to better than 0.01 degrees.
+    """
+
+    # apply timezone offset to local time to give utc time
+    dts = np.asarray(dts, dtype="datetime64[us]")
+    offset = np.timedelta64(int(round(tzoffset * 3600e6)), "us")
+    utc = dts - offset
+
+    # days and julian centuries since J2000.0
+    days = (utc - np.datetime64("2000-01-01T12:00:00")) / np.timedelta64(1, "D")
+    jc = days / 36525.0
+
+    # geometric mean longitude and mean anomaly of the sun
+    L0 = np.mod(280.46646 + jc * (36000.76983 + jc * 0.0003032), 360.0)
+    M = np.radians(357.52911 + jc * (35999.05029 - 0.0001537 * jc))
+
+    # equation of center
+    C = (
+        np.sin(M) * (1.914602 - jc * (0.004817 + 0.000014 * jc))
+        + np.sin(2 * M) * (0.019993 - 0.000101 * jc)
+        + np.sin(3 * M) * 0.000289
+    )
+
+    # perturbations by the moon, venus, mars and jupiter (arcsec)
+    D = np.radians(297.8502 + 12.19074912 * days)
+    g2 = np.radians(50.4161 + 1.6021302 * days)
+    g4 = np.radians(19.3730 + 0.5240208 * days)
+    g5 = np.radians(20.0202 + 0.0830853 * days)
+    pert = (
+        -7.0 * np.cos(M - g5)
+        + 6.0 * np.sin(D)
+        + 5.0 * np.sin(4 * M - 8 * g4 + 3 * g5)
+        - 5.0 * np.cos(2 * M - 2 * g2)
+        - 4.0 * np.sin(M - g2)
+        + 4.0 * np.cos(4 * M - 8 * g4 + 3 * g5)
+        + 3.0 * np.sin(2 * M - 2 * g2)
+        - 3.0 * np.sin(g5)
+        - 3.0 * np.sin(2 * M - 2 * g5)
+    ) / 3600.0
+
+    # apparent longitude (nutation and aberration) and obliquity
+    omega = np.radians(125.04 - 1934.136 * jc)
+    nutation = -0.00478 * np.sin(omega)
+    app_long = np.radians(L0 + C + pert - 0.00569 + nutation)
+    mean_obliq = (
+        23.0
+        + (26.0 + (21.448 - jc * (46.815 + jc * (0.00059 - jc * 0.001813))) / 60.0)
+        / 60.0
+    )
+    obliq = np.radians(mean_obliq + 0.00256 * np.cos(omega))
+
+    # apparent right ascension and declination
+    ra = np.arctan2(np.cos(obliq) * np.sin(app_long), np.cos(app_long))
+    decl = np.arcsin(np.sin(obliq) * np.sin(app_long))
+
+    # apparent sidereal time and hour angle
+    gmst = 280.46061837 + 360.98564736629 * days + 0.000387933 * jc * jc
+    gast = np.radians(np.mod(gmst + nutation * np.cos(obliq), 360.0))
+    ha = gast + _dms_angle(lon) - ra
+
+    # geometric elevation
+    phi = _dms_angle(lat)
+    sin_elev = np.sin(phi) * np.sin(decl) + np.cos(phi) * np.cos(decl) * np.cos(ha)
+    elev = np.arcsin(np.clip(sin_elev, -1.0, 1.0))
+
+    # topocentric (parallax) and refraction corrections
+    elev = elev - np.radians(8.794 / 3600.0) * np.cos(elev)
+    elev = _refract(elev)
+
+    # return elevation is decimal degrees
+    return np.degrees(elev)
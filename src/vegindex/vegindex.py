@@ -89,9 +89,17 @@ def get_roi_list(site, roilist_id):
     return roilist
 
 
-def get_roi_timeseries(site, roilist_id):
+def get_roi_timeseries(site, roilist_id, since=None, mmap=False):
     """
-    function to read in CSV ROI stats file and return a ROITimeSeries object
+    function to read in CSV ROI stats file and return a ROITimeSeries
+    object.  If since (a datetime) is given only the rows at or after
+    since are read.  Otherwise an up to date binary sidecar file (see
+    csvreader.write_sidecar()) is loaded instead of the CSV.
+
+    If mmap is True the numeric columns are read-only memory maps of
+    the sidecar file (which is written first if it's missing or out
+    of date), so processes loading the same site share one copy of
+    the data in the OS page cache.
     """
 
     # take ROIList_id and parse into site, roitype, sequence_number
@@ -108,16 +116,19 @@ def get_roi_timeseries(site, roilist_id):
     # create empty ROITimeSeries object
     roits = ROITimeSeries(site=site, ROIListID=roilist_id)
 
-    # read in from CSV file
-    roits.readCSV(roitspath)
+    # read in from CSV file (or its sidecar)
+    roits.readCSV(roitspath, since=since, sidecar=True, mmap=mmap)
 
     return roits
 
 
-def get_roi_ir_timeseries(site, roilist_id):
+def get_roi_ir_timeseries(site, roilist_id, since=None):
     """
     function to read in CSV ROI IR stats file and return an IR
-    ROITimeSeries object
+    ROITimeSeries object.  If since (a datetime) is given only the
+    rows at or after since are read.  Otherwise an up to date binary
+    sidecar file (see csvreader.write_sidecar()) is loaded instead of
+    the CSV.
     """
 
     # take ROIList_id and parse into site, roitype, sequence_number
@@ -134,15 +145,18 @@ def get_roi_ir_timeseries(site, roilist_id):
     # create empty ROITimeSeries object
     roits = IRROITimeSeries(site=site, ROIListID=roilist_id)
 
-    # read in from CSV file
-    roits.readCSV(roitspath)
+    # read in from CSV file (or its sidecar)
+    roits.readCSV(roitspath, since=since, sidecar=True)
 
     return roits
 
 
-def get_ndvi_timeseries(site, roilist_id):
+def get_ndvi_timeseries(site, roilist_id, since=None):
     """
-    function to read in NDVI CSV file and return a NDVITimeSeries object
+    function to read in NDVI CSV file and return a NDVITimeSeries
+    object.  If since (a datetime) is given only the rows at or after
+    since are read.  Otherwise an up to date binary sidecar file (see
+    csvreader.write_sidecar()) is loaded instead of the CSV.
     """
 
     # take ROIList_id and parse into site, roitype, sequence_number
@@ -158,8 +172,8 @@ def get_ndvi_timeseries(site, roilist_id):
     # create empty NDVITimeSeries object
     ndvits = NDVITimeSeries(site=site, ROIListID=roilist_id)
 
-    # read in from CSV file
-    ndvits.readCSV(ndvitspath)
+    # read in from CSV file (or its sidecar)
+    ndvits.readCSV(ndvitspath, since=since, sidecar=True)
 
     return ndvits
 
@@ -167,7 +181,8 @@ def get_ndvi_timeseries(site, roilist_id):
 def get_gcc_timeseries(site, roilist_id, nday=3):
     """
     Read in CSV version of summary timeseries and return
-    GCCTimeSeries object.
+    GCCTimeSeries object.  An up to date binary sidecar file (see
+    csvreader.write_sidecar()) is loaded instead of the CSV.
     """
 
     # set cannonical dir for ROI Lists
@@ -180,8 +195,8 @@ def get_gcc_timeseries(site, roilist_id, nday=3):
     # create empty GCCTimeSeries object
     gccts = GCCTimeSeries(site=site, ROIListID=roilist_id)
 
-    # read in from CSV file
-    gccts.readCSV(gcc_tspath)
+    # read in from CSV file (or its sidecar)
+    gccts.readCSV(gcc_tspath, sidecar=True)
 
     return gccts
 
@@ -189,7 +204,8 @@ def get_gcc_timeseries(site, roilist_id, nday=3):
 def get_ndvi_summary(site, roilist_id, nday=3):
     """
     Read in CSV version of NDVI summary timeseries and return
-    NDVISummaryTimeSeries object.
+    NDVISummaryTimeSeries object.  An up to date binary sidecar file
+    (see csvreader.write_sidecar()) is loaded instead of the CSV.
     """
 
     # set cannonical dir for ROI Lists
@@ -202,7 +218,7 @@ def get_ndvi_summary(site, roilist_id, nday=3):
     # create empty GCCTimeSeries object
     ndvits = NDVISummaryTimeSeries(site=site, ROIListID=roilist_id)
 
-    # read in from CSV file
-    ndvits.readCSV(ndvi_tspath)
+    # read in from CSV file (or its sidecar)
+    ndvits.readCSV(ndvi_tspath, sidecar=True)
 
     return ndvits
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+test_batch
+----------
+
+Tests for `vegindex.batch` module.
+"""
+
+import os
+import shutil
+import time
+
+import numpy as np
+import pytest
+
+from vegindex import batch
+from vegindex import config
+
+SAMPLE_DATA_DIR = os.path.join(os.path.dirname(__file__), "sample_data")
+
+
+def test_read_manifest(tmpdir):
+    """
+    test reading jobs from a manifest file
+    """
+    manifest_path = str(tmpdir.join("manifest.txt"))
+    with open(manifest_path, "w") as f:
+        f.write("# site roiname stages\n")
+        f.write("harvard DB_0001 gcc_1day gcc_3day  # summaries only\n")
+        f.write("\n")
+        f.write("test DB_0001\n")
+
+    jobs = batch.read_manifest(manifest_path)
+    np.testing.assert_equal(
+        jobs[0:2],
+        [("harvard", "DB_0001", "gcc_1day"), ("harvard", "DB_0001", "gcc_3day")],
+    )
+    np.testing.assert_equal(len(jobs), 2 + len(batch.STAGES))
+
+    # jobs only depend on stages in the manifest
+    deps = batch.job_dependencies(jobs)
+    np.testing.assert_equal(deps[("harvard", "DB_0001", "gcc_1day")], [])
+    np.testing.assert_equal(
+        deps[("test", "DB_0001", "ndvi")],
+        [("test", "DB_0001", "roistats"), ("test", "DB_0001", "ir_roistats")],
+    )
+
+    with open(manifest_path, "a") as f:
+        f.write("test DB_0001 bad_stage\n")
+    with pytest.raises(ValueError):
+        batch.read_manifest(manifest_path)
+
+
+def test_job_command(monkeypatch):
+    """
+    test that the update script is used if the output file exists
+    """
+    monkeypatch.setattr(config, "archive_dir", SAMPLE_DATA_DIR)
+
+    script, argv = batch.job_command(("harvard", "DB_0001", "gcc_3day"))
+    np.testing.assert_equal(script, "update_summary_timeseries")
+    np.testing.assert_equal(argv, ["-p", "3", "harvard", "DB_0001"])
+
+    script, argv = batch.job_command(
+        ("harvard", "DB_0001", "gcc_3day"), dryrun=True, regenerate=True
+    )
+    np.testing.assert_equal(script, "generate_summary_timeseries")
+    np.testing.assert_equal(argv, ["-p", "3", "--dry-run", "harvard", "DB_0001"])
+
+    script, argv = batch.job_command(("harvard", "DB_0001", "roistats"))
+    np.testing.assert_equal(script, "generate_roi_timeseries")
+
+
+@pytest.mark.parametrize("nworkers", [1, 2])
+def test_run_jobs(tmpdir, monkeypatch, nworkers):
+    """
+    test that a failed job only skips the jobs depending on it
+    """
+    site_info_file = os.path.join(SAMPLE_DATA_DIR, "site_info.csv")
+    monkeypatch.setattr(config, "archive_dir", SAMPLE_DATA_DIR)
+    monkeypatch.setattr(config, "site_info_file", site_info_file)
+    monkeypatch.setattr(config, "offline", True)
+    monkeypatch.setattr(config, "image_index_dir", str(tmpdir))
+
+    jobs = [
+        ("nosite", "DB_0001", "roistats"),
+        ("nosite", "DB_0001", "gcc_1day"),
+        ("nosite", "DB_0001", "ir_roistats"),
+        ("test", "DB_0001", "roistats"),
+    ]
+    results = batch.run_jobs(jobs, nworkers=nworkers, dryrun=True)
+    statuses = [results[job]["status"] for job in jobs]
+    np.testing.assert_equal(statuses, ["failed", "skipped", "skipped", "ok"])
+    assert "Images processed: 1" in results[jobs[3]]["output"]
+
+    report = batch.format_report(results, 1.0)
+    assert "Jobs: 4  OK: 1  Failed: 1  Skipped: 2  Unchanged: 0" in report
+
+
+def test_unchanged_jobs(tmpdir, monkeypatch):
+    """
+    test that jobs are only run again when their inputs change
+    """
+    archive_dir = str(tmpdir.join("archive"))
+    shutil.copytree(os.path.join(SAMPLE_DATA_DIR, "test"), archive_dir + "/test")
+    monkeypatch.setattr(config, "archive_dir", archive_dir)
+
+    # image directories modified just now never match
+    old = time.time() - 100
+    for dirpath, dirnames, filenames in os.walk(archive_dir):
+        os.utime(dirpath, (old, old))
+
+    runs = []
+
+    def fake_run_job(job, dryrun=False, regenerate=False):
+        runs.append(job[2])
+        with open(batch.job_output(job), "w") as f:
+            f.write("output\n")
+        return {"job": job, "script": "fake", "status": "ok", "time": 0.0, "output": ""}
+
+    monkeypatch.setattr(batch, "run_job", fake_run_job)
+    jobs = [("test", "DB_0001", "roistats"), ("test", "DB_0001", "gcc_1day")]
+
+    def statuses(**kwargs):
+        results = batch.run_jobs(jobs, **kwargs)
+        return [results[job]["status"] for job in jobs]
+
+    np.testing.assert_equal(statuses(), ["ok", "ok"])
+    np.testing.assert_equal(statuses(), ["unchanged", "unchanged"])
+    np.testing.assert_equal(statuses(force=True), ["ok", "ok"])
+    np.testing.assert_equal(runs, ["roistats", "gcc_1day"] * 2)
+
+    # the ROI list changed but the roistats output is the same
+    roilist_path = os.path.join(archive_dir, "test", "ROI", "test_DB_0001_roi.csv")
+    with open(roilist_path, "a") as f:
+        f.write("#\n")
+    np.testing.assert_equal(statuses(), ["ok", "unchanged"])
+
+    # new image directory
+    os.makedirs(os.path.join(archive_dir, "test", "2009", "07"))
+    np.testing.assert_equal(statuses(), ["ok", "unchanged"])
+
+    # the output was removed
+    os.remove(batch.job_output(jobs[1]))
+    np.testing.assert_equal(statuses(), ["ok", "ok"])
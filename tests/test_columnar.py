@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+test_columnar
+-------------
+
+Tests for `vegindex.columnar` module.
+"""
+
+from datetime import datetime
+from datetime import time
+
+import numpy as np
+import pytest
+
+from vegindex import columnar
+from vegindex import config
+
+SPEC = [
+    ("datetime", columnar.DATETIME),
+    ("filename", columnar.STR),
+    ("exposure", columnar.INT),
+    ("gcc", columnar.FLOAT),
+]
+
+
+def _rows_from_store(store, start, stop):
+    """
+    simple row factory for tests
+    """
+    values = store.get_values(start, stop)
+    names = list(values.keys())
+    return [dict(zip(names, rowvals)) for rowvals in zip(*values.values())]
+
+
+def test_column_store():
+    """
+    test appending rows and the no-data conversions
+    """
+    rows = [
+        {
+            "datetime": datetime(2017, 8, 25, 12, 0, 8),
+            "filename": "b.jpg",
+            "exposure": 44,
+            "gcc": 0.4,
+        },
+        {
+            "datetime": datetime(2017, 8, 24, 12, 0, 8),
+            "filename": "a.jpg",
+            "exposure": config.ND_INT,
+            "gcc": config.ND_FLOAT,
+        },
+    ]
+
+    store = columnar.ColumnStore(SPEC)
+    for row in rows:
+        store.append(row)
+
+    np.testing.assert_equal(len(store), 2)
+    np.testing.assert_equal(store.column("exposure").tolist(), [44, -9999])
+    assert np.isnan(store.column("gcc")[1])
+    np.testing.assert_equal(store.column("datetime").dtype, np.dtype("M8[s]"))
+
+    # rows come back with the no-data strings
+    view = columnar.RowsView(store, _rows_from_store)
+    np.testing.assert_equal(view[0], rows[0])
+    np.testing.assert_equal(view[-1], rows[1])
+    np.testing.assert_equal(list(view), rows)
+
+    # from_rows gives the same columns
+    store2 = columnar.ColumnStore.from_rows(SPEC, rows)
+    for name, kind in SPEC:
+        np.testing.assert_array_equal(store2.column(name), store.column(name))
+
+    store.sort("datetime")
+    np.testing.assert_equal(store.column("filename").tolist(), ["a.jpg", "b.jpg"])
+
+    row = view.pop(0)
+    np.testing.assert_equal(row["filename"], "a.jpg")
+    np.testing.assert_equal(len(view), 1)
+
+    with pytest.raises(IndexError):
+        view[1]
+
+
+def test_column_store_growth():
+    """
+    test that appending many rows keeps the values
+    """
+    store = columnar.ColumnStore(SPEC)
+    for i in range(1000):
+        store.append({"datetime": datetime(2017, 1, 1, 0, 0, 0), "exposure": i})
+
+    np.testing.assert_array_equal(store.column("exposure"), np.arange(1000))
+    np.testing.assert_equal(store.column("filename")[999], None)
+
+    # take a subset of the rows
+    subset = store.take(store.column("exposure") % 2 == 0)
+    np.testing.assert_equal(len(subset), 500)
+    np.testing.assert_equal(subset.column("exposure")[-1], 998)
+
+
+def test_column_store_indexes():
+    """
+    test that the key and order indexes stay consistent as rows are
+    appended, replaced, deleted and sorted
+    """
+    store = columnar.ColumnStore(SPEC)
+    store.set_key("filename")
+    store.set_order("datetime")
+    for day in [3, 1, 2]:
+        store.append(
+            {"datetime": datetime(2017, 1, day, 12, 0, 0), "filename": str(day)}
+        )
+
+    np.testing.assert_equal(store.find("1"), 1)
+    np.testing.assert_equal(store.find("4"), None)
+    idx = store.range_index(
+        np.datetime64("2017-01-01T00:00:00"), np.datetime64("2017-01-02T12:00:00")
+    )
+    np.testing.assert_equal(idx.tolist(), [1, 2])
+
+    # append after the index is built
+    store.append({"datetime": datetime(2017, 1, 4, 12, 0, 0), "filename": "4"})
+    np.testing.assert_equal(store.find("4"), 3)
+
+    # replace a row with a new key and datetime
+    store.set_row(0, {"datetime": datetime(2016, 12, 31, 12, 0, 0), "filename": "0"})
+    np.testing.assert_equal(store.find("3"), None)
+    np.testing.assert_equal(store.find("0"), 0)
+    np.testing.assert_equal(store.order_index().tolist(), [0, 1, 2, 3])
+
+    # delete and sort
+    store.delete(1)
+    np.testing.assert_equal(store.find("2"), 1)
+    store.append({"datetime": datetime(2017, 1, 1, 12, 0, 0), "filename": "1"})
+    store.sort("datetime")
+    np.testing.assert_equal(store.column("filename").tolist(), ["0", "1", "2", "4"])
+    np.testing.assert_equal(store.find("4"), 3)
+    idx = store.range_index(
+        np.datetime64("2017-01-01T12:00:00"), np.datetime64("2017-01-03T00:00:00")
+    )
+    np.testing.assert_equal(idx.tolist(), [1, 2])
+
+
+def test_select_index():
+    """
+    test image selection by time of day, brightness and solar
+    elevation
+    """
+    dts = np.array(
+        [
+            "2017-01-02T12:00:00",
+            "2017-01-01T12:00:00",
+            "2017-01-01T06:00:00",
+            "2017-01-01T13:00:00",
+            "2017-01-01T14:00:00",
+        ],
+        dtype="datetime64[s]",
+    )
+    brt = np.array([300.0, 300.0, 300.0, 50.0, np.nan])
+    solar_elev = np.array([40.0, 40.0, 5.0, 40.0, 40.0])
+
+    index, counts = columnar.select_index(
+        dts, brt, solar_elev, "07:00:00", time(18, 0, 0), 10.0, 100, 665
+    )
+    np.testing.assert_equal(index.tolist(), [1, 0])
+    np.testing.assert_equal(
+        counts,
+        {"total": 5, "tod": 4, "brightness": 3, "sunelev": 4, "selected": 2},
+    )
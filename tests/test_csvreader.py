@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+test_csvreader
+--------------
+
+Tests for `vegindex.csvreader` module.
+"""
+
+import os
+from datetime import date
+from datetime import datetime
+
+import numpy as np
+
+from vegindex import csvreader
+
+SAMPLE_DATA_DIR = os.path.join(os.path.dirname(__file__), "sample_data")
+
+KINDS = {"solar_elev": csvreader.FLOAT, "exposure": csvreader.INT}
+
+CSV_TEXT = """#
+# Site: test
+#
+date,local_std_time,filename,solar_elev,exposure
+2017-08-25,12:00:08,test_2017_08_25_120008.jpg,45.5,44
+2017-08-25,12:30:08,test_2017_08_25_123008.jpg,-9999,NA
+"""
+
+
+def test_read_csv(tmpdir):
+    """
+    test reading comments and typed columns
+    """
+    csv_path = str(tmpdir.join("test.csv"))
+    with open(csv_path, "w") as f:
+        f.write(CSV_TEXT)
+
+    comments, columns = csvreader.read_csv(csv_path, KINDS)
+    np.testing.assert_equal(comments, ["#", "# Site: test", "#"])
+    np.testing.assert_equal(columns["filename"][1], "test_2017_08_25_123008.jpg")
+    np.testing.assert_equal(columns["solar_elev"][0], 45.5)
+    assert np.isnan(columns["solar_elev"][1])
+    np.testing.assert_equal(columns["exposure"].tolist(), [44, -9999])
+
+    dts = csvreader.datetime_column(columns["date"], columns["local_std_time"])
+    np.testing.assert_equal(dts[1], np.datetime64("2017-08-25T12:30:08"))
+
+    rows = csvreader.columns_to_rows(columns)
+    np.testing.assert_equal(rows[1]["solar_elev"], "NA")
+    np.testing.assert_equal(rows[1]["exposure"], "NA")
+    np.testing.assert_equal(rows[0]["date"], "2017-08-25")
+
+
+def test_read_csv_bad_values(tmpdir):
+    """
+    test that values which aren't numbers are no-data
+    """
+    csv_path = str(tmpdir.join("test.csv"))
+    with open(csv_path, "w") as f:
+        f.write(CSV_TEXT.replace("45.5,44", "bad,44.0"))
+
+    comments, columns = csvreader.read_csv(csv_path, KINDS)
+    assert np.isnan(columns["solar_elev"][0])
+    np.testing.assert_equal(columns["exposure"].tolist(), [44, -9999])
+
+
+def test_read_ir_roistats():
+    """
+    test reading the sample IR roistats file
+    """
+    roistats_path = os.path.join(
+        SAMPLE_DATA_DIR,
+        "alligatorriver",
+        "ROI",
+        "alligatorriver_DB_1000_IR_roistats.csv",
+    )
+    kinds = {"ir_mean": csvreader.FLOAT, "mask_index": csvreader.INT}
+    comments, columns = csvreader.read_csv(roistats_path, kinds)
+
+    np.testing.assert_equal(columns["ir_mean"].dtype, np.float64)
+    np.testing.assert_equal(columns["mask_index"].dtype, np.int64)
+    np.testing.assert_equal(len(columns["filename"]), len(columns["ir_mean"]))
+
+
+def test_read_csv_since(tmpdir, monkeypatch):
+    """
+    test reading only the rows at or after a datetime
+    """
+    roistats_path = os.path.join(
+        SAMPLE_DATA_DIR,
+        "alligatorriver",
+        "ROI",
+        "alligatorriver_DB_1000_IR_roistats.csv",
+    )
+    comments, columns = csvreader.read_csv(roistats_path, KINDS)
+    dts = csvreader.datetime_column(columns["date"], columns["local_std_time"])
+
+    # use small blocks so several blocks are read
+    monkeypatch.setattr(csvreader, "TAIL_BLOCK", 256)
+    for i in [0, 1, len(dts) // 2, len(dts) - 1]:
+        since = dts[i].item()
+        comments2, columns2 = csvreader.read_csv(roistats_path, KINDS, since=since)
+        np.testing.assert_equal(comments2, comments)
+        np.testing.assert_equal(columns2["filename"], columns["filename"][dts >= since])
+        np.testing.assert_equal(columns2["exposure"], columns["exposure"][dts >= since])
+
+    # nothing after the last row
+    since = datetime(2100, 1, 1)
+    comments2, columns2 = csvreader.read_csv(roistats_path, KINDS, since=since)
+    np.testing.assert_equal(len(columns2["filename"]), 0)
+
+    # summary files are selected by date
+    csv_path = str(tmpdir.join("test.csv"))
+    with open(csv_path, "w") as f:
+        f.write("# Site: test\ndate,year,doy\n")
+        f.write("2017-08-25,2017,237\n2017-08-26,2017,238\n")
+    comments, columns = csvreader.read_csv(csv_path, {}, since=date(2017, 8, 26))
+    np.testing.assert_equal(columns["doy"].tolist(), ["238"])
+
+
+def test_last_datetime(tmpdir, monkeypatch):
+    """
+    test finding the datetime of the last row
+    """
+    csv_path = str(tmpdir.join("test.csv"))
+    with open(csv_path, "w") as f:
+        f.write(CSV_TEXT)
+    np.testing.assert_equal(
+        csvreader.last_datetime(csv_path), datetime(2017, 8, 25, 12, 30, 8)
+    )
+
+    # last line longer than a block
+    monkeypatch.setattr(csvreader, "TAIL_BLOCK", 8)
+    np.testing.assert_equal(
+        csvreader.last_datetime(csv_path), datetime(2017, 8, 25, 12, 30, 8)
+    )
+
+    # no data rows
+    with open(csv_path, "w") as f:
+        f.write(CSV_TEXT.split("2017")[0])
+    assert csvreader.last_datetime(csv_path) is None
+
+
+def test_sidecar(tmpdir):
+    """
+    test that the sidecar gives the same columns as the CSV and is
+    only used while the CSV is unchanged
+    """
+    csv_path = str(tmpdir.join("test.csv"))
+    with open(csv_path, "w") as f:
+        f.write(CSV_TEXT)
+
+    # no sidecar yet
+    comments, columns = csvreader.read_csv(csv_path, KINDS, sidecar=True)
+    assert "datetime" not in columns
+
+    sidecar_path = csvreader.write_sidecar(csv_path, KINDS)
+    np.testing.assert_equal(sidecar_path, str(tmpdir.join("test.npz")))
+    comments2, columns2 = csvreader.read_csv(csv_path, KINDS, sidecar=True)
+    np.testing.assert_equal(comments2, comments)
+    for name, values in columns.items():
+        np.testing.assert_equal(columns2[name].dtype, values.dtype)
+        np.testing.assert_equal(columns2[name], values)
+    np.testing.assert_equal(
+        columns2["datetime"],
+        csvreader.datetime_column(columns["date"], columns["local_std_time"]),
+    )
+
+    # the sidecar isn't used after the CSV changes
+    with open(csv_path, "a") as f:
+        f.write("2017-08-25,13:00:08,test_2017_08_25_130008.jpg,40.0,44\n")
+    comments2, columns2 = csvreader.read_csv(csv_path, KINDS, sidecar=True)
+    np.testing.assert_equal(len(columns2["filename"]), 3)
+    assert "datetime" not in columns2
+
+    # or if the columns don't match the kinds
+    csvreader.write_sidecar(csv_path, {})
+    comments2, columns2 = csvreader.read_csv(csv_path, KINDS, sidecar=True)
+    assert "datetime" not in columns2
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+test_fingerprint
+----------------
+
+Tests for `vegindex.fingerprint` module.
+"""
+
+import os
+import time
+
+import numpy as np
+
+from vegindex import fingerprint
+
+
+def test_file_fingerprint(tmpdir, monkeypatch):
+    """
+    test that the hash is only computed when the file stat changes
+    """
+    path = str(tmpdir.join("test.csv"))
+    assert fingerprint.file_fingerprint(path) is None
+
+    with open(path, "w") as f:
+        f.write("a,b\n1,2\n")
+    old = time.time() - 100
+    os.utime(path, (old, old))
+
+    hashed = []
+
+    def file_hash(path):
+        hashed.append(path)
+        return "hash{0}".format(len(hashed))
+
+    monkeypatch.setattr(fingerprint, "file_hash", file_hash)
+    monkeypatch.setattr(fingerprint, "_fingerprints", {})
+    fp = fingerprint.file_fingerprint(path)
+    np.testing.assert_equal(fp[1:], [8, "hash1"])
+    np.testing.assert_equal(fingerprint.file_fingerprint(path), fp)
+    np.testing.assert_equal(len(hashed), 1)
+
+    # a rewritten file is hashed again (and recently modified files
+    # don't keep their mtime)
+    with open(path, "w") as f:
+        f.write("a,b\n1,2\n")
+    fp2 = fingerprint.file_fingerprint(path)
+    np.testing.assert_equal(fp2, [None, 8, "hash2"])
+    fingerprint.file_fingerprint(path)
+    np.testing.assert_equal(len(hashed), 3)
+
+
+def test_same_fingerprint():
+    """
+    test comparing file and directory fingerprints
+    """
+    assert fingerprint.same_fingerprint(None, None)
+    assert not fingerprint.same_fingerprint(None, [1, 8, "abc"])
+    assert fingerprint.same_fingerprint([1, 8, "abc"], [None, 8, "abc"])
+    assert not fingerprint.same_fingerprint([1, 8, "abc"], [1, 8, "abd"])
+    assert fingerprint.same_fingerprint([1], [1])
+    assert not fingerprint.same_fingerprint([None], [None])
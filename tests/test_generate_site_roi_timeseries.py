@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+test_generate_site_roi_timeseries
+---------------------------------
+
+Tests for `vegindex.generate_site_roi_timeseries` module.
+"""
+
+import glob
+import os
+
+import numpy as np
+
+from vegindex import config
+from vegindex import generate_site_roi_timeseries
+from vegindex.generate_roi_timeseries import read_roimask
+from vegindex.roitimeseries import ROITimeSeries
+
+SAMPLE_DATA_DIR = os.path.join(os.path.dirname(__file__), "sample_data")
+
+
+def test_create_site_rows(monkeypatch):
+    """
+    test that the rows for several ROIs from one decode of each
+    image are the same as the rows for each ROI
+    """
+    site_info_file = os.path.join(SAMPLE_DATA_DIR, "site_info.csv")
+    monkeypatch.setattr(config, "site_info_file", site_info_file)
+    monkeypatch.setattr(config, "offline", True)
+    monkeypatch.setattr(generate_site_roi_timeseries, "archive_dir", SAMPLE_DATA_DIR)
+
+    roinames = generate_site_roi_timeseries.find_roinames("test")
+    np.testing.assert_equal(roinames, ["DB_0001"])
+
+    mask_path = os.path.join(SAMPLE_DATA_DIR, "test", "ROI", "test_DB_0001_01.tif")
+    image_dir = os.path.join(SAMPLE_DATA_DIR, "test", "2009", "06")
+    imglist = sorted(glob.glob(os.path.join(image_dir, "*.jpg")))
+    roits_list = [
+        ROITimeSeries(site="test", ROIListID="DB_0001"),
+        ROITimeSeries(site="test", ROIListID="DB_0001", decodeScale=2),
+    ]
+    image_rois = [[(0, mask_path, 1), (1, mask_path, 1)]] * len(imglist)
+
+    results = generate_site_roi_timeseries.create_site_rows(
+        roits_list, imglist, image_rois
+    )
+    roimask = read_roimask(mask_path)
+    for roi_number, roits in enumerate(roits_list):
+        expected = roits.create_rows(imglist, roimask, 1)
+        np.testing.assert_equal([rows[roi_number] for rows in results], expected)
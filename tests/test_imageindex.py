@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+test_imageindex
+---------------
+
+Tests for `vegindex.imageindex` module.
+"""
+
+import os
+from datetime import datetime
+
+from vegindex import config
+from vegindex import imageindex
+from vegindex import utils
+
+SAMPLE_DATA_DIR = os.path.join(os.path.dirname(__file__), "sample_data")
+
+config.archive_dir = SAMPLE_DATA_DIR
+
+
+def test_getsiteimglist(tmpdir, monkeypatch):
+    """
+    test that the image index gives the same image lists as
+    utils.getsiteimglist()
+    """
+
+    monkeypatch.setattr(config, "image_index_dir", str(tmpdir))
+
+    start_dt = datetime(2009, 6, 30)
+    end_dt = datetime(2009, 7, 1)
+    for sitename, getIR in (("harvard", False), ("alligatorriver", True)):
+        imglist = imageindex.getsiteimglist(sitename, getIR=getIR)
+        assert imglist == utils.getsiteimglist(sitename, getIR=getIR)
+
+        imglist = imageindex.getsiteimglist(
+            sitename, startDT=start_dt, endDT=end_dt, getIR=getIR
+        )
+        assert imglist == utils.getsiteimglist(
+            sitename, startDT=start_dt, endDT=end_dt, getIR=getIR
+        )
+
+    imglist = imageindex.getsiteimglist("alligatorriver", getIR=True)
+    assert os.path.basename(imglist[0]) == "alligatorriver_IR_2013_06_01_120032.jpg"
+    assert os.path.exists(imageindex.get_index_path("harvard"))
+
+    # test missing dir
+    assert imageindex.getsiteimglist("acadia") == []
+
+
+def test_index_reused(tmpdir, monkeypatch):
+    """
+    test that unchanged directories aren't listed again when the
+    index is read back from the index file
+    """
+
+    monkeypatch.setattr(config, "image_index_dir", str(tmpdir))
+    monkeypatch.setattr(imageindex, "MTIME_SLOP", 0.0)
+
+    index = imageindex.ImageIndex("harvard")
+    index.refresh()
+    index.write()
+    imglist = index.query()
+
+    def _fail(*args):
+        raise AssertionError("directory listed again")
+
+    index2 = imageindex.ImageIndex("harvard")
+    monkeypatch.setattr(index2, "_list_month", _fail)
+    index2.refresh()
+    assert index2.query() == imglist
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+test_quantile
+-------------
+
+Tests for `vegindex.quantile` module.
+"""
+
+import numpy as np
+import pytest
+
+from vegindex.quantile import quantile
+from vegindex.quantile import quantiles
+
+X = [11.4, 17.3, 21.3, 25.9, 40.1, 50.5, 60.0, 70.0, 75]
+QS = [0.05, 0.35, 0.5, 0.75, 0.9]
+
+
+def test_quantiles_match_quantile():
+    """
+    test that quantiles() matches quantile() for all nine types
+    """
+    x = np.array(X)[::-1]
+    for qtype in range(1, 10):
+        expected = [quantile(X, q, qtype) for q in QS]
+        np.testing.assert_equal(quantiles(x, QS, qtype).tolist(), expected)
+        np.testing.assert_equal(quantiles(x, 0.35, qtype), expected[1])
+
+    # NaN values are sorted the way sorted() does unless skipped
+    x = [0.3, np.nan, 0.1, 0.2]
+    np.testing.assert_equal(quantiles(x, QS), [quantile(x, q) for q in QS])
+    np.testing.assert_equal(quantiles(x, 0.5, skipnan=True), 0.2)
+
+    with pytest.raises(ValueError):
+        quantiles(X, 0.5, qtype=10)
+
+
+def test_quantiles_batch():
+    """
+    test quantiles for each row of a NaN padded 2-d array
+    """
+    batch = np.full((3, len(X)), np.nan)
+    batch[0, :] = X
+    batch[1, :4] = X[:4]
+    batch[2, :1] = X[:1]
+
+    result = quantiles(batch, QS)
+    np.testing.assert_equal(result.shape, (3, len(QS)))
+    for i, n in enumerate([len(X), 4, 1]):
+        np.testing.assert_equal(result[i], [quantile(X[:n], q) for q in QS])
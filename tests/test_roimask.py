@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+test_roimask
+------------
+
+Tests for `vegindex.roimask` module.
+"""
+
+import os
+import shutil
+
+import numpy as np
+from PIL import Image
+
+from vegindex import config
+from vegindex import roimask
+from vegindex import roistats
+
+SAMPLE_DATA_DIR = os.path.join(os.path.dirname(__file__), "sample_data")
+MASK_PATH = os.path.join(SAMPLE_DATA_DIR, "test", "ROI", "test_DB_0001_01.tif")
+
+
+def test_decoded_mask():
+    """
+    test the structures derived from a mask
+    """
+    mask = np.ones((6, 8), dtype=np.bool_)
+    mask[1:3, 2:7] = False
+    decoded = roimask.DecodedMask(mask)
+
+    np.testing.assert_equal(decoded.roi_index(), roistats.get_roi_index(mask))
+    np.testing.assert_equal(decoded.npixels(), 10)
+    np.testing.assert_equal(decoded.bbox(), (1, 3, 2, 7))
+
+    # the ROI pixels of the image cropped to the bounding box
+    im_array = np.arange(6 * 8 * 3, dtype=np.uint8).reshape(6, 8, 3)
+    crop = decoded.crop_image(Image.fromarray(im_array))
+    np.testing.assert_equal(crop.shape, (2, 5, 3))
+    np.testing.assert_equal(
+        crop.reshape(-1, 3)[decoded.crop_index()],
+        im_array.reshape(-1, 3)[decoded.roi_index()],
+    )
+    np.testing.assert_equal(decoded.reduced(2).mask, roistats.reduce_mask(mask, 2))
+    assert decoded.reduced(2) is decoded.reduced(2)
+    assert not decoded.mask.flags.writeable
+
+    assert roimask.DecodedMask(np.ones((3, 3))).bbox() is None
+
+
+def test_read_mask(tmpdir, monkeypatch):
+    """
+    test that masks are cached and only decoded again when the file
+    changes
+    """
+    monkeypatch.setattr(roimask, "_mask_cache", roimask.OrderedDict())
+    monkeypatch.setattr(roimask, "MASK_CACHE_SIZE", 1)
+    monkeypatch.setattr(config, "write_sidecar", True)
+
+    mask_path = str(tmpdir.join("test_DB_0001_01.tif"))
+    shutil.copy(MASK_PATH, mask_path)
+
+    decoded = roimask.read_mask(mask_path)
+    assert roimask.read_mask(mask_path) is decoded
+    assert roimask.mask_info(decoded.mask) is decoded
+    assert roimask.mask_info(decoded.reduced(2).mask) is decoded.reduced(2)
+    assert os.path.exists(roimask.mask_sidecar_path(mask_path))
+
+    # the mask loaded from the sidecar is the same
+    roimask._mask_cache.clear()
+    decoded2 = roimask.read_mask(mask_path)
+    np.testing.assert_equal(decoded2.mask, decoded.mask)
+
+    # a changed mask file is decoded again even if it's older than
+    # the sidecar
+    Image.fromarray(~decoded.mask).save(mask_path)
+    os.utime(mask_path, ns=(0, 0))
+    decoded3 = roimask.read_mask(mask_path)
+    np.testing.assert_equal(decoded3.mask, ~decoded.mask)
+
+    # least recently used masks are evicted
+    monkeypatch.setattr(config, "write_sidecar", False)
+    roimask.read_mask(MASK_PATH)
+    np.testing.assert_equal(len(roimask._mask_cache), 1)
+    assert roimask.read_mask(mask_path) is not decoded2
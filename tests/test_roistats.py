@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+test_roistats
+-------------
+
+Tests for `vegindex.roistats` module.
+"""
+
+import os
+
+import numpy as np
+from PIL import Image
+
+from vegindex import roistats
+
+SAMPLE_DATA_DIR = os.path.join(os.path.dirname(__file__), "sample_data")
+
+
+def _masked_ref_stats(band, mask):
+    """
+    reference stats for a band using numpy masked arrays
+    """
+    vals = np.ma.array(band.astype(np.int16), mask=mask).compressed()
+    diff = np.float64(vals) - vals.mean()
+    return vals, diff
+
+
+def test_hist_percentiles():
+    """
+    test that histogram percentiles match np.percentile
+    """
+
+    rng = np.random.RandomState(42)
+    for n in (1, 2, 3, 7, 100, 1001):
+        vals = rng.randint(0, 256, size=n).astype(np.uint8)
+        hist = np.bincount(vals, minlength=roistats.NBINS)
+        np.testing.assert_array_equal(
+            roistats.hist_percentiles(hist),
+            np.percentile(vals.astype(np.int16), roistats.PERCENTILES),
+        )
+
+
+def test_rgb_roi_stats():
+    """
+    test ROI stats against a masked array calculation for a sample
+    image/mask pair
+    """
+
+    image_path = os.path.join(
+        SAMPLE_DATA_DIR, "harvard", "2009", "06", "harvard_2009_06_30_120138.jpg"
+    )
+    mask_path = os.path.join(
+        SAMPLE_DATA_DIR, "harvard", "ROI", "harvard_DB_0001_01.tif"
+    )
+
+    im_array = np.asarray(Image.open(image_path))
+    mask = np.asarray(Image.open(mask_path), dtype=np.bool_)
+
+    roi_index = roistats.get_roi_index(mask)
+    stats = roistats.rgb_roi_stats(im_array, roi_index)
+
+    diffs = []
+    for i in range(3):
+        vals, diff = _masked_ref_stats(im_array[:, :, i], mask)
+        diffs.append(diff)
+        assert stats[i]["mean"] == vals.mean()
+        np.testing.assert_allclose(
+            stats[i]["stdev"], np.sqrt(np.dot(diff, diff) / vals.size), rtol=1e-12
+        )
+        np.testing.assert_array_equal(
+            stats[i]["percentiles"], np.percentile(vals, roistats.PERCENTILES)
+        )
+
+    for k, (i, j) in enumerate(((0, 1), (1, 2), (2, 0))):
+        cov = np.dot(diffs[i], diffs[j]) / diffs[i].size
+        cor = cov / (stats[i]["stdev"] * stats[j]["stdev"])
+        np.testing.assert_allclose(stats[3 + k], cor, rtol=1e-12)
+
+
+def test_ir_roi_stats():
+    """
+    test IR ROI stats against a masked array calculation for a
+    sample IR image
+    """
+
+    image_path = os.path.join(
+        SAMPLE_DATA_DIR,
+        "alligatorriver",
+        "2013",
+        "06",
+        "alligatorriver_IR_2013_06_01_120032.jpg",
+    )
+
+    im_array = np.asarray(Image.open(image_path))
+    rng = np.random.RandomState(0)
+    mask = rng.rand(*im_array.shape[0:2]) < 0.5
+
+    stats = roistats.ir_roi_stats(im_array, roistats.get_roi_index(mask))
+
+    vals, diff = _masked_ref_stats(im_array[:, :, 0], mask)
+    assert stats["mean"] == vals.mean()
+    np.testing.assert_allclose(
+        stats["stdev"], np.sqrt(np.dot(diff, diff) / vals.size), rtol=1e-12
+    )
+    np.testing.assert_array_equal(
+        stats["percentiles"], np.percentile(vals, roistats.PERCENTILES)
+    )
+
+
+def test_reduce_mask():
+    """
+    test reducing an ROI mask for a reduced resolution decode
+    """
+
+    mask = np.ones((5, 7), dtype=np.bool_)
+    mask[0:4, 0:4] = False
+    mask[4, 6] = False
+
+    reduced = roistats.reduce_mask(mask, 2)
+
+    # size is rounded up and only whole ROI blocks are kept
+    expected = np.ones((3, 4), dtype=np.bool_)
+    expected[0:2, 0:2] = False
+    np.testing.assert_array_equal(reduced, expected)
+    np.testing.assert_array_equal(roistats.reduce_mask(mask, 1), mask)
+
+
+def test_image_brightness():
+    """
+    test the subsampled brightness against the full frame brightness
+    """
+    img_path = os.path.join(
+        SAMPLE_DATA_DIR, "test", "2009", "06", "test_2009_06_30_120138.jpg"
+    )
+    im = Image.open(img_path)
+    inner = np.asarray(im)[30:-30, 30:-30]
+    brt = inner.sum(dtype=np.int64) / (inner.shape[0] * inner.shape[1])
+
+    np.testing.assert_allclose(roistats.image_brightness(im), brt, rtol=0.02)
+    np.testing.assert_equal(roistats.image_brightness(im, step=1), brt)
+
+    # no pixels inside the border
+    assert np.isnan(roistats.image_brightness(im.crop((0, 0, 50, 50))))
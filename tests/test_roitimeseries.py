@@ -7,22 +7,50 @@ Tests for `vegindex.roitimeseries` module.
 """
 
 import os
+from datetime import datetime
 from platform import python_version
 
 import numpy as np
+import pytest
 from PIL import Image
 from pkg_resources import Requirement
 from pkg_resources import resource_filename
 
 from vegindex import config
+from vegindex import csvreader
 from vegindex import roitimeseries
 
 SAMPLE_DATA_DIR = os.path.join(os.path.dirname(__file__), "sample_data")
 
 config.archive_dir = SAMPLE_DATA_DIR
 
+ND_INT = config.ND_INT
+
 PYTHON_VERSION, PYTHON_MINOR, PYTHON_POINT = python_version().split('.') 
 
+
+def _make_row(hour, minute=0):
+    """
+    return an ROI timeseries row with all the stats set to 10.25 for
+    an image taken on 2017-08-25 at hour:minute:08
+    """
+    row = dict((name, 10.25) for name, kind in roitimeseries.ROITS_COLUMNS)
+    row["datetime"] = datetime(2017, 8, 25, hour, minute, 8)
+    row["filename"] = "test_2017_08_25_{0:02d}{1:02d}08.jpg".format(hour, minute)
+    row["mask_index"] = 1
+    return row
+
+
+def _make_roits(hours):
+    """
+    return an ROI timeseries with a row (see _make_row()) for each hour
+    """
+    roits = roitimeseries.ROITimeSeries(ROIListID="DB_0001")
+    for hour in hours:
+        roits.rows.append(_make_row(hour))
+    return roits
+
+
 def test_roits_dnmeans():
     """
     test calculating DN means from image/mask pair
@@ -129,3 +157,277 @@ def test_reading_roits_file():
     last_row = roits.rows[-1]
 
     np.testing.assert_equal(last_row["filename"], "harvard_2009_12_31_213139.jpg")
+
+
+def test_roits_decode_scale(tmpdir):
+    """
+    test that the decode scale is written to and read from the CSV
+    header
+    """
+
+    roits = roitimeseries.ROITimeSeries(ROIListID="DB_0001", decodeScale=4)
+    roistats_path = str(tmpdir.join("test_DB_0001_roistats.csv"))
+    roits.writeCSV(roistats_path)
+
+    roits2 = roitimeseries.ROITimeSeries(ROIListID="DB_0001")
+    roits2.readCSV(roistats_path)
+    np.testing.assert_equal(roits2.decodeScale, 4)
+
+    with pytest.raises(ValueError):
+        roitimeseries.ROITimeSeries(ROIListID="DB_0001", decodeScale=3)
+
+
+def test_roits_columns(tmpdir):
+    """
+    test that rows are stored as columns and survive a CSV round trip
+    """
+
+    roits = roitimeseries.ROITimeSeries(ROIListID="DB_0001")
+    row = dict((name, 10.0) for name, kind in roitimeseries.ROITS_COLUMNS)
+    row["datetime"] = datetime(2017, 8, 25, 12, 0, 8)
+    row["filename"] = "test_2017_08_25_120008.jpg"
+    row["exposure"] = 44
+    row["awbflag"] = ND_INT
+    row["mask_index"] = 1
+    roits.rows.append(row)
+
+    roistats_path = str(tmpdir.join("test_DB_0001_roistats.csv"))
+    roits.writeCSV(roistats_path)
+
+    roits2 = roitimeseries.ROITimeSeries(ROIListID="DB_0001")
+    roits2.readCSV(roistats_path)
+    np.testing.assert_equal(roits2.get_column("exposure").tolist(), [44])
+    np.testing.assert_equal(roits2.get_column("awbflag").tolist(), [-9999])
+    np.testing.assert_equal(
+        roits2.get_column("datetime")[0], np.datetime64("2017-08-25T12:00:08")
+    )
+
+    last_row = roits2.rows[-1]
+    np.testing.assert_equal(last_row["date"], "2017-08-25")
+    np.testing.assert_equal(last_row["doy"], "237")
+    np.testing.assert_equal(last_row["awbflag"], ND_INT)
+    np.testing.assert_equal(last_row["gcc"], 10.0)
+
+
+def test_format_csv_rows():
+    """
+    test that block formatted CSV rows match format_csvrow()
+    """
+
+    roits = roitimeseries.ROITimeSeries(ROIListID="DB_0001")
+    row = _make_row(12)
+    row["exposure"] = 44
+    row["awbflag"] = ND_INT
+    roits.rows.append(row)
+
+    # row with no-data stats
+    row = dict(row)
+    for name in ["gcc", "r_mean", "g_5_qtl", "g_b_correl"]:
+        row[name] = config.ND_FLOAT
+    roits.rows.append(row)
+
+    csv_rows = roitimeseries.format_csv_rows(roits.data, 0, 2)
+    expected = "".join(roits.format_csvrow(row) + "\n" for row in roits.rows)
+    np.testing.assert_equal(csv_rows, expected)
+
+
+def test_format_flat_band(tmpdir):
+    """
+    test that the NaN correlations of a band with no variation are
+    written as nan (not no-data) and read back the same
+    """
+
+    im_array = np.zeros((10, 10, 3), dtype=np.uint8)
+    im_array[:, :, 0] = np.arange(100, dtype=np.uint8).reshape(10, 10)
+    im_array[:, :, 1] = 50
+    im_array[:, :, 2] = np.arange(100, dtype=np.uint8).reshape(10, 10)[::-1]
+    roimask = np.zeros((10, 10), dtype=np.bool_)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        stats = roitimeseries.get_roi_stats(Image.fromarray(im_array), roimask)
+    assert np.isnan(stats[3])
+
+    roits = roitimeseries.ROITimeSeries(ROIListID="DB_0001")
+    row = _make_row(12)
+    row["r_g_correl"] = stats[3]
+    roits.rows.append(row)
+
+    csv_row = roitimeseries.format_csv_rows(roits.data, 0, 1)
+    np.testing.assert_equal(csv_row, roits.format_csvrow(roits.rows[0]) + "\n")
+    assert csv_row.endswith(",nan,10.25000,10.25000\n")
+
+    roistats_path = str(tmpdir.join("test_DB_0001_roistats.csv"))
+    roits.writeCSV(roistats_path)
+    roits2 = roitimeseries.ROITimeSeries(ROIListID="DB_0001")
+    roits2.readCSV(roistats_path)
+    np.testing.assert_equal(roitimeseries.format_csv_rows(roits2.data, 0, 1), csv_row)
+
+
+def test_roits_append_csv(tmpdir):
+    """
+    test that appending rows to a CSV file gives the same rows as
+    rewriting it
+    """
+
+    roits = _make_roits([12])
+    roistats_path = str(tmpdir.join("test_DB_0001_roistats.csv"))
+    roits.writeCSV(roistats_path)
+
+    roits.rows.append(_make_row(12, 30))
+    np.testing.assert_equal(roits.appendCSV(roistats_path, 1), 2)
+
+    expected_path = str(tmpdir.join("expected.csv"))
+    roits.writeCSV(expected_path)
+    with open(roistats_path) as f1, open(expected_path) as f2:
+        lines = [line for line in f1 if not line.startswith("# Update")]
+        expected = [line for line in f2 if not line.startswith("# Update")]
+    np.testing.assert_equal(lines, expected)
+
+    # rows out of order can't be appended
+    roits.rows.append(_make_row(11, 30))
+    assert roits.appendCSV(roistats_path, 2) is None
+
+
+def test_roits_find_row(tmpdir):
+    """
+    test finding rows by filename and datetime range after reading
+    a CSV file
+    """
+
+    roits = _make_roits([12, 13])
+    roistats_path = str(tmpdir.join("test_DB_0001_roistats.csv"))
+    roits.writeCSV(roistats_path)
+    roits2 = roitimeseries.ROITimeSeries(ROIListID="DB_0001")
+    roits2.readCSV(roistats_path)
+
+    np.testing.assert_equal(roits2.find_row("test_2017_08_25_120008.jpg"), 0)
+    np.testing.assert_equal(roits2.find_row("test_2017_08_25_130008.jpg"), 1)
+    assert roits2.find_row("test_2017_08_25_140008.jpg") is None
+
+    idx = roits2.get_row_indices(
+        datetime(2017, 8, 25, 12, 30, 0), datetime(2017, 8, 25, 14, 0, 0)
+    )
+    np.testing.assert_equal(idx.tolist(), [1])
+
+
+def test_roits_select_rows():
+    """
+    test that select_rows returns the selected rows in datetime order
+    """
+
+    roits = roitimeseries.ROITimeSeries(ROIListID="DB_0001")
+    row = dict((name, 100.0) for name, kind in roitimeseries.ROITS_COLUMNS)
+    row["mask_index"] = 1
+    row["solar_elev"] = 30.0
+    for hour in [13, 5, 12]:
+        row = dict(row)
+        row["datetime"] = datetime(2017, 8, 25, hour, 0, 8)
+        row["filename"] = "test_2017_08_25_{0:02d}0008.jpg".format(hour)
+        roits.rows.append(row)
+    row = dict(row)
+    row["datetime"] = datetime(2017, 8, 25, 14, 0, 8)
+    row["r_mean"] = config.ND_FLOAT
+    roits.rows.append(row)
+
+    rows = roits.select_rows(tod_min="10:00:00")
+    np.testing.assert_equal(
+        [row["datetime"].hour for row in rows],
+        [12, 13],
+    )
+    np.testing.assert_equal(roits.selection_counts["tod"], 3)
+    np.testing.assert_equal(roits.selection_counts["brightness"], 3)
+    np.testing.assert_equal(roits.selection_counts["selected"], 2)
+
+
+def test_roits_read_since(tmpdir):
+    """
+    test extending a timeseries read from the end of a CSV file
+    """
+
+    roits = _make_roits([11, 12, 13])
+    roistats_path = str(tmpdir.join("test_DB_0001_roistats.csv"))
+    roits.writeCSV(roistats_path)
+    expected_path = str(tmpdir.join("expected.csv"))
+    row = _make_row(14)
+    roits.rows.append(row)
+    roits.writeCSV(expected_path)
+
+    # read the last row and append a new one
+    roits2 = roitimeseries.ROITimeSeries(ROIListID="DB_0001")
+    since = csvreader.last_datetime(roistats_path)
+    np.testing.assert_equal(since, datetime(2017, 8, 25, 13, 0, 8))
+    roits2.readCSV(roistats_path, since=since)
+    np.testing.assert_equal(len(roits2.rows), 1)
+    roits2.rows.append(row)
+    np.testing.assert_equal(roits2.appendCSV(roistats_path, 1), 4)
+
+    # a partial timeseries can't be written until the earlier rows
+    # are read
+    with pytest.raises(ValueError):
+        roits2.writeCSV(str(tmpdir.join("partial.csv")))
+    roits2.read_earlier_rows(roistats_path)
+    np.testing.assert_equal(len(roits2.rows), 4)
+    roits2.writeCSV(roistats_path)
+
+    with open(roistats_path) as f1, open(expected_path) as f2:
+        lines = [line for line in f1 if not line.startswith("# Update")]
+        expected = [line for line in f2 if not line.startswith("# Update")]
+    np.testing.assert_equal(lines, expected)
+
+
+def test_roits_sidecar(tmpdir, monkeypatch):
+    """
+    test writing and reading a timeseries with a binary sidecar
+    """
+
+    roits = _make_roits([12, 13])
+    roistats_path = str(tmpdir.join("test_DB_0001_roistats.csv"))
+    roits.writeCSV(roistats_path, sidecar=True)
+    assert os.path.exists(str(tmpdir.join("test_DB_0001_roistats.npz")))
+
+    roits2 = roitimeseries.ROITimeSeries(ROIListID="DB_0001")
+    roits2.readCSV(roistats_path, sidecar=True)
+    roits3 = roitimeseries.ROITimeSeries(ROIListID="DB_0001")
+    roits3.readCSV(roistats_path)
+    for name, kind in roitimeseries.ROITS_COLUMNS:
+        np.testing.assert_equal(roits2.get_column(name), roits3.get_column(name))
+
+    # appending extends the sidecar without parsing the whole file
+    roits2.rows.append(_make_row(14))
+    with monkeypatch.context() as m:
+        m.setattr(csvreader, "write_sidecar", None)
+        roits2.appendCSV(roistats_path, 2, sidecar=True)
+    kinds = dict(roitimeseries.ROITS_COLUMNS)
+    comments, columns = csvreader.read_csv(roistats_path, kinds, sidecar=True)
+    np.testing.assert_equal(len(columns["datetime"]), 3)
+    comments2, columns2 = csvreader.read_csv(roistats_path, kinds)
+    np.testing.assert_equal(comments, comments2)
+    for name in columns2:
+        np.testing.assert_equal(columns[name], columns2[name])
+
+
+def test_roits_mmap(tmpdir):
+    """
+    test reading a timeseries with memory mapped columns
+    """
+
+    roits = _make_roits([12, 13])
+    roistats_path = str(tmpdir.join("test_DB_0001_roistats.csv"))
+    roits.writeCSV(roistats_path)
+
+    # the sidecar is written when it's first needed
+    roits2 = roitimeseries.ROITimeSeries(ROIListID="DB_0001")
+    roits2.readCSV(roistats_path, mmap=True)
+    assert os.path.exists(str(tmpdir.join("test_DB_0001_roistats.npz")))
+    roits3 = roitimeseries.ROITimeSeries(ROIListID="DB_0001")
+    roits3.readCSV(roistats_path, mmap=True)
+    assert not roits3.get_column("gcc").flags.writeable
+    roits.readCSV(roistats_path)
+    for name, kind in roitimeseries.ROITS_COLUMNS:
+        np.testing.assert_equal(roits3.get_column(name), roits.get_column(name))
+
+    # changing a row copies the columns rather than changing the file
+    row = roits3.rows[0]
+    row["gcc"] = 0.5
+    roits3.rows[0] = row
+    np.testing.assert_equal(roits3.rows[0]["gcc"], 0.5)
+    np.testing.assert_equal(roits2.rows[0]["gcc"], 10.25)
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+test_siteinfo
+-------------
+
+Tests for `vegindex.siteinfo` module.
+"""
+
+import json
+import os
+
+import pytest
+
+from vegindex import config
+from vegindex import siteinfo
+
+SITE_INFO_FILE = os.path.join(os.path.dirname(__file__), "sample_data", "site_info.csv")
+
+
+class FakeResponse(object):
+    def __init__(self, info):
+        self.info = info
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.info
+
+
+@pytest.fixture
+def siteconfig(tmpdir, monkeypatch):
+    """
+    use the sample site info file and a temporary cache directory
+    """
+    monkeypatch.setattr(config, "site_info_file", SITE_INFO_FILE)
+    monkeypatch.setattr(config, "site_info_cache_dir", str(tmpdir))
+    monkeypatch.setattr(config, "offline", False)
+    siteinfo.clear_cache()
+    yield tmpdir
+    siteinfo.clear_cache()
+
+
+def test_local_site_info(siteconfig, monkeypatch):
+    """
+    test that the local file is only read once and is used before
+    the network
+    """
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("unexpected call")
+
+    si = siteinfo.get_site_info("test")
+    assert si["lon"] == -60
+
+    monkeypatch.setattr(siteinfo.pd, "read_csv", _fail)
+    monkeypatch.setattr(siteinfo.requests, "get", _fail)
+    si = siteinfo.get_site_info("test")
+    assert si["tzoffset"] == 1
+
+
+def test_remote_site_info(siteconfig, monkeypatch):
+    """
+    test remote site info is requested with a timeout and cached
+    on disk
+    """
+    calls = []
+
+    def _get(url, timeout=None):
+        calls.append(timeout)
+        return FakeResponse({"sitename": "harvard", "lon": -72.1715})
+
+    monkeypatch.setattr(siteinfo.requests, "get", _get)
+    si = siteinfo.get_site_info("harvard")
+    assert si["lon"] == -72.1715
+    assert calls == [config.SITE_INFO_TIMEOUT]
+
+    # cached in memory and on disk
+    siteinfo.get_site_info("harvard")
+    siteinfo.clear_cache()
+    si = siteinfo.get_site_info("harvard")
+    assert si["lon"] == -72.1715
+    assert len(calls) == 1
+
+    # out of date disk cache is refreshed
+    monkeypatch.setattr(config, "SITE_INFO_TTL", -1)
+    siteinfo.clear_cache()
+    siteinfo.get_site_info("harvard")
+    assert len(calls) == 2
+
+
+def test_offline_site_info(siteconfig, monkeypatch):
+    """
+    test that no requests are made in offline mode
+    """
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("unexpected call")
+
+    monkeypatch.setattr(config, "offline", True)
+    monkeypatch.setattr(siteinfo.requests, "get", _fail)
+
+    assert siteinfo.get_site_info("acadia") is None
+
+    # but an old cached copy can be used
+    cache_path = os.path.join(str(siteconfig), "acadia_info.json")
+    with open(cache_path, "w") as f:
+        json.dump({"sitename": "acadia", "lon": -68.2608}, f)
+    monkeypatch.setattr(config, "SITE_INFO_TTL", -1)
+    siteinfo.clear_cache()
+    assert siteinfo.get_site_info("acadia")["lon"] == -68.2608
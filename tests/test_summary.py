@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+test_summary
+------------
+
+Tests for `vegindex.summary` module.
+"""
+
+from datetime import date
+
+import numpy as np
+
+from vegindex import summary
+from vegindex.quantile import quantile
+
+
+def test_group_stats():
+    """
+    test that grouped stats match the per group calculations
+    """
+    rng = np.random.default_rng(42)
+    sizes = rng.integers(1, 40, size=50)
+    first = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    values = rng.random(np.sum(sizes)) * 0.5
+    values[[3, 17]] = np.nan
+
+    means = summary.group_nanmean(values, first, sizes)
+    stds = summary.group_nanstd(values, first, sizes)
+    qvals = summary.group_quantiles(values, first, sizes, [0.5, 0.9])
+    for k in range(len(sizes)):
+        group = values[first[k] : first[k] + sizes[k]]
+        np.testing.assert_equal(means[k], np.nanmean(group))
+        np.testing.assert_equal(stds[k], np.nanstd(group))
+        np.testing.assert_equal(qvals[k, 0], quantile(group.tolist(), 0.5))
+        np.testing.assert_equal(qvals[k, 1], quantile(group.tolist(), 0.9))
+
+
+def test_assign_periods():
+    """
+    test assigning days to 3-day periods across a year boundary
+    """
+    days = np.array(
+        ["2017-12-29", "2017-12-31", "2018-01-01", "2018-01-02"],
+        dtype="datetime64[D]",
+    )
+    starts = np.array(["2017-12-27", "2017-12-30", "2018-01-01"], dtype="datetime64[D]")
+
+    # the last period of 2017 runs into 2018
+    period = summary.assign_periods(days, starts, 3)
+    np.testing.assert_equal(period.tolist(), [0, 1, 1, 2])
+
+    # days before a period starts aren't assigned
+    period = summary.assign_periods(days, starts[1:], 3)
+    np.testing.assert_equal(period.tolist(), [-1, -1, -1, -1])
+
+
+def test_period_start():
+    """
+    test finding the first period including a date
+    """
+    np.testing.assert_equal(summary.period_start(date(2017, 6, 4), 3), date(2017, 6, 3))
+    np.testing.assert_equal(summary.period_start(date(2017, 6, 3), 1), date(2017, 6, 3))
+
+    # Jan 1 is in the last 3-day period of 2017
+    np.testing.assert_equal(
+        summary.period_start(date(2018, 1, 1), 3), date(2017, 12, 30)
+    )
+
+
+def test_gcc_summary_rows():
+    """
+    test summary rows for two 1-day periods
+    """
+    columns = {
+        "datetime": np.array(
+            ["2017-06-01T11:00:00", "2017-06-01T12:30:00", "2017-06-03T12:00:00"],
+            dtype="datetime64[s]",
+        ),
+        "filename": np.array(["a.jpg", "b.jpg", "c.jpg"], dtype=object),
+        "r_mean": np.array([100.0, 110.0, 100.0]),
+        "g_mean": np.array([120.0, 130.0, 120.0]),
+        "b_mean": np.array([80.0, 60.0, 80.0]),
+        "gcc": np.array([0.4, 0.433333, 0.4]),
+        "solar_elev": np.array([50.0, 60.0, 55.0]),
+        "awbflag": np.array([0, 0, 1]),
+    }
+
+    rows = summary.gcc_summary_rows(columns, 1, 1)
+    np.testing.assert_equal(len(rows), 3)
+    np.testing.assert_equal(rows[0]["date"], date(2017, 6, 1))
+    np.testing.assert_equal(rows[0]["image_count"], 2)
+    np.testing.assert_equal(rows[0]["midday_filename"], "b.jpg")
+    np.testing.assert_equal(rows[0]["max_solar_elev"], 60.0)
+    np.testing.assert_equal(rows[0]["r_mean"], 105.0)
+    np.testing.assert_equal(rows[0]["gcc_50"], quantile([0.4, 0.433333], 0.5))
+
+    # no images on 6/2 and the 6/3 image has awbflag set
+    for row in rows[1:]:
+        np.testing.assert_equal(row["image_count"], 0)
+        np.testing.assert_equal(row["gcc_90"], summary.ND_FLOAT)
@@ -63,6 +63,23 @@ def test_getsiteimglist():
     assert len(imglist) == 0
 
 
+def test_iter_site_images():
+    """
+    test iterating over images for a site
+    """
+
+    sitename = "harvard"
+    imgiter = utils.iter_site_images(sitename)
+    assert not isinstance(imgiter, list)
+
+    imglist = list(imgiter)
+    assert imglist == utils.getsiteimglist(sitename)
+    assert imglist == sorted(imglist)
+
+    # test missing dir
+    assert list(utils.iter_site_images("acadia")) == []
+
+
 def test_get_siteinfo():
     """
     test getting site info from URL
@@ -110,3 +127,23 @@ def test_sunelev():
 
     elev = utils.sunelev(lat, lon, dt, offset)
     np.testing.assert_approx_equal(elev, sunelev, 3)
+
+
+def test_sunelev_array():
+
+    lon = -72.1715
+    lat = 42.5378
+    offset = -5
+    dts = [datetime(2009, 1, 1, 5, 31, 34)]
+    dts += [datetime(2015, 6, 21, hour, 15, 0) for hour in range(4, 21)]
+
+    elevs = utils.sunelev_array(lat, lon, dts, offset)
+    np.testing.assert_approx_equal(elevs[0], -18.98094, 3)
+
+    expected = [utils.sunelev(lat, lon, dt, offset) for dt in dts]
+    np.testing.assert_allclose(elevs, expected, rtol=0, atol=0.01)
+
+    # southern hemisphere, half hour offset
+    elevs = utils.sunelev_array(-34.5, 138.6, dts, 9.5)
+    expected = [utils.sunelev(-34.5, 138.6, dt, 9.5) for dt in dts]
+    np.testing.assert_allclose(elevs, expected, rtol=0, atol=0.01)